@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Admission control for requests that have to go to the upstream API.
+
+Only cache misses pass through here: cached responses and health probes
+never touch the upstream API and are always admitted. A request bound for
+upstream is shed with a fast 503 when
+
+- it already waited longer than ADMISSION_MAX_QUEUE_TIME before reaching
+  the worker (measured from the ``X-Request-Start`` header set by the
+  ingress), or
+- the worker already has its limit of upstream-bound requests in flight
+  and no slot frees up within ADMISSION_MAX_WAIT.
+
+The in-flight limit is sized from the gunicorn worker in ``post_fork``
+unless ADMISSION_MAX_INFLIGHT is set: a gthread worker admits one request
+fewer than it has threads, so a thread is always left for cache hits and
+/health. A sync worker serves one request at a time, so it gets no
+in-flight limit and relies on the queue time alone. Requests still waiting
+in the listen backlog are not seen by either check.
+
+Configuration (environment variables, 0 disables a limit):
+    ADMISSION_MAX_INFLIGHT: Concurrent upstream-bound requests per worker (default: auto)
+    ADMISSION_MAX_WAIT: Seconds to wait for a free slot (default: 0.5)
+    ADMISSION_MAX_QUEUE_TIME: Seconds a request may have queued before the worker (default: 10)
+    ADMISSION_RETRY_AFTER: Retry-After sent with shed requests, in seconds (default: 5)
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from flask import g, has_request_context, request
+
+import prometheus_metrics
+import worker_tuning
+
+ADMISSION_MAX_INFLIGHT = os.environ.get('ADMISSION_MAX_INFLIGHT', 'auto').lower()
+ADMISSION_MAX_WAIT = float(os.environ.get('ADMISSION_MAX_WAIT', '0.5'))
+ADMISSION_MAX_QUEUE_TIME = float(os.environ.get('ADMISSION_MAX_QUEUE_TIME', '10'))
+ADMISSION_RETRY_AFTER = int(os.environ.get('ADMISSION_RETRY_AFTER', '5'))
+
+# In-flight limit outside gunicorn and for async workers
+DEFAULT_MAX_INFLIGHT = 4
+
+
+class Overloaded(Exception):
+    """Raised when an upstream-bound request is shed."""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"Request shed: {reason}")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def queue_time(header: Optional[str], now: Optional[float] = None) -> Optional[float]:
+    """
+    Seconds since the front proxy received the request.
+
+    Accepts the common ``X-Request-Start`` formats: ``t=<seconds>`` (nginx
+    ``$msec``), or a bare timestamp in seconds, milliseconds or microseconds.
+
+    Args:
+        header (str): The X-Request-Start header value
+        now (float): Current Unix time (defaults to time.time())
+
+    Returns:
+        float: Queue time in seconds, or None if the header is missing or invalid
+    """
+    if not header:
+        return None
+    value = header[2:] if header.startswith('t=') else header
+    try:
+        started = float(value)
+    except ValueError:
+        return None
+    # Normalise micro-/milliseconds to seconds
+    while started > 1e11:
+        started /= 1000
+    return max(0.0, (now or time.time()) - started)
+
+
+def inflight_limit(worker_class: Optional[str] = None, threads: int = 1) -> int:
+    """
+    Concurrent upstream-bound requests to admit in a worker.
+
+    Args:
+        worker_class (str): The gunicorn worker class, or None outside gunicorn
+        threads (int): Threads per worker
+
+    Returns:
+        int: The limit (0 = unlimited)
+    """
+    if ADMISSION_MAX_INFLIGHT != 'auto':
+        return int(ADMISSION_MAX_INFLIGHT)
+    request_threads = worker_tuning.request_threads(worker_class, threads)
+    if request_threads is None:
+        return DEFAULT_MAX_INFLIGHT
+    # One thread stays free for cache hits; a sync worker has no spare one
+    return request_threads - 1
+
+
+class AdmissionController:
+    """
+    Per-worker limit on in-flight upstream-bound requests.
+
+    Args:
+        max_inflight (int): Concurrent upstream-bound requests (0 = unlimited)
+        max_wait (float): Seconds to wait for a free slot
+        max_queue_time (float): Seconds a request may have queued upstream of the worker (0 = unlimited)
+        retry_after (int): Retry-After for shed requests, in seconds
+    """
+
+    def __init__(self, max_inflight: int, max_wait: float, max_queue_time: float, retry_after: int):
+        self.max_inflight = max_inflight
+        self.max_wait = max_wait
+        self.max_queue_time = max_queue_time
+        self.retry_after = retry_after
+        self.inflight = 0
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_inflight) if max_inflight > 0 else None
+
+    def resize(self, max_inflight: int) -> None:
+        """Change the in-flight limit; only while no request is in flight (e.g. in post_fork)"""
+        self.max_inflight = max_inflight
+        self._slots = threading.BoundedSemaphore(max_inflight) if max_inflight > 0 else None
+
+    def _shed(self, reason: str) -> None:
+        prometheus_metrics.LOAD_SHED_COUNT.labels(reason=reason).inc()
+        raise Overloaded(reason, self.retry_after)
+
+    @contextmanager
+    def upstream_slot(self) -> Iterator[None]:
+        """Hold an upstream slot for the duration of the block, or raise Overloaded"""
+        if self.max_queue_time > 0 and has_request_context():
+            waited = queue_time(request.headers.get('X-Request-Start'))
+            if waited is not None and waited > self.max_queue_time:
+                self._shed('queue_time')
+
+        if self._slots is not None and not self._slots.acquire(timeout=self.max_wait):
+            self._shed('concurrency')
+
+        with self._lock:
+            self.inflight += 1
+            prometheus_metrics.UPSTREAM_INFLIGHT.set(self.inflight)
+        if has_request_context():
+            # Lets the rate limiter charge the request for the upstream work
+            g.upstream_bound = True
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.inflight -= 1
+                prometheus_metrics.UPSTREAM_INFLIGHT.set(self.inflight)
+            if self._slots is not None:
+                self._slots.release()
+
+
+controller = AdmissionController(inflight_limit(), ADMISSION_MAX_WAIT,
+                                 ADMISSION_MAX_QUEUE_TIME, ADMISSION_RETRY_AFTER)
@@ -0,0 +1,95 @@
+"""
+Microbenchmarks for the request hot paths, using pytest-benchmark.
+
+Not collected by the regular test run; invoke explicitly and compare the
+result with the committed baseline:
+
+    pytest benchmarks/bench_hot_paths.py --benchmark-json=bench.json
+    python benchmarks/compare_baseline.py bench.json --threshold 20
+"""
+
+import logging
+from unittest.mock import patch
+
+import pytest
+
+import rick_morty_api
+from benchmarks.fake_upstream import make_character
+from rick_morty_api import (app, character_cache, character_detail_cache, fetch_character_by_id,
+                            fetch_characters, rate_limit, requests_limit)
+
+pytest.importorskip('pytest_benchmark')
+
+CHARACTER_COUNT = 826  # size of the real upstream dataset
+
+
+class FakeResponse:
+    """Minimal stand-in for requests.Response, cheaper than a MagicMock"""
+
+    def __init__(self, payload):
+        self.payload = payload
+        self.status_code = 200
+        self.headers = {}
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.payload
+
+
+@pytest.fixture(autouse=True)
+def quiet_logging():
+    """Keep log I/O out of the measurements"""
+    logging.disable(logging.INFO)
+    yield
+    logging.disable(logging.NOTSET)
+
+
+@pytest.fixture(scope='module')
+def upstream_page():
+    base_url = 'https://rickandmortyapi.com'
+    return {
+        'info': {'next': None},
+        'results': [make_character(i, base_url) for i in range(1, CHARACTER_COUNT + 1)],
+    }
+
+
+def test_rate_limit_overhead(benchmark):
+    """Cost of the rate_limit decorator around a no-op view"""
+    view = rate_limit(limit=10 ** 12, per=60)(lambda: None)
+    requests_limit.clear()
+    with app.test_request_context('/characters'):
+        benchmark(view)
+
+
+@pytest.mark.parametrize('filtered', [True, False], ids=['filtered', 'unfiltered'])
+def test_character_projection(benchmark, upstream_page, filtered):
+    """Filtering and per-character projection of a full crawl (upstream call stubbed)"""
+    def reset_cache():
+        character_cache["data"] = None
+        character_cache["timestamp"] = 0
+        character_detail_cache.clear()
+
+    with patch('rick_morty_api.requests.get', return_value=FakeResponse(upstream_page)):
+        benchmark.pedantic(fetch_characters, kwargs={'filtered': filtered},
+                           setup=reset_cache, rounds=200, warmup_rounds=5)
+
+
+def test_character_detail_cache_hit(benchmark, upstream_page):
+    """fetch_character_by_id served from a warm detail cache"""
+    character_detail_cache.clear()
+    with patch('rick_morty_api.requests.get', return_value=FakeResponse(upstream_page['results'][0])):
+        fetch_character_by_id(1)
+    benchmark(fetch_character_by_id, 1)
+
+
+def test_jsonify_full_list(benchmark, upstream_page):
+    """Serialization of the full /characters?filtered=false payload"""
+    character_cache["data"] = None
+    with patch('rick_morty_api.requests.get', return_value=FakeResponse(upstream_page)):
+        characters = fetch_characters(filtered=False)
+    payload = {'count': len(characters), 'characters': characters}
+
+    with app.app_context():
+        benchmark(rick_morty_api.jsonify, payload)
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark for the per-request cost of the Prometheus instrumentation.
+
+Runs the same trivial route through two Flask apps, one bare and one with
+``init_metrics_endpoint`` applied, and reports the difference in mean
+latency per request.
+
+Usage:
+    python benchmarks/bench_metrics_overhead.py [--requests N] [--repeat R]
+"""
+
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from flask import Flask, jsonify  # noqa: E402
+
+import prometheus_metrics  # noqa: E402
+
+
+def build_app(instrumented):
+    """Create a minimal app with a single /health route"""
+    app = Flask(f"bench_{'instrumented' if instrumented else 'bare'}")
+
+    @app.route('/health')
+    def health():
+        return jsonify({'status': 'healthy'})
+
+    if instrumented:
+        prometheus_metrics.init_metrics_endpoint(app)
+    return app
+
+
+def time_per_request(app, requests, repeat):
+    """Best-of-``repeat`` mean latency in microseconds for GET /health"""
+    client = app.test_client()
+    client.get('/health')  # warm up routing and the metric label cache
+    runs = timeit.repeat(lambda: client.get('/health'), number=requests, repeat=repeat)
+    return min(runs) / requests * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    bare = time_per_request(build_app(False), args.requests, args.repeat)
+    instrumented = time_per_request(build_app(True), args.requests, args.repeat)
+
+    print(f"bare:          {bare:8.2f} us/request")
+    print(f"instrumented:  {instrumented:8.2f} us/request")
+    print(f"overhead:      {instrumented - bare:8.2f} us/request "
+          f"({(instrumented - bare) / bare * 100:.1f}%)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Per-worker memory with and without gunicorn's preload mode.
+
+Runs the app under gunicorn against a local fake upstream twice: once as
+before, where every worker imports the app and crawls the character data
+itself, and once with ``PRELOAD_APP=true``, where the master loads and
+freezes the data before forking. Both runs then serve the same warm-up
+traffic, and the proportional set size (PSS) of each worker is reported.
+PSS splits shared pages between the processes that map them, so memory
+shared copy-on-write shows up as a lower per-worker figure.
+
+Usage:
+    python benchmarks/bench_preload_memory.py --workers 4 --pages 42
+    python benchmarks/bench_preload_memory.py --json preload.json
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from benchmarks.fake_upstream import FakeUpstream  # noqa: E402
+from benchmarks.load_test import AppServer, build_paths, drive  # noqa: E402
+
+MODES = {'fork': 'false', 'preload': 'true'}
+
+
+def run_mode(name, upstream, args):
+    server = AppServer(upstream.api_url, args.workers, cache_timeout=3600,
+                       extra_env={'PRELOAD_APP': MODES[name]}).start()
+    try:
+        upstream.reset()
+        paths = build_paths(upstream.count, args.detail_ratio, random.Random(args.seed))
+        drive(server.url, args.requests, args.concurrency, paths)
+        result = server.memory()
+        result['upstream_calls'] = upstream.stats()['calls']
+        if result['workers_pss_mib'] is not None:
+            result['pss_per_worker_mib'] = round(result['workers_pss_mib'] / result['workers'], 1)
+        return result
+    finally:
+        server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pages', type=int, default=42, help='upstream list pages (20 characters each)')
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn workers')
+    parser.add_argument('--requests', type=int, default=2000, help='warm-up requests before measuring')
+    parser.add_argument('--concurrency', type=int, default=16, help='concurrent client threads')
+    parser.add_argument('--detail-ratio', type=float, default=0.8,
+                        help='fraction of /characters/<id> requests (rest hit the list)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args()
+
+    results = {}
+    with FakeUpstream(args.pages, latency=0, seed=args.seed) as upstream:
+        for name in MODES:
+            results[name] = run_mode(name, upstream, args)
+
+    columns = ('workers', 'master_rss_mib', 'workers_rss_mib', 'workers_pss_mib',
+               'pss_per_worker_mib', 'upstream_calls')
+    print(f"{'mode':<10}" + ''.join(f"{c:>20}" for c in columns))
+    for name, result in results.items():
+        print(f"{name:<10}" + ''.join(f"{str(result.get(c)):>20}" for c in columns))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'config': vars(args), 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
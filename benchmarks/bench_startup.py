@@ -0,0 +1,87 @@
+"""
+Worker startup benchmarks, using pytest-benchmark.
+
+Every round starts a fresh interpreter that imports the app and answers a
+first request (/health) through the test client, as a gunicorn worker does
+after it forks without preloading. The round time includes interpreter
+startup; the boot time measured inside the process and the slowest imports
+reported by ``python -X importtime`` are stored as extra info in the JSON
+report. Not collected by the regular test run:
+
+    pytest benchmarks/bench_startup.py --benchmark-json=startup.json
+    python benchmarks/compare_baseline.py startup.json --threshold 20
+
+Run directly to print the import-time profile:
+
+    python benchmarks/bench_startup.py --top 25
+"""
+
+import argparse
+import os
+import re
+import sys
+
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from benchmarks.worker_boot import boot, run_python  # noqa: E402
+
+IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+def import_profile(module='rick_morty_api'):
+    """
+    Parse ``python -X importtime`` for one module.
+
+    Returns:
+        list: (module, self seconds, cumulative seconds, depth) for every import
+    """
+    profile = []
+    for line in run_python('-X', 'importtime', '-c', f"import {module}").stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            profile.append((name, int(self_us) / 1e6, int(cumulative_us) / 1e6, len(indent) // 2))
+    return profile
+
+
+def slowest_imports(profile, top=10, depth=1):
+    """The imports at ``depth`` below the app with the largest cumulative time"""
+    entries = [(name, cumulative) for name, _, cumulative, level in profile if level == depth]
+    return sorted(entries, key=lambda entry: entry[1], reverse=True)[:top]
+
+
+def test_worker_boot_to_first_response(benchmark):
+    reports = []
+    benchmark.pedantic(lambda: reports.append(boot()), rounds=5, iterations=1, warmup_rounds=1)
+    benchmark.extra_info['boot_seconds'] = min(report['seconds'] for report in reports)
+    benchmark.extra_info['modules_loaded'] = len(reports[-1]['modules'])
+
+
+def test_import_app(benchmark):
+    benchmark.pedantic(run_python, args=('-c', 'import rick_morty_api'), rounds=5, iterations=1, warmup_rounds=1)
+    benchmark.extra_info['slowest_imports'] = [
+        {'module': name, 'seconds': round(seconds, 4)} for name, seconds in slowest_imports(import_profile())
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Import-time profile of the app (python -X importtime)')
+    parser.add_argument('--module', default='rick_morty_api')
+    parser.add_argument('--top', type=int, default=15, help='imports to list')
+    parser.add_argument('--depth', type=int, default=1, help='nesting level below the module (1 = its direct imports)')
+    args = parser.parse_args()
+
+    profile = import_profile(args.module)
+    total = next(cumulative for name, _, cumulative, _ in profile if name == args.module)
+    print(f"{args.module}: {total * 1000:.1f} ms")
+    for name, seconds in slowest_imports(profile, args.top, args.depth):
+        print(f"  {name:<40}{seconds * 1000:>8.1f} ms")
+    print(f"boot to first response: {boot()['seconds'] * 1000:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Compare a pytest-benchmark JSON report with the committed baseline.
+
+Exits non-zero when any benchmark's median regressed by more than the
+threshold percentage. Benchmarks missing from either side are reported but
+do not fail the comparison.
+
+Usage:
+    python benchmarks/compare_baseline.py bench.json [--baseline benchmarks/baseline.json] [--threshold 20]
+    python benchmarks/compare_baseline.py bench.json --update   # record a new baseline
+"""
+
+import argparse
+import json
+import os
+import sys
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+STATS = ('min', 'median', 'mean', 'stddev', 'rounds')
+
+
+def load_report(path):
+    """Reduce a pytest-benchmark report to {name: stats}"""
+    with open(path) as f:
+        report = json.load(f)
+    return {
+        bench['name']: {stat: bench['stats'][stat] for stat in STATS}
+        for bench in report['benchmarks']
+    }
+
+
+def write_baseline(path, results, source):
+    with open(source) as f:
+        machine = json.load(f).get('machine_info', {})
+    baseline = {
+        'machine_info': {key: machine.get(key) for key in ('machine', 'python_implementation', 'python_version')},
+        'benchmarks': results,
+    }
+    with open(path, 'w') as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def compare(baseline, current, threshold):
+    """Print a comparison table and return the names that regressed"""
+    regressions = []
+    print(f"{'benchmark':<50}{'baseline':>14}{'current':>14}{'change':>10}")
+    for name in sorted(set(baseline) | set(current)):
+        if name not in current:
+            print(f"{name:<50}{'':>14}{'missing':>14}")
+            continue
+        if name not in baseline:
+            print(f"{name:<50}{'new':>14}{current[name]['median'] * 1e6:>12.2f}us")
+            continue
+
+        before = baseline[name]['median']
+        after = current[name]['median']
+        change = (after - before) / before * 100
+        flag = ''
+        if change > threshold:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print(f"{name:<50}{before * 1e6:>12.2f}us{after * 1e6:>12.2f}us{change:>+9.1f}%{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare microbenchmark results with a baseline')
+    parser.add_argument('report', help='pytest-benchmark JSON (--benchmark-json output)')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--threshold', type=float, default=float(os.environ.get('BENCHMARK_THRESHOLD', 20)),
+                        help='allowed median slowdown in percent (default: 20)')
+    parser.add_argument('--update', action='store_true', help='overwrite the baseline with this report')
+    args = parser.parse_args()
+
+    current = load_report(args.report)
+    if args.update:
+        write_baseline(args.baseline, current, args.report)
+        print(f"Baseline updated with {len(current)} benchmarks: {args.baseline}")
+        return
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)['benchmarks']
+
+    regressions = compare(baseline, current, args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} benchmark(s) regressed by more than {args.threshold}%", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Rick & Morty character API.
+
+Serves deterministic, generated characters with the same response shape as
+https://rickandmortyapi.com/api/character, with configurable page count,
+latency and error rate, and counts the calls it receives so benchmarks can
+report upstream load. With a concurrency limit it throttles like a rate
+limited API: calls beyond the limit get a 429 with ``Retry-After``.
+
+Endpoints:
+    GET  /api/character?page=N        Paginated list (20 per page)
+    GET  /api/character/<id>          Single character
+    GET  /api/character/<id>,<id>...  Several characters at once
+    GET  /api/character/avatar/<id>.jpeg  Generated 300x300 avatar (needs Pillow)
+    GET  /__stats                     Call, error and throttling counters
+    POST /__reset                     Reset the counters
+
+Usage:
+    python benchmarks/fake_upstream.py --port 8001 --pages 42 --latency 0.05
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+PAGE_SIZE = 20
+
+SPECIES = ('Human', 'Human', 'Alien', 'Humanoid', 'Robot')
+STATUSES = ('Alive', 'Alive', 'Dead', 'unknown')
+ORIGINS = ('Earth (C-137)', 'Earth (Replacement Dimension)', 'Abadango', 'unknown')
+LOCATIONS = ('Earth (C-137)', 'Citadel of Ricks', 'Interdimensional Cable', 'Anatomy Park')
+
+CHARACTER_PATH = re.compile(r'^/api/character/(\d+(?:,\d+)*)$')
+AVATAR_PATH = re.compile(r'^/api/character/avatar/(\d+)\.jpeg$')
+AVATAR_SIZE = 300
+
+
+def make_character(character_id, base_url):
+    """Build a deterministic character record in the upstream format"""
+    origin = ORIGINS[character_id % len(ORIGINS)]
+    location = LOCATIONS[(character_id // 2) % len(LOCATIONS)]
+    return {
+        'id': character_id,
+        'name': f"Character {character_id}",
+        'status': STATUSES[character_id % len(STATUSES)],
+        'species': SPECIES[character_id % len(SPECIES)],
+        'type': '',
+        'gender': 'Female' if character_id % 2 else 'Male',
+        'origin': {'name': origin, 'url': ''},
+        'location': {'name': location, 'url': ''},
+        'image': f"{base_url}/api/character/avatar/{character_id}.jpeg",
+        'episode': [f"{base_url}/api/episode/{n}" for n in range(1, character_id % 5 + 2)],
+        'url': f"{base_url}/api/character/{character_id}",
+        'created': '2017-11-04T18:48:46.250Z',
+    }
+
+
+def make_avatar(character_id):
+    """Render a deterministic JPEG avatar, one solid colour per character"""
+    import io
+    from PIL import Image
+
+    colour = ((character_id * 67) % 256, (character_id * 131) % 256, (character_id * 199) % 256)
+    buffer = io.BytesIO()
+    Image.new('RGB', (AVATAR_SIZE, AVATAR_SIZE), colour).save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+class FakeUpstream:
+    """
+    Threaded HTTP server emulating the upstream character API.
+
+    Args:
+        pages (int): Number of list pages to serve
+        latency (float): Seconds added to every response
+        error_rate (float): Fraction of responses that fail with a 500
+        max_concurrency (int): Concurrent calls served before answering 429 (0 = unlimited)
+        host (str): Interface to bind
+        port (int): Port to bind (0 picks a free port)
+    """
+
+    def __init__(self, pages=42, latency=0.0, error_rate=0.0, host='127.0.0.1', port=0, seed=None,
+                 max_concurrency=0):
+        self.pages = pages
+        self.latency = latency
+        self.error_rate = error_rate
+        self.max_concurrency = max_concurrency
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.throttled = 0
+        self.inflight = 0
+        self.peak_concurrency = 0
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def api_url(self):
+        """Value for the app's API_BASE_URL"""
+        return f"{self.base_url}/api/character"
+
+    @property
+    def count(self):
+        return self.pages * PAGE_SIZE
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, args=(0.05,),
+                                       name='fake-upstream', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def stats(self):
+        with self.lock:
+            return {'calls': self.calls, 'errors': self.errors, 'throttled': self.throttled,
+                    'peak_concurrency': self.peak_concurrency}
+
+    def reset(self):
+        with self.lock:
+            self.calls = 0
+            self.errors = 0
+            self.throttled = 0
+            self.peak_concurrency = self.inflight
+
+    def list_page(self, page):
+        first = (page - 1) * PAGE_SIZE + 1
+        results = [make_character(i, self.base_url) for i in range(first, first + PAGE_SIZE)]
+        return {
+            'info': {
+                'count': self.count,
+                'pages': self.pages,
+                'next': f"{self.api_url}?page={page + 1}" if page < self.pages else None,
+                'prev': f"{self.api_url}?page={page - 1}" if page > 1 else None,
+            },
+            'results': results,
+        }
+
+    def route(self, path):
+        """Return (status, payload) for an API path"""
+        url = urlsplit(path)
+        if url.path == '/api/character':
+            page = int(parse_qs(url.query).get('page', ['1'])[0])
+            if not 1 <= page <= self.pages:
+                return 404, {'error': 'There is nothing here'}
+            return 200, self.list_page(page)
+
+        match = CHARACTER_PATH.match(url.path)
+        if match:
+            ids = [int(i) for i in match.group(1).split(',')]
+            found = [make_character(i, self.base_url) for i in ids if 1 <= i <= self.count]
+            if ',' in match.group(1):
+                return 200, found
+            if not found:
+                return 404, {'error': 'Character not found'}
+            return 200, found[0]
+
+        return 404, {'error': 'There is nothing here'}
+
+    def _handler_class(self):
+        upstream = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def send_json(self, status, payload, headers=()):
+                body = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                for name, value in headers:
+                    self.send_header(name, value)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def send_image(self, body):
+                self.send_response(200)
+                self.send_header('Content-Type', 'image/jpeg')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path == '/__stats':
+                    return self.send_json(200, upstream.stats())
+
+                with upstream.lock:
+                    upstream.calls += 1
+                    if upstream.max_concurrency and upstream.inflight >= upstream.max_concurrency:
+                        upstream.throttled += 1
+                        throttled = True
+                    else:
+                        throttled = False
+                        upstream.inflight += 1
+                        upstream.peak_concurrency = max(upstream.peak_concurrency, upstream.inflight)
+                    failed = not throttled and upstream.random.random() < upstream.error_rate
+                    if failed:
+                        upstream.errors += 1
+                if throttled:
+                    return self.send_json(429, {'error': 'Too many requests'}, [('Retry-After', '1')])
+                try:
+                    if upstream.latency:
+                        time.sleep(upstream.latency)
+                    if failed:
+                        return self.send_json(500, {'error': 'Injected failure'})
+                    avatar = AVATAR_PATH.match(urlsplit(self.path).path)
+                    if avatar and 1 <= int(avatar.group(1)) <= upstream.count:
+                        return self.send_image(make_avatar(int(avatar.group(1))))
+                    self.send_json(*upstream.route(self.path))
+                finally:
+                    with upstream.lock:
+                        upstream.inflight -= 1
+
+            def do_POST(self):
+                if self.path == '/__reset':
+                    upstream.reset()
+                    return self.send_json(200, upstream.stats())
+                self.send_json(404, {'error': 'There is nothing here'})
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fake Rick & Morty character API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--pages', type=int, default=42)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of 500 responses')
+    parser.add_argument('--max-concurrency', type=int, default=0,
+                        help='concurrent calls served before answering 429 (0 = unlimited)')
+    args = parser.parse_args()
+
+    upstream = FakeUpstream(args.pages, args.latency, args.error_rate, args.host, args.port,
+                            max_concurrency=args.max_concurrency)
+    print(f"Serving {upstream.count} characters at {upstream.api_url}")
+    try:
+        upstream.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
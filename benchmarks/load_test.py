@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+Load test for the Rick & Morty API against a local fake upstream.
+
+Starts benchmarks/fake_upstream.py in-process, runs the app under gunicorn
+and drives it at a fixed concurrency, reporting latency percentiles,
+throughput, upstream call counts and memory for three cache scenarios:
+
+- cold:  fresh workers with empty caches
+- warm:  the same workers straight after the cold run
+- stale: workers whose cache TTL expired just before the run
+
+Without --workers gunicorn derives its worker model from the (emulated)
+container limits and serving mode, as in production (see worker_tuning.py);
+the model chosen is part of every result.
+
+Usage:
+    python benchmarks/load_test.py --pages 42 --latency 0.05 --concurrency 16
+    python benchmarks/load_test.py --cpu-limit 0.5 --memory-limit-mb 512 --serving-mode mixed
+    python benchmarks/load_test.py --json results.json --max-p95-ms 500 --max-error-rate 0.01
+"""
+
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import psutil
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from benchmarks.fake_upstream import FakeUpstream  # noqa: E402
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCENARIOS = ('cold', 'warm', 'stale')
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[rank]
+
+
+class AppServer:
+    """The app running under gunicorn in a subprocess."""
+
+    def __init__(self, upstream_url, workers, cache_timeout, extra_env=None, gunicorn_args=()):
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.multiproc_dir = tempfile.mkdtemp(prefix='rick-morty-bench-')
+        self.env = dict(
+            os.environ,
+            API_BASE_URL=upstream_url,
+            CACHE_TIMEOUT=str(cache_timeout),
+            RATE_LIMIT=str(10 ** 9),
+            PROMETHEUS_MULTIPROC_DIR=self.multiproc_dir,
+            **(extra_env or {}),
+        )
+        # None lets gunicorn.conf.py derive the worker count
+        workers_args = ('--workers', str(workers)) if workers else ()
+        self.command = [
+            sys.executable, '-m', 'gunicorn',
+            '--config', os.path.join(REPO_ROOT, 'gunicorn.conf.py'),
+            '--bind', f"127.0.0.1:{self.port}",
+            *workers_args,
+            '--log-level', 'warning',
+            *gunicorn_args,
+            'rick_morty_api:app',
+        ]
+        self.process = None
+
+    def start(self, timeout=30):
+        self.process = subprocess.Popen(self.command, cwd=REPO_ROOT, env=self.env,
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"gunicorn exited with status {self.process.returncode}")
+            try:
+                if requests.get(f"{self.url}/health", timeout=1).status_code == 200:
+                    return self
+            except requests.exceptions.RequestException:
+                pass
+            time.sleep(0.1)
+        self.stop()
+        raise RuntimeError("gunicorn did not become healthy in time")
+
+    def stop(self):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            self.process.wait(timeout=30)
+
+    def memory(self):
+        """RSS of the master and summed RSS/PSS of the workers, in MiB"""
+        master = psutil.Process(self.process.pid)
+        workers = master.children()
+        rss = [w.memory_info().rss for w in workers]
+        try:
+            pss = [w.memory_full_info().pss for w in workers]
+        except (AttributeError, psutil.AccessDenied):
+            pss = []
+        mib = 1024 * 1024
+        return {
+            'master_rss_mib': round(master.memory_info().rss / mib, 1),
+            'workers_rss_mib': round(sum(rss) / mib, 1),
+            'workers_pss_mib': round(sum(pss) / mib, 1) if pss else None,
+            'workers': len(workers),
+        }
+
+    def worker_model(self):
+        """Worker class, workers and threads the workers report in /metrics"""
+        model = {}
+        for line in requests.get(f"{self.url}/metrics", timeout=5).text.splitlines():
+            if line.startswith('rickmorty_worker_model{'):
+                labels, value = line[len('rickmorty_worker_model{'):].rsplit('} ', 1)
+                labels = dict(label.split('=', 1) for label in labels.split(','))
+                model['worker_class'] = labels['worker_class'].strip('"')
+                model[labels['setting'].strip('"')] = float(value)
+        return {
+            'worker_class': model.get('worker_class'),
+            'threads': int(model.get('threads', 0)),
+        }
+
+
+def build_paths(character_count, detail_ratio, rng):
+    """An endless mix of list and detail requests"""
+    while True:
+        if rng.random() < detail_ratio:
+            yield f"/characters/{rng.randint(1, character_count)}"
+        else:
+            yield '/characters' if rng.random() < 0.5 else '/characters?filtered=false'
+
+
+def drive(base_url, total_requests, concurrency, paths):
+    """Issue total_requests requests from concurrency threads and collect results"""
+    lock = threading.Lock()
+    latencies, statuses = [], {}
+    local = threading.local()
+
+    def next_path():
+        with lock:
+            return next(paths)
+
+    def one_request(_):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        path = next_path()
+        start = time.perf_counter()
+        try:
+            status = session.get(base_url + path, timeout=60).status_code
+        except requests.exceptions.RequestException:
+            status = 'error'
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one_request, range(total_requests)))
+    wall = time.perf_counter() - start
+
+    latencies.sort()
+    failed = sum(count for status, count in statuses.items() if status == 'error' or status >= 500)
+    return {
+        'requests': total_requests,
+        'throughput_rps': round(total_requests / wall, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'error_rate': round(failed / total_requests, 4),
+        'statuses': {str(k): v for k, v in sorted(statuses.items(), key=str)},
+    }
+
+
+def container_env(args):
+    """Environment emulating the container limits and serving mode for worker_tuning"""
+    env = {'SERVING_MODE': args.serving_mode}
+    if args.cpu_limit:
+        env['CONTAINER_CPU_LIMIT'] = str(args.cpu_limit)
+    if args.memory_limit_mb:
+        env['CONTAINER_MEMORY_LIMIT_MB'] = str(args.memory_limit_mb)
+    return env
+
+
+def run_scenario(name, upstream, args, rng):
+    stale = name == 'stale'
+    server = AppServer(upstream.api_url, args.workers,
+                       args.stale_ttl if stale else args.cache_timeout, extra_env=container_env(args)).start()
+    try:
+        paths = build_paths(upstream.count, args.detail_ratio, rng)
+        if name in ('warm', 'stale'):
+            # Prime every worker's caches with the same traffic mix
+            drive(server.url, args.requests, args.concurrency, paths)
+        if stale:
+            time.sleep(args.stale_ttl + 0.5)
+
+        upstream.reset()
+        result = drive(server.url, args.requests, args.concurrency, paths)
+        result['upstream_calls'] = upstream.stats()['calls']
+        result.update(server.memory())
+        result.update(server.worker_model())
+        return result
+    finally:
+        server.stop()
+
+
+def print_table(results):
+    columns = ('requests', 'throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms', 'error_rate',
+               'upstream_calls', 'workers_rss_mib', 'workers_pss_mib', 'workers', 'worker_class', 'threads')
+    print(f"{'scenario':<10}" + ''.join(f"{c:>17}" for c in columns))
+    for name, result in results.items():
+        print(f"{name:<10}" + ''.join(f"{str(result[c]):>17}" for c in columns))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the API against a local fake upstream')
+    parser.add_argument('--pages', type=int, default=42, help='upstream list pages (20 characters each)')
+    parser.add_argument('--latency', type=float, default=0.05, help='upstream latency in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of failing upstream calls')
+    parser.add_argument('--upstream-max-concurrency', type=int, default=0,
+                        help='concurrent upstream calls before it answers 429 (0 = unlimited)')
+    parser.add_argument('--workers', type=int, help='gunicorn workers (default: derived by worker_tuning)')
+    parser.add_argument('--serving-mode', default='mixed', help='SERVING_MODE: mixed, cpu or streaming')
+    parser.add_argument('--cpu-limit', type=float, help='CPUs to emulate as the container limit')
+    parser.add_argument('--memory-limit-mb', type=int, help='memory limit to emulate, in MiB')
+    parser.add_argument('--concurrency', type=int, default=16, help='concurrent client threads')
+    parser.add_argument('--requests', type=int, default=2000, help='requests per scenario')
+    parser.add_argument('--detail-ratio', type=float, default=0.8,
+                        help='fraction of /characters/<id> requests (rest hit the list)')
+    parser.add_argument('--cache-timeout', type=int, default=300, help='cache TTL for cold/warm runs')
+    parser.add_argument('--stale-ttl', type=int, default=2, help='cache TTL for the stale run')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help='write results to this file')
+    parser.add_argument('--max-p95-ms', type=float, help='fail if any scenario p95 exceeds this')
+    parser.add_argument('--max-error-rate', type=float, help='fail if any scenario error rate exceeds this')
+    args = parser.parse_args()
+
+    scenarios = [s for s in args.scenarios.split(',') if s]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    results = {}
+    with FakeUpstream(args.pages, args.latency, args.error_rate, seed=args.seed,
+                      max_concurrency=args.upstream_max_concurrency) as upstream:
+        for name in scenarios:
+            results[name] = run_scenario(name, upstream, args, random.Random(args.seed))
+
+    print_table(results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'config': vars(args), 'results': results}, f, indent=2)
+
+    failures = []
+    for name, result in results.items():
+        if args.max_p95_ms is not None and result['p95_ms'] > args.max_p95_ms:
+            failures.append(f"{name}: p95 {result['p95_ms']}ms > {args.max_p95_ms}ms")
+        if args.max_error_rate is not None and result['error_rate'] > args.max_error_rate:
+            failures.append(f"{name}: error rate {result['error_rate']} > {args.max_error_rate}")
+    for failure in failures:
+        print(f"FAIL {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
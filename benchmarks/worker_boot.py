@@ -0,0 +1,36 @@
+"""
+Worker boot in a fresh interpreter.
+
+Shared by the startup benchmark and the startup budget test, so both
+measure the same thing: importing the app and answering a first request
+(/health) through the test client, as a gunicorn worker does after it forks
+without preloading.
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+BOOT_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import rick_morty_api
+response = rick_morty_api.app.test_client().get('/health')
+print(json.dumps({'seconds': time.perf_counter() - start, 'status': response.status_code,
+                  'modules': sorted(sys.modules)}))
+"""
+
+
+def run_python(*args):
+    """Run a fresh interpreter in the repository root"""
+    return subprocess.run([sys.executable, *args], cwd=ROOT, capture_output=True, text=True, check=True)
+
+
+def boot():
+    """Boot the app in a fresh interpreter; returns its in-process report"""
+    result = json.loads(run_python('-c', BOOT_SCRIPT).stdout.strip().splitlines()[-1])
+    assert result['status'] == 200
+    return result
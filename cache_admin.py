@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+Cache administration for the Rick and Morty API.
+
+Every gunicorn worker keeps its own in-memory caches, so cache commands
+(invalidate, pre-warm) issued to one worker are appended to a shared
+command log and replayed by every worker of the pod before it handles its
+next request. Pre-warm commands carry the records fetched by the worker
+that received them, so the other workers do not call the upstream API again.
+
+Without CACHE_COMMAND_LOG, commands only apply to the worker that received
+them (fine for a single process, e.g. the development server).
+
+Configuration (environment variables):
+    CACHE_COMMAND_LOG: Path of the shared command log (default: unset)
+    CACHE_COMMAND_LOG_MAX_BYTES: Size at which the log is rotated (default: 4194304)
+"""
+
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from flask import current_app
+from prometheus_client import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+CACHE_COMMAND_LOG = os.environ.get('CACHE_COMMAND_LOG')
+CACHE_COMMAND_LOG_MAX_BYTES = int(os.environ.get('CACHE_COMMAND_LOG_MAX_BYTES', str(4 * 1024 * 1024)))
+
+
+class CommandLog:
+    """
+    Append-only log of cache commands shared by the workers of a pod.
+
+    Each process reads from the offset where it last stopped; commands
+    written before the process started (or called ``reset``) are skipped.
+    Once the log grows past max_bytes, the writer renames it to
+    ``<path>.1`` and starts a new one. Readers finish the renamed log
+    through the descriptor they hold before moving on. A reader that missed
+    a whole generation invalidates every cache instead of replaying it.
+
+    Args:
+        path (str): Log file path, or None to keep commands in-process
+        max_bytes (int): Size after which the log is rotated
+    """
+
+    def __init__(self, path: Optional[str], max_bytes: int = CACHE_COMMAND_LOG_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._pending: List[dict] = []
+        self._fd: Optional[int] = None
+        self.offset = 0
+        self.reset()
+
+    def reset(self) -> None:
+        """Skip everything logged so far; called in each worker after the fork"""
+        with self._lock:
+            self._pending = []
+            self._reopen(at_end=True)
+
+    def _reopen(self, at_end: bool) -> None:
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        self.offset = 0
+        if not self.path:
+            return
+        try:
+            # Created if missing, so that a rotation can be told apart from a reset
+            self._fd = os.open(self.path, os.O_RDONLY | os.O_CREAT, 0o600)
+        except FileNotFoundError:
+            return
+        if at_end:
+            self.offset = os.fstat(self._fd).st_size
+
+    def _inode(self, path: str) -> Optional[int]:
+        try:
+            return os.stat(path).st_ino
+        except FileNotFoundError:
+            return None
+
+    @contextmanager
+    def _flock(self, operation: int) -> Iterator[None]:
+        # Appends hold the lock shared and rotation exclusively, so no write
+        # can land in a log after readers have moved past it
+        fd = os.open(self.path + '.lock', os.O_WRONLY | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, operation)
+            yield
+        finally:
+            os.close(fd)
+
+    def append(self, command: dict) -> None:
+        """Record a command for every worker, including this one"""
+        if not self.path:
+            with self._lock:
+                self._pending.append(command)
+            return
+        line = json.dumps(command, separators=(',', ':')).encode('utf-8') + b'\n'
+        with self._flock(fcntl.LOCK_SH):
+            # A single O_APPEND write keeps concurrent writers from interleaving
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+            try:
+                os.write(fd, line)
+                size = os.fstat(fd).st_size
+            finally:
+                os.close(fd)
+        if size > self.max_bytes:
+            self.rotate()
+
+    def rotate(self) -> None:
+        """Start a new log if the current one is over max_bytes"""
+        with self._flock(fcntl.LOCK_EX):
+            try:
+                if os.stat(self.path).st_size > self.max_bytes:
+                    os.replace(self.path, self.path + '.1')
+            except FileNotFoundError:
+                pass
+
+    def _read_new(self) -> bytes:
+        size = os.fstat(self._fd).st_size
+        if size < self.offset:
+            # The log was truncated; start over from its end
+            self.offset = size
+        data = os.pread(self._fd, size - self.offset, self.offset) if size > self.offset else b''
+        # Leave a partially written last line for the next poll
+        complete = data[:data.rfind(b'\n') + 1]
+        self.offset += len(complete)
+        return complete
+
+    def poll(self) -> List[dict]:
+        """
+        Return the commands appended since the last poll.
+
+        Returns:
+            list: Commands in the order they were written
+        """
+        with self._lock:
+            if not self.path:
+                commands, self._pending = self._pending, []
+                return commands
+
+            prefix = []
+            if self._fd is None:
+                # The log directory did not exist yet when this process started
+                self._reopen(at_end=False)
+                if self._fd is None:
+                    return []
+            complete = self._read_new()
+
+            current = os.fstat(self._fd).st_ino
+            if self._inode(self.path) != current:
+                rotated = self._inode(self.path + '.1')
+                if rotated == current:
+                    # Rotated: what is left of the old log was read above
+                    self._reopen(at_end=False)
+                    complete += self._read_new()
+                elif rotated is not None:
+                    logger.warning("Missed a rotation of the cache command log; invalidating every cache")
+                    prefix = [{'action': 'invalidate', 'keys': None, 'prefix': ''}]
+                    self._reopen(at_end=False)
+                    complete = self._read_new()
+                else:
+                    # The log was reset (new deployment); start over from its end
+                    self._reopen(at_end=True)
+                    complete = b''
+
+        commands = prefix
+        for line in complete.splitlines():
+            try:
+                commands.append(json.loads(line))
+            except ValueError:
+                logger.warning("Skipping malformed cache command")
+        return commands
+
+
+def key_matches(key: str, keys: Optional[Iterable[str]] = None, prefix: Optional[str] = None) -> bool:
+    """Whether a cache key is selected by an explicit key list or a prefix"""
+    return (keys is not None and key in keys) or (prefix is not None and key.startswith(prefix))
+
+
+def entry_stats(entries: Dict[str, dict], endpoint: str, now: Optional[float] = None) -> dict:
+    """
+    Summarize one cache for the admin API.
+
+    Args:
+        entries (dict): Cache entries by key, each with "data" and "timestamp"
+        endpoint (str): The endpoint label the cache's hits and misses are counted under
+        now (float): Current time (defaults to time.time())
+
+    Returns:
+        dict: Entry count, approximate size, ages and this worker's hit ratio
+    """
+    now = now or time.time()
+    ages = [now - entry["timestamp"] for entry in entries.values()]
+    # Size of the JSON the entries are served as
+    size = sum(len(current_app.json.dumps_bytes(entry["data"])) for entry in entries.values())
+
+    hits = REGISTRY.get_sample_value('rickmorty_cache_hits_total', {'endpoint': endpoint}) or 0
+    misses = REGISTRY.get_sample_value('rickmorty_cache_misses_total', {'endpoint': endpoint}) or 0
+    lookups = hits + misses
+    return {
+        'entries': len(entries),
+        'bytes': size,
+        'oldest_age_seconds': round(max(ages), 3) if ages else None,
+        'newest_age_seconds': round(min(ages), 3) if ages else None,
+        'hits': int(hits),
+        'misses': int(misses),
+        'hit_ratio': round(hits / lookups, 4) if lookups else None,
+    }
+
+
+command_log = CommandLog(CACHE_COMMAND_LOG)
+
+
+def apply_pending(handlers: Dict[str, Callable[[dict], None]]) -> int:
+    """
+    Apply the commands other workers (or this one) have issued since the last call.
+
+    Args:
+        handlers (dict): Handler per command "action"
+
+    Returns:
+        int: Number of commands applied
+    """
+    commands = command_log.poll()
+    for command in commands:
+        handler = handlers.get(command.get('action'))
+        if handler is None:
+            logger.warning("Unknown cache command: %s", command.get('action'))
+            continue
+        handler(command)
+    return len(commands)
+
+
+def issue(command: dict, handlers: Dict[str, Callable[[dict], None]]) -> None:
+    """
+    Issue a command to every worker and apply it in this one right away.
+
+    Args:
+        command (dict): The command; "action" selects the handler
+        handlers (dict): Handler per command "action"
+    """
+    command_log.append(command)
+    apply_pending(handlers)
+
+
+def init_cache_admin(app, handlers: Dict[str, Callable[[dict], None]]) -> None:
+    """
+    Replay cache commands from other workers before each request.
+
+    Args:
+        app: The Flask application instance
+        handlers (dict): Handler per command "action"
+    """
+    @app.before_request
+    def apply_cache_commands():
+        apply_pending(handlers)
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Cache freshness policy for the Rick and Morty API.
+
+Each cached resource has its own TTL. A request can tighten it with
+``Cache-Control: max-age=N`` or ``no-cache``, or set it with the
+``cache_ttl`` query parameter. The result is always clamped to
+[CACHE_TTL_MIN, CACHE_TTL_MAX], so clients cannot force upstream calls (a
+full crawl, for the list) more often than CACHE_TTL_MIN allows. The floor
+never exceeds the resource's own TTL.
+
+Responses served from a cache lookup carry ``X-Cache: HIT`` or ``MISS``
+and an ``Age`` header. Successful ones are also cacheable by shared caches
+(the ingress or a CDN): ``Cache-Control: public, max-age=<TTL>`` together
+with ``Age`` tells the cache how long the entry stays fresh, and
+``stale-while-revalidate`` / ``stale-if-error`` let it keep serving the
+entry while it refetches or while the API is failing. ``Last-Modified`` is
+the time the entry was fetched, so conditional requests get a ``304``, and
+``Vary: Accept`` keeps the JSON and binary encodings apart.
+
+Configuration (environment variables):
+    CACHE_TIMEOUT: Default TTL of every cache, in seconds (default: 300)
+    CHARACTER_LIST_CACHE_TTL: TTL of the /characters list (default: CACHE_TIMEOUT)
+    CHARACTER_DETAIL_CACHE_TTL: TTL of /characters/<id> entries (default: CACHE_TIMEOUT)
+    CACHE_TTL_MIN: Lowest freshness limit a request can ask for (default: 60)
+    CACHE_TTL_MAX: Highest freshness limit a request can ask for (default: 3600)
+    CACHE_STALE_WHILE_REVALIDATE: Seconds a shared cache may serve an expired
+        response while refetching it (default: 60)
+    CACHE_STALE_IF_ERROR: Seconds a shared cache may serve an expired response
+        when the API fails (default: 3600)
+"""
+
+import os
+import time
+from typing import Optional
+
+from flask import g, has_request_context, request
+
+CACHE_TIMEOUT = int(os.environ.get('CACHE_TIMEOUT', '300'))
+CHARACTER_LIST_CACHE_TTL = int(os.environ.get('CHARACTER_LIST_CACHE_TTL', CACHE_TIMEOUT))
+CHARACTER_DETAIL_CACHE_TTL = int(os.environ.get('CHARACTER_DETAIL_CACHE_TTL', CACHE_TIMEOUT))
+CACHE_TTL_MIN = int(os.environ.get('CACHE_TTL_MIN', '60'))
+CACHE_TTL_MAX = int(os.environ.get('CACHE_TTL_MAX', '3600'))
+CACHE_STALE_WHILE_REVALIDATE = int(os.environ.get('CACHE_STALE_WHILE_REVALIDATE', '60'))
+CACHE_STALE_IF_ERROR = int(os.environ.get('CACHE_STALE_IF_ERROR', '3600'))
+
+
+def max_age(ttl: float) -> float:
+    """
+    Oldest cache entry the current request accepts.
+
+    Args:
+        ttl (float): The resource's configured TTL
+
+    Returns:
+        float: Freshness limit in seconds (``ttl`` outside a request)
+    """
+    if not has_request_context():
+        return ttl
+
+    limit = ttl
+    cache_ttl = request.args.get('cache_ttl', type=int)
+    if cache_ttl is not None:
+        limit = cache_ttl
+    # Only parse Cache-Control when the client sent one
+    if 'HTTP_CACHE_CONTROL' in request.environ:
+        cache_control = request.cache_control
+        if cache_control.no_cache:
+            limit = 0
+        elif cache_control.max_age is not None:
+            limit = min(limit, cache_control.max_age)
+    if limit == ttl:
+        return ttl
+    return min(max(limit, min(CACHE_TTL_MIN, ttl)), CACHE_TTL_MAX)
+
+
+def is_fresh(timestamp: float, ttl: float, now: Optional[float] = None) -> bool:
+    """Whether an entry stored at ``timestamp`` may serve the current request"""
+    return (now or time.time()) - timestamp < max_age(ttl)
+
+
+def record(hit: bool, timestamp: Optional[float] = None, ttl: Optional[float] = None) -> None:
+    """
+    Note the outcome of the current request's cache lookup.
+
+    Args:
+        hit (bool): Whether the response is served from the cache
+        timestamp (float): When the served entry was stored (hits only)
+        ttl (float): The resource's TTL; enables shared-cache headers
+    """
+    if has_request_context():
+        g.cache_status = (hit, timestamp, ttl)
+
+
+def cache_control(ttl: float) -> str:
+    """
+    Shared-cache policy for a resource, sent together with ``Age``.
+
+    Args:
+        ttl (float): The resource's configured TTL
+
+    Returns:
+        str: Cache-Control header value
+    """
+    directives = ['public', f'max-age={int(ttl)}']
+    if CACHE_STALE_WHILE_REVALIDATE:
+        directives.append(f'stale-while-revalidate={CACHE_STALE_WHILE_REVALIDATE}')
+    if CACHE_STALE_IF_ERROR:
+        directives.append(f'stale-if-error={CACHE_STALE_IF_ERROR}')
+    return ', '.join(directives)
+
+
+def init_cache_policy(app) -> None:
+    """
+    Add X-Cache, Age and shared-cache headers to responses that looked up
+    a cache.
+
+    Args:
+        app: The Flask application instance
+    """
+    @app.after_request
+    def add_cache_headers(response):
+        status = g.get('cache_status')
+        # Streams only looked up the cache to get started
+        if status is None or response.is_streamed:
+            return response
+        hit, timestamp, ttl = status
+        now = time.time()
+        response.headers['X-Cache'] = 'HIT' if hit else 'MISS'
+        response.headers['Age'] = str(max(0, int(now - timestamp))) if hit else '0'
+        if ttl is None or response.status_code != 200 or request.method not in ('GET', 'HEAD'):
+            return response
+
+        response.headers['Cache-Control'] = cache_control(ttl)
+        response.vary.add('Accept')
+        response.last_modified = timestamp if hit else now
+        # Only evaluate conditional requests when the client sent one
+        if 'HTTP_IF_MODIFIED_SINCE' in request.environ:
+            response.make_conditional(request)
+        return response
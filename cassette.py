@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Record and replay of upstream responses.
+
+With UPSTREAM_MODE=record every successful (or 404) upstream response is
+also written to a cassette: a SQLite file holding one zlib-compressed body
+per URL. With UPSTREAM_MODE=replay ``upstream.get`` answers from the
+cassette alone, without calling the upstream API or holding a slot of the
+adaptive limiter, so the service runs offline and every run sees the same
+data. URLs missing from the cassette fail like an unreachable upstream.
+
+A recorded list page also records each of its characters under their
+detail URL, so details are replayed even if the app only listed them.
+
+Replayed calls sleep for UPSTREAM_REPLAY_LATENCY seconds, or for the latency
+measured when the response was recorded when it is set to "recorded", so
+performance runs can emulate a slow upstream deterministically.
+
+A cassette for the whole character list, including every character's
+detail URL, is recorded with:
+
+    python cassette.py --api-url https://rickandmortyapi.com/api/character
+
+Configuration (environment variables):
+    UPSTREAM_MODE: live, record or replay (default: live)
+    UPSTREAM_CASSETTE: Path of the cassette file (default: upstream-cassette.sqlite3)
+    UPSTREAM_REPLAY_LATENCY: Seconds added to replayed calls, or "recorded" (default: 0)
+"""
+
+import json
+import os
+import threading
+import time
+import zlib
+from http import HTTPStatus
+from typing import TYPE_CHECKING, Mapping, Optional
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+# sqlite3 is only imported once a cassette is used
+if TYPE_CHECKING:
+    import sqlite3
+
+UPSTREAM_MODE = os.environ.get('UPSTREAM_MODE', 'live').lower()
+UPSTREAM_CASSETTE = os.environ.get('UPSTREAM_CASSETTE', 'upstream-cassette.sqlite3')
+UPSTREAM_REPLAY_LATENCY = os.environ.get('UPSTREAM_REPLAY_LATENCY', '0')
+
+# Headers describing the transfer rather than the body, which is stored decoded
+TRANSFER_HEADERS = frozenset(('connection', 'content-encoding', 'content-length', 'keep-alive', 'transfer-encoding'))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    url TEXT PRIMARY KEY,
+    status INTEGER NOT NULL,
+    headers TEXT NOT NULL,
+    body BLOB NOT NULL,
+    latency REAL,
+    recorded_at REAL NOT NULL
+)
+"""
+
+
+class CassetteMiss(requests.exceptions.ConnectionError):
+    """Raised when replaying a URL that was never recorded"""
+
+
+def replay_latency(value: str) -> Optional[float]:
+    """Parse UPSTREAM_REPLAY_LATENCY: seconds, or None to use recorded latencies"""
+    return None if value.strip().lower() == 'recorded' else float(value)
+
+
+class Cassette:
+    """
+    Upstream responses stored by URL.
+
+    Args:
+        path (str): SQLite file, created if missing
+        latency (float): Seconds added to replayed calls (None = as recorded)
+    """
+
+    def __init__(self, path: str = UPSTREAM_CASSETTE, latency: Optional[float] = 0.0):
+        self.path = path
+        self.latency = latency
+        self._conn: Optional['sqlite3.Connection'] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _connection(self) -> 'sqlite3.Connection':
+        # A connection opened before gunicorn forks must not be used by the workers
+        if self._conn is None or self._pid != os.getpid():
+            import sqlite3
+            self._conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(SCHEMA)
+            self._pid = os.getpid()
+        return self._conn
+
+    def record(self, url: str, status_code: int, headers: Mapping[str, str], body: bytes,
+               latency: Optional[float] = None) -> None:
+        """
+        Store a response, replacing any earlier one for the same URL.
+
+        Args:
+            url (str): The requested URL
+            status_code (int): Response status
+            headers (Mapping): Response headers
+            body (bytes): Decoded response body
+            latency (float): Seconds the upstream call took
+        """
+        headers = {name: value for name, value in headers.items() if name.lower() not in TRANSFER_HEADERS}
+        row = (url, status_code, json.dumps(headers), zlib.compress(body, 9), latency, time.time())
+        with self._lock:
+            self._connection().execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)', row)
+
+    def replay(self, url: str) -> requests.Response:
+        """
+        The recorded response for a URL, after the configured latency.
+
+        Raises:
+            CassetteMiss: If the URL was not recorded
+        """
+        with self._lock:
+            row = self._connection().execute(
+                'SELECT status, headers, body, latency FROM responses WHERE url = ?', (url,)).fetchone()
+        if row is None:
+            raise CassetteMiss(f"{url} is not in the cassette {self.path}")
+        status_code, headers, body, recorded_latency = row
+
+        delay = recorded_latency if self.latency is None else self.latency
+        if delay:
+            time.sleep(delay)
+
+        response = requests.Response()
+        response.url = url
+        response.status_code = status_code
+        response.reason = HTTPStatus(status_code).phrase if status_code in HTTPStatus._value2member_map_ else ''
+        response.headers = CaseInsensitiveDict(json.loads(headers))
+        response._content = zlib.decompress(body)
+        return response
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection().execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+
+
+_store: Optional[Cassette] = None
+_store_lock = threading.Lock()
+
+
+def store() -> Cassette:
+    """The cassette configured by UPSTREAM_CASSETTE, opened on first use"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = Cassette(UPSTREAM_CASSETTE, replay_latency(UPSTREAM_REPLAY_LATENCY))
+        return _store
+
+
+def record_details(cassette: Cassette, page: dict, api_url: str) -> int:
+    """
+    Record the characters of a list page under their detail URLs.
+
+    The list results have the same shape as the detail responses, so the
+    details are stored from the pages instead of being fetched one by one.
+
+    Args:
+        cassette (Cassette): Where to record
+        page (dict): A list page
+        api_url (str): The character endpoint, for results without a URL
+
+    Returns:
+        int: Number of characters recorded
+    """
+    count = 0
+    for character in page.get('results', []):
+        url = character.get('url') or f"{api_url}/{character['id']}"
+        cassette.record(url, 200, {'Content-Type': 'application/json'}, json.dumps(character).encode('utf-8'))
+        count += 1
+    return count
+
+
+def record_crawl(api_url: str, cassette: Cassette) -> int:
+    """
+    Record every list page, and every character under its detail URL.
+
+    Returns:
+        int: Number of characters recorded
+    """
+    # upstream records through this module
+    import upstream
+
+    def fetch_page(url):
+        started = time.time()
+        response = upstream.get(url, 'characters', retries=5)
+        cassette.record(url, response.status_code, response.headers, response.content, time.time() - started)
+        return response.json()
+
+    return sum(record_details(cassette, page, api_url) for page in upstream.crawl(api_url, fetch_page))
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Record the upstream character list into a cassette')
+    parser.add_argument('--api-url', default=os.environ.get('API_BASE_URL', 'https://rickandmortyapi.com/api/character'))
+    parser.add_argument('--cassette', default=UPSTREAM_CASSETTE)
+    args = parser.parse_args(argv)
+
+    cassette = Cassette(args.cassette)
+    count = record_crawl(args.api_url, cassette)
+    print(f"Recorded {count} characters ({len(cassette)} responses) into {args.cassette}")
+
+
+if __name__ == '__main__':
+    main()
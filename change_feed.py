@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+Server-Sent Events feed of changes to the character list.
+
+Every time the cached list is replaced by a new crawl, ``ChangeFeed``
+compares it with the previous one and publishes the ids of added, changed
+and removed characters. Each event's id is a version of the list derived
+from its content, so it is the same in every worker and a client can
+resume in any worker by sending ``Last-Event-ID``: the changes it missed
+are replayed from the recent history, or a ``reset`` event tells it to
+reload the list when that version is no longer known.
+
+Subscribers each get a bounded buffer; a subscriber that falls behind is
+sent a ``reset`` instead of an unbounded backlog. Streams end after
+SSE_MAX_DURATION seconds (below gunicorn's worker timeout) and clients
+reconnect with their last event id.
+
+Every open stream holds a worker thread, so a worker only accepts a
+limited number of streams and answers more with a 503. The limit is sized
+from the gunicorn worker in ``post_fork`` unless SSE_MAX_STREAMS is set:
+half the threads of a gthread worker, none for a sync worker (a single
+stream would block it), no limit for async workers. One background thread
+per worker refreshes the cached list every SSE_POLL_INTERVAL seconds while
+streams are open, instead of every stream polling on its own.
+
+Configuration (environment variables):
+    SSE_BUFFER_SIZE: Events buffered per subscriber (default: 100)
+    SSE_HISTORY_SIZE: Versions kept for resuming (default: 100)
+    SSE_POLL_INTERVAL: Seconds between dataset checks and keep-alives (default: 5)
+    SSE_MAX_DURATION: Seconds before a stream is closed for reconnection (default: 25)
+    SSE_RETRY_MS: Reconnection delay suggested to clients, in ms (default: 1000)
+    SSE_MAX_STREAMS: Open streams per worker, or auto (default: auto)
+"""
+
+import hashlib
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from typing import Callable, Iterator, List, Optional, Tuple
+
+import worker_tuning
+
+logger = logging.getLogger(__name__)
+
+SSE_BUFFER_SIZE = int(os.environ.get('SSE_BUFFER_SIZE', '100'))
+SSE_HISTORY_SIZE = int(os.environ.get('SSE_HISTORY_SIZE', '100'))
+SSE_POLL_INTERVAL = float(os.environ.get('SSE_POLL_INTERVAL', '5'))
+SSE_MAX_DURATION = float(os.environ.get('SSE_MAX_DURATION', '25'))
+SSE_RETRY_MS = int(os.environ.get('SSE_RETRY_MS', '1000'))
+SSE_MAX_STREAMS = os.environ.get('SSE_MAX_STREAMS', 'auto').lower()
+
+# Stream limit outside gunicorn (development server, tests)
+DEFAULT_MAX_STREAMS = 8
+
+
+class TooManyStreams(Exception):
+    """Raised when a worker already has its limit of open streams"""
+
+
+def stream_limit(worker_class: Optional[str] = None, threads: int = 1) -> Optional[int]:
+    """
+    Open streams to accept in a worker.
+
+    Args:
+        worker_class (str): The gunicorn worker class, or None outside gunicorn
+        threads (int): Threads per worker
+
+    Returns:
+        int: The limit, or None for no limit
+    """
+    if SSE_MAX_STREAMS != 'auto':
+        return int(SSE_MAX_STREAMS)
+    if worker_class is None:
+        return DEFAULT_MAX_STREAMS
+    request_threads = worker_tuning.request_threads(worker_class, threads)
+    # Async workers are not bounded by threads
+    return None if request_threads is None else request_threads // 2
+
+
+# Set for each worker in post_fork
+max_streams = stream_limit()
+
+
+class Subscriber:
+    """A stream's bounded event buffer."""
+
+    def __init__(self, buffer_size: int):
+        self.events: queue.Queue = queue.Queue(maxsize=buffer_size)
+        self.overflowed = False
+
+
+class ChangeFeed:
+    """
+    Diffs successive character lists and fans the changes out to subscribers.
+
+    Args:
+        history_size (int): Versions kept for resuming with Last-Event-ID
+        buffer_size (int): Events buffered per subscriber
+        stream_limit (int): Subscribers accepted at once (default: this worker's max_streams)
+    """
+
+    def __init__(self, history_size: int = SSE_HISTORY_SIZE, buffer_size: int = SSE_BUFFER_SIZE,
+                 stream_limit: Optional[int] = None):
+        self.buffer_size = buffer_size
+        self.stream_limit = stream_limit
+        self.version: Optional[str] = None
+        self.source = None
+        self._rows: dict = {}
+        self._history: deque = deque(maxlen=history_size)
+        self._subscribers: List[Subscriber] = []
+        self._lock = threading.Lock()
+        self._refresher_pid: Optional[int] = None
+
+    def update(self, characters: Optional[list]) -> Optional[dict]:
+        """
+        Record a new character list, publishing what changed since the last one.
+
+        Args:
+            characters (list): The list that replaced the cached one
+
+        Returns:
+            dict: The published event, or None if nothing changed
+        """
+        with self._lock:
+            if characters is None or characters is self.source:
+                return None
+            self.source = characters
+            rows = {character.get('id'): tuple(character.values()) for character in characters}
+            if rows == self._rows:
+                return None
+
+            old = self._rows
+            changes = {
+                'added': sorted(character_id for character_id in rows if character_id not in old),
+                'changed': sorted(character_id for character_id, row in rows.items()
+                                  if character_id in old and old[character_id] != row),
+                'removed': sorted(character_id for character_id in old if character_id not in rows),
+            }
+            self._rows = rows
+            previous, self.version = self.version, dataset_version(rows)
+            if previous is None:
+                # The first list has nothing to be compared with
+                self._history.append({'id': self.version, 'event': 'version'})
+                return None
+
+            event = {'id': self.version, 'event': 'changes', 'data': changes}
+            self._history.append(event)
+            for subscriber in self._subscribers:
+                try:
+                    subscriber.events.put_nowait(event)
+                except queue.Full:
+                    subscriber.overflowed = True
+            return event
+
+    def subscribe(self, last_event_id: Optional[str] = None) -> Tuple[Subscriber, Optional[List[dict]]]:
+        """
+        Register a subscriber.
+
+        Args:
+            last_event_id (str): Version the client last saw, if resuming
+
+        Returns:
+            tuple: (subscriber, events since ``last_event_id`` or None if that
+            version is unknown here)
+
+        Raises:
+            TooManyStreams: If the worker already has its limit of subscribers
+        """
+        subscriber = Subscriber(self.buffer_size)
+        limit = self.stream_limit if self.stream_limit is not None else max_streams
+        with self._lock:
+            if limit is not None and len(self._subscribers) >= limit:
+                raise TooManyStreams(f"{len(self._subscribers)} streams are already open in this worker")
+            self._subscribers.append(subscriber)
+            if not last_event_id or last_event_id == self.version:
+                return subscriber, []
+            ids = [event['id'] for event in self._history]
+            if last_event_id not in ids:
+                return subscriber, None
+            return subscriber, list(self._history)[ids.index(last_event_id) + 1:]
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        with self._lock:
+            if subscriber in self._subscribers:
+                self._subscribers.remove(subscriber)
+
+    def ensure_refresher(self, refresh: Callable[[], object], interval: Optional[float] = None) -> None:
+        """
+        Start this process's refresher thread if it is not running yet.
+
+        The thread calls ``refresh`` every interval while there are
+        subscribers, so a new list reaches them through ``update``. Threads
+        do not survive fork(), so it is started by the first stream in each
+        worker.
+
+        Args:
+            refresh (Callable): Picks up a new list (e.g. fetches the cached one)
+            interval (float): Seconds between refreshes (default: SSE_POLL_INTERVAL)
+        """
+        if self._refresher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._refresher_pid == os.getpid():
+                return
+            self._refresher_pid = os.getpid()
+        interval = SSE_POLL_INTERVAL if interval is None else interval
+        threading.Thread(target=self._refresh_loop, args=(refresh, interval),
+                         name='change-feed-refresher', daemon=True).start()
+
+    def _refresh_loop(self, refresh: Callable[[], object], interval: float) -> None:
+        while True:
+            time.sleep(interval)
+            if not self._subscribers:
+                continue
+            try:
+                refresh()
+            except Exception as e:
+                logger.warning("Refreshing the character list for the change feed failed: %s", e)
+
+
+def dataset_version(rows: dict) -> str:
+    """Content hash of a list's rows, identical in every worker"""
+    digest = hashlib.sha1(repr(sorted(rows.items(), key=lambda item: repr(item[0]))).encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+def format_event(event: dict) -> str:
+    """Render an event in the text/event-stream format"""
+    data = json.dumps(event.get('data', {}), sort_keys=True, separators=(',', ':'))
+    return f"id: {event['id']}\nevent: {event['event']}\ndata: {data}\n\n"
+
+
+def stream(feed: ChangeFeed, subscriber: Subscriber, backlog: Optional[List[dict]], last_event_id: Optional[str],
+           poll_interval: Optional[float] = None, max_duration: Optional[float] = None) -> Iterator[str]:
+    """
+    Generate the event stream for one client.
+
+    Args:
+        feed (ChangeFeed): The feed to follow
+        subscriber (Subscriber): The client's subscription, from ``feed.subscribe``
+        backlog (list): Events to replay, from ``feed.subscribe``
+        last_event_id (str): The client's Last-Event-ID, if resuming
+        poll_interval (float): Seconds between keep-alives
+        max_duration (float): Seconds before the stream ends
+
+    Yields:
+        str: Event stream chunks
+    """
+    poll_interval = SSE_POLL_INTERVAL if poll_interval is None else poll_interval
+    max_duration = SSE_MAX_DURATION if max_duration is None else max_duration
+    try:
+        yield f"retry: {SSE_RETRY_MS}\n\n"
+        if backlog is None:
+            yield format_event({'id': feed.version, 'event': 'reset'})
+        elif last_event_id:
+            for event in backlog:
+                yield format_event(event)
+        else:
+            yield format_event({'id': feed.version, 'event': 'version'})
+
+        deadline = time.monotonic() + max_duration
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            if subscriber.overflowed:
+                # Fell behind: drop the buffer and have the client reload
+                while not subscriber.events.empty():
+                    subscriber.events.get_nowait()
+                subscriber.overflowed = False
+                yield format_event({'id': feed.version, 'event': 'reset'})
+                continue
+            try:
+                event = subscriber.events.get(timeout=min(poll_interval, remaining))
+            except queue.Empty:
+                yield ": keep-alive\n\n"
+                continue
+            yield format_event(event)
+    finally:
+        feed.unsubscribe(subscriber)
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+Upstream character list pages and records.
+
+The page fetch and record format shared by the service's crawl and the
+batch exporter. The module does not import the Flask app, so the exporter
+runs without building it.
+
+Configuration (environment variables):
+    API_BASE_URL: Upstream character list URL (default: https://rickandmortyapi.com/api/character)
+"""
+
+import logging
+import os
+
+import upstream
+
+logger = logging.getLogger(__name__)
+
+API_BASE_URL = os.environ.get("API_BASE_URL", "https://rickandmortyapi.com/api/character")
+
+
+def fetch_character_page(url: str) -> dict:
+    """Fetch one page of the upstream character list"""
+    logger.info("Fetching data from: %s", url)
+    return upstream.get(url, 'characters').json()
+
+
+def format_character_detail(character: dict) -> dict:
+    """Extract the detail fields of an upstream character record"""
+    return {
+        'id': character.get('id'),
+        'name': character.get('name'),
+        'status': character.get('status'),
+        'species': character.get('species'),
+        'type': character.get('type'),
+        'gender': character.get('gender'),
+        'origin': character.get('origin', {}).get('name'),
+        'location': character.get('location', {}).get('name'),
+        'image_url': character.get('image'),
+        'episode': character.get('episode', []),
+        'url': character.get('url'),
+        'created': character.get('created')
+    }
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+Batch export of characters to CSV, JSON Lines or Parquet.
+
+The Step 1 workflow without the web service: the character list is crawled
+with the same page fetches as ``fetch_characters`` (pages after the first
+fetched concurrently within the adaptive upstream limit), filtered, and
+streamed to disk page by page in list order.
+
+After every page the output is flushed and a checkpoint records how many
+pages and bytes are complete. An interrupted export run again with the same
+arguments truncates anything written after the checkpoint and resumes with
+the next page instead of restarting. Parquet output is spooled as JSON
+Lines and converted once the crawl is complete (a Parquet file cannot be
+appended to); it needs pyarrow.
+
+Usage:
+    python exporter.py characters.csv
+    python exporter.py characters.jsonl --all --fields id,name,status,species
+    python exporter.py characters.parquet --filter species=Alien
+"""
+
+import argparse
+import csv
+import io
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import character_records
+import upstream
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ('csv', 'jsonl', 'parquet')
+
+# The Step 1 export: living humans from Earth (C-137), name, location and image
+STEP1_FILTERS = {'species': 'Human', 'status': 'Alive', 'origin': 'Earth (C-137)'}
+STEP1_FIELDS = ('name', 'location', 'image_url')
+# CSV header of the Step 1 columns (Name,Location,Image); other fields keep their names
+STEP1_LABELS = {'name': 'Name', 'location': 'Location', 'image_url': 'Image'}
+
+# Concurrent page fetches; the adaptive upstream limit still applies
+EXPORT_WORKERS = int(os.environ.get('EXPORT_WORKERS', '8'))
+
+
+def _load_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        return None
+    return pyarrow
+
+
+def format_for(path: str) -> str:
+    """Output format implied by a file name (CSV unless .jsonl/.ndjson or .parquet)"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension in ('.jsonl', '.ndjson'):
+        return 'jsonl'
+    if extension in ('.parquet', '.pq'):
+        return 'parquet'
+    return 'csv'
+
+
+def encode_rows(rows: List[dict], fields: Sequence[str], fmt: str, header: bool = False) -> bytes:
+    """Encode one page of rows for a CSV or JSON Lines file"""
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator='\n')
+        if header:
+            writer.writerow([STEP1_LABELS.get(field, field) for field in fields])
+        writer.writerows([row.get(field) for field in fields] for row in rows)
+        return buffer.getvalue().encode('utf-8')
+    return b''.join(json.dumps({field: row.get(field) for field in fields}, ensure_ascii=False).encode('utf-8') + b'\n'
+                    for row in rows)
+
+
+class Checkpoint:
+    """
+    Progress of an export, saved next to the output.
+
+    Args:
+        path (str): Checkpoint file
+        settings (dict): Export arguments; a checkpoint saved with different ones is ignored
+    """
+
+    def __init__(self, path: str, settings: dict):
+        self.path = path
+        self.settings = settings
+        self.pages = 0
+        self.offset = 0
+        self.rows = 0
+        self.next_url: Optional[str] = None
+
+    def load(self) -> bool:
+        """Restore saved progress; returns whether there was any to resume"""
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return False
+        except ValueError as e:
+            logger.warning("Ignoring unreadable export checkpoint %s: %s", self.path, e)
+            return False
+        if state.get('settings') != self.settings:
+            logger.warning("Export checkpoint %s was saved with other arguments, starting over", self.path)
+            return False
+        self.pages, self.offset, self.rows = state['pages'], state['offset'], state['rows']
+        self.next_url = state.get('next_url')
+        return self.pages > 0
+
+    def save(self) -> None:
+        """Write the progress atomically"""
+        state = {'settings': self.settings, 'pages': self.pages, 'offset': self.offset,
+                 'rows': self.rows, 'next_url': self.next_url}
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.path)
+
+    def clear(self) -> None:
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def crawl_pages(api_url: str, start: int, next_url: Optional[str], workers: int) -> Iterator[Tuple[dict, Optional[str]]]:
+    """
+    Yield the list pages after the first ``start`` ones, in order.
+
+    The first page is always fetched for its ``info``. The pages are then
+    numbered from it and fetched concurrently; when they cannot be numbered
+    the ``next`` links are followed one by one, from ``next_url`` when
+    resuming.
+
+    Yields:
+        tuple: (page data, URL of the following page)
+    """
+    if start and next_url is None:
+        return
+    first = character_records.fetch_character_page(api_url)
+    urls = upstream.page_urls(first.get('info', {}))
+
+    if urls is None:
+        # Sequential, resuming from the saved next link
+        page = character_records.fetch_character_page(next_url) if start else first
+        while True:
+            following = page.get('info', {}).get('next')
+            yield page, following
+            if not following:
+                return
+            page = character_records.fetch_character_page(following)
+
+    urls = [api_url] + urls
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        pages = executor.map(character_records.fetch_character_page, urls[max(start, 1):])
+        if start == 0:
+            yield first, urls[1] if len(urls) > 1 else None
+        for index, page in enumerate(pages, start=max(start, 1)):
+            yield page, urls[index + 1] if index + 1 < len(urls) else None
+
+
+def export(api_url: str, output: str, fmt: Optional[str] = None, filters: Optional[Dict[str, str]] = None,
+           fields: Sequence[str] = STEP1_FIELDS, workers: int = EXPORT_WORKERS,
+           checkpoint_path: Optional[str] = None) -> dict:
+    """
+    Export the filtered character list, resuming an interrupted export.
+
+    Args:
+        api_url (str): Upstream character list URL
+        output (str): Output file
+        fmt (str): csv, jsonl or parquet (default: from the file name)
+        filters (dict): Field -> required value (default: the Step 1 filters; {} exports everything)
+        fields (Sequence[str]): Columns, from the /characters list fields
+        workers (int): Concurrent page fetches
+        checkpoint_path (str): Progress file (default: ``<output>.checkpoint``)
+
+    Returns:
+        dict: ``rows`` and ``pages`` exported, and ``resumed_after`` (pages skipped)
+    """
+    fmt = fmt or format_for(output)
+    filters = STEP1_FILTERS if filters is None else filters
+    pyarrow = None
+    if fmt == 'parquet':
+        pyarrow = _load_pyarrow()
+        if pyarrow is None:
+            raise RuntimeError("Parquet output needs pyarrow (pip install pyarrow)")
+
+    spool = f"{output}.jsonl" if fmt == 'parquet' else output
+    spool_format = 'jsonl' if fmt == 'parquet' else fmt
+    settings = {'api_url': api_url, 'format': fmt, 'filters': filters, 'fields': list(fields)}
+    checkpoint = Checkpoint(checkpoint_path or f"{output}.checkpoint", settings)
+    resumed = checkpoint.load() and os.path.exists(spool)
+    if not resumed:
+        checkpoint = Checkpoint(checkpoint.path, settings)
+    resumed_after = checkpoint.pages
+
+    with open(spool, 'r+b' if resumed else 'wb') as f:
+        # Drop whatever was written after the last checkpoint
+        f.truncate(checkpoint.offset)
+        f.seek(checkpoint.offset)
+        for page, next_url in crawl_pages(api_url, checkpoint.pages, checkpoint.next_url, workers):
+            rows = []
+            for character in page.get('results', []):
+                detail = character_records.format_character_detail(character)
+                if all(detail.get(field) == value for field, value in filters.items()):
+                    rows.append(detail)
+            f.write(encode_rows(rows, fields, spool_format, header=checkpoint.pages == 0))
+            f.flush()
+            os.fsync(f.fileno())
+
+            checkpoint.pages += 1
+            checkpoint.rows += len(rows)
+            checkpoint.offset = f.tell()
+            checkpoint.next_url = next_url
+            checkpoint.save()
+
+    if pyarrow is not None:
+        with open(spool, 'rb') as f:
+            records = [json.loads(line) for line in f]
+        # Column types are inferred from the rows; an empty export has string columns
+        schema = None if records else pyarrow.schema([(field, pyarrow.string()) for field in fields])
+        table = pyarrow.Table.from_pylist(records, schema=schema)
+        pyarrow.parquet.write_table(table, output)
+        os.remove(spool)
+
+    checkpoint.clear()
+    return {'rows': checkpoint.rows, 'pages': checkpoint.pages, 'resumed_after': resumed_after}
+
+
+def parse_filters(values: Sequence[str]) -> Dict[str, str]:
+    filters = {}
+    for value in values:
+        field, sep, required = value.partition('=')
+        if not sep:
+            raise argparse.ArgumentTypeError(f"Filters are field=value, got {value!r}")
+        filters[field] = required
+    return filters
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Export characters to CSV, JSON Lines or Parquet')
+    parser.add_argument('output', help='Output file (.csv, .jsonl or .parquet)')
+    parser.add_argument('--format', choices=FORMATS, help='Output format (default: from the file name)')
+    parser.add_argument('--api-url', default=character_records.API_BASE_URL)
+    parser.add_argument('--fields', default=','.join(STEP1_FIELDS),
+                        help='Comma-separated columns (id, name, status, species, type, gender, '
+                             'origin, location, image_url, url, created)')
+    parser.add_argument('--filter', action='append', default=[], metavar='FIELD=VALUE',
+                        help='Required field value (repeatable; default: the Step 1 filters)')
+    parser.add_argument('--all', action='store_true', help='Export every character')
+    parser.add_argument('--workers', type=int, default=EXPORT_WORKERS, help='Concurrent page fetches')
+    parser.add_argument('--checkpoint', help='Progress file (default: <output>.checkpoint)')
+    args = parser.parse_args(argv)
+
+    try:
+        filters = {} if args.all else (parse_filters(args.filter) if args.filter else None)
+    except argparse.ArgumentTypeError as e:
+        parser.error(str(e))
+    fmt = args.format or format_for(args.output)
+    if fmt == 'parquet' and _load_pyarrow() is None:
+        parser.error("Parquet output needs pyarrow (pip install pyarrow)")
+
+    result = export(args.api_url, args.output, fmt, filters, [field.strip() for field in args.fields.split(',')],
+                    args.workers, args.checkpoint)
+    resumed = f" (resumed after page {result['resumed_after']})" if result['resumed_after'] else ''
+    print(f"Exported {result['rows']} characters from {result['pages']} pages to {args.output}{resumed}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Precomputed facet counts over the character list.
+
+``FacetIndex`` counts characters by status, species, origin and location
+for every combination of facet filters, so a query such as "species counts
+among alive characters from Earth (C-137)" is a dictionary lookup rather
+than a scan of the list. The index follows the cached list: when a new
+crawl replaces it, only the characters whose facet values changed are
+subtracted and added again.
+"""
+
+import itertools
+import threading
+from collections import Counter
+from operator import itemgetter
+from typing import Dict, Hashable, List, Optional, Sequence, Tuple
+
+FACET_FIELDS = ('status', 'species', 'origin', 'location')
+
+# Facet value reported for characters without one
+UNKNOWN = 'unknown'
+
+
+class FacetIndex:
+    """
+    Facet counts for every combination of facet filters.
+
+    With F facets each character is counted under 2**F filter combinations,
+    which keeps refreshes linear in the number of changed characters and
+    queries independent of the number of characters.
+
+    Args:
+        fields (Sequence[str]): Character fields to count
+    """
+
+    def __init__(self, fields: Sequence[str] = FACET_FIELDS):
+        self.fields = tuple(fields)
+        self.source = None
+        # Filter key -> (matching characters, {field: {value: count}})
+        self._counts: Dict[tuple, Tuple[int, Dict[str, Dict[str, int]]]] = {}
+        self._rows: Dict[Hashable, tuple] = {}
+        self._subsets = [
+            subset for size in range(len(self.fields) + 1)
+            for subset in itertools.combinations(range(len(self.fields)), size)
+        ]
+        getter = itemgetter(*self.fields)
+        self._getter = getter if len(self.fields) > 1 else lambda character: (getter(character),)
+        self._lock = threading.Lock()
+
+    def _values(self, character: dict) -> tuple:
+        try:
+            values = self._getter(character)
+        except KeyError:
+            values = tuple(character.get(field) for field in self.fields)
+        if None in values:
+            values = tuple(UNKNOWN if value is None else value for value in values)
+        return values
+
+    def _apply(self, values: tuple, delta: int) -> None:
+        """Add (delta > 0) or remove (delta < 0) characters with the same values"""
+        for subset in self._subsets:
+            key = tuple((self.fields[i], values[i]) for i in subset)
+            total, facets = self._counts.get(key, (0, None))
+            total += delta
+            if total <= 0:
+                self._counts.pop(key, None)
+                continue
+            if facets is None:
+                facets = {field: {} for field in self.fields}
+            for field, value in zip(self.fields, values):
+                counts = facets[field]
+                count = counts.get(value, 0) + delta
+                if count > 0:
+                    counts[value] = count
+                else:
+                    counts.pop(value, None)
+            self._counts[key] = (total, facets)
+
+    def refresh(self, characters: Optional[List[dict]]) -> None:
+        """
+        Bring the index in line with a character list.
+
+        A no-op for the list the index was last refreshed with; otherwise
+        characters that were removed or whose facet values changed are
+        subtracted, and new or changed ones added.
+
+        Args:
+            characters (list): The current character list (None clears the index)
+        """
+        with self._lock:
+            if characters is self.source:
+                return
+            values_of = self._values
+            rows = {character.get('id'): values_of(character) for character in characters or ()}
+            if rows != self._rows:
+                # Characters with the same values are applied together
+                changes = Counter()
+                for character_id, values in self._rows.items():
+                    if rows.get(character_id) != values:
+                        changes[values] -= 1
+                for character_id, values in rows.items():
+                    if self._rows.get(character_id) != values:
+                        changes[values] += 1
+                for values, delta in changes.items():
+                    if delta:
+                        self._apply(values, delta)
+            self._rows = rows
+            self.source = characters
+
+    def query(self, filters: Optional[Dict[str, str]] = None) -> dict:
+        """
+        Facet counts among the characters matching ``filters``.
+
+        Args:
+            filters (dict): Facet field -> required value; other keys are ignored
+
+        Returns:
+            dict: ``count`` of matching characters and ``facets`` counts by field
+        """
+        filters = filters or {}
+        key = tuple((field, filters[field]) for field in self.fields if field in filters)
+        with self._lock:
+            total, facets = self._counts.get(key, (0, None))
+            return {
+                'count': total,
+                'facets': {field: dict(facets[field]) if facets else {} for field in self.fields},
+            }
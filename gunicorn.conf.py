@@ -0,0 +1,104 @@
+"""
+Gunicorn configuration for the Rick & Morty API.
+
+Gunicorn picks this file up automatically from the working directory, or it
+can be passed explicitly with ``--config=gunicorn.conf.py``.
+"""
+
+import gc
+import os
+import shutil
+
+import worker_tuning
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+
+
+def reset_multiproc_dir():
+    """
+    Start every deployment with an empty Prometheus multiprocess directory.
+
+    Runs when gunicorn loads this file, before a preloaded app creates its
+    metric files there (on_starting would be too late, and would delete
+    files the master already has open). gunicorn loads the file again on
+    HUP, while the workers are still writing, so only the first load resets.
+    """
+    multiproc_dir = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if not multiproc_dir or os.environ.get("PROMETHEUS_MULTIPROC_RESET") == str(os.getpid()):
+        return
+    shutil.rmtree(multiproc_dir, ignore_errors=True)
+    os.makedirs(multiproc_dir, exist_ok=True)
+    os.environ["PROMETHEUS_MULTIPROC_RESET"] = str(os.getpid())
+
+
+reset_multiproc_dir()
+
+# Import the app and load the character data once in the master, so that
+# the workers share those pages copy-on-write instead of each building a copy
+preload_app = os.environ.get("PRELOAD_APP", "false").lower() == "true"
+
+# Worker class, count and threads follow the container's CPU and memory
+# limits and SERVING_MODE (WEB_CONCURRENCY etc. override them)
+worker_model = worker_tuning.worker_model(preload=preload_app)
+worker_class = worker_model.worker_class
+workers = worker_model.workers
+threads = worker_model.threads
+
+if preload_app:
+    # No collections until the dataset is frozen: they would leave freed
+    # holes between the objects the workers are going to share
+    gc.disable()
+
+
+def on_starting(server):
+    """Log the worker model and start every deployment with an empty cache command log"""
+    server.log.info("Worker model: %s", worker_model.describe())
+
+    # Cache commands from a previous deployment must not be replayed
+    command_log = os.environ.get("CACHE_COMMAND_LOG")
+    if command_log and os.path.exists(command_log):
+        os.remove(command_log)
+
+
+def when_ready(server):
+    """Load the dataset in the master and freeze it before the workers are forked"""
+    if not server.cfg.preload_app:
+        return
+
+    import rick_morty_api
+    try:
+        loaded = rick_morty_api.load_dataset()
+    except Exception:
+        server.log.exception("Preloading the character data failed")
+        loaded = False
+    if not loaded:
+        server.log.warning("Could not preload the character data; workers will fetch it on demand")
+
+    # Frozen objects are never visited by the collector, so collections in
+    # the workers do not write to (and copy) the shared pages
+    gc.freeze()
+    gc.enable()
+
+
+def post_fork(server, worker):
+    """Set up the per-worker state that must not be inherited from the master"""
+    import admission
+    admission.controller.resize(admission.inflight_limit(server.cfg.worker_class_str, server.cfg.threads))
+
+    import change_feed
+    change_feed.max_streams = change_feed.stream_limit(server.cfg.worker_class_str, server.cfg.threads)
+
+    # With preloading the command log was opened in the master, at import
+    import cache_admin
+    cache_admin.command_log.reset()
+
+    import prometheus_metrics
+    prometheus_metrics.record_worker_model(worker_model._replace(
+        worker_class=server.cfg.worker_class_str, workers=server.cfg.workers, threads=server.cfg.threads))
+
+
+def child_exit(server, worker):
+    """Stop reporting the live gauges of a worker that has exited"""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
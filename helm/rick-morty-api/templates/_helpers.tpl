@@ -61,3 +61,23 @@ Create the name of the service account to use
 {{- end }}
 {{- end }}
 
+{{/*
+nginx proxy-cache directives for the ingress. Freshness comes from the
+app's Cache-Control headers; responses without them are not cached.
+The cache zone itself is declared in the controller's http-snippet.
+*/}}
+{{- define "rick-morty-api.proxyCacheSnippet" -}}
+proxy_cache {{ .Values.ingress.proxyCache.zone }};
+proxy_cache_methods GET HEAD;
+proxy_cache_lock on;
+proxy_cache_revalidate on;
+proxy_cache_background_update on;
+proxy_cache_use_stale error timeout updating http_500 http_502 http_503 http_504;
+add_header X-Proxy-Cache $upstream_cache_status always;
+{{ end }}
+{{/*
+Time the ingress received the request, for the app's queue-time shedding.
+*/}}
+{{- define "rick-morty-api.requestStartSnippet" -}}
+proxy_set_header X-Request-Start "t=${msec}";
+{{ end }}
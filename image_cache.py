@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+On-disk cache of character images and their thumbnails.
+
+``/characters/<id>/image`` serves avatars from IMAGE_CACHE_DIR instead of
+sending clients to the upstream avatar host. A miss downloads the original
+through ``upstream.get`` with the pooled ``upstream.session`` (so the
+adaptive limit, Retry-After handling and record/replay apply) and, when a size is requested, stores a JPEG thumbnail
+made with Pillow next to it. Files are sent with ``send_file``, which hands
+them to the WSGI server's file wrapper (sendfile under gunicorn).
+
+The directory is bounded to IMAGE_CACHE_MAX_BYTES and shared by the
+workers: a hit touches the file's mtime, and a write that takes the
+directory over the bound removes the least recently used files. ETags are
+content hashes, so they are the same in every worker and after restarts.
+
+Configuration (environment variables):
+    IMAGE_CACHE_DIR: Cache directory (default: <tmp>/rick-morty-images)
+    IMAGE_CACHE_MAX_BYTES: Size bound of the directory (default: 104857600)
+    IMAGE_THUMBNAIL_SIZES: Comma-separated thumbnail sizes allowed (default: 64,128,256)
+    IMAGE_MAX_AGE: Cache-Control max-age of image responses in seconds (default: 86400)
+"""
+
+import hashlib
+import io
+import os
+import tempfile
+import threading
+import warnings
+from typing import Callable, Dict, NamedTuple, Optional, Tuple
+
+import admission
+import upstream
+
+IMAGE_CACHE_DIR = os.environ.get('IMAGE_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'rick-morty-images'))
+IMAGE_CACHE_MAX_BYTES = int(os.environ.get('IMAGE_CACHE_MAX_BYTES', str(100 * 1024 * 1024)))
+IMAGE_THUMBNAIL_SIZES = tuple(int(size) for size in os.environ.get('IMAGE_THUMBNAIL_SIZES', '64,128,256').split(',')
+                              if size.strip())
+IMAGE_MAX_AGE = int(os.environ.get('IMAGE_MAX_AGE', '86400'))
+
+THUMBNAIL_QUALITY = 85
+
+# Leading bytes of the image formats the upstream serves
+SIGNATURES = (
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF8', 'image/gif'),
+)
+
+
+class ImageError(Exception):
+    """Raised when an upstream image cannot be decoded for a thumbnail"""
+
+
+class CachedFile(NamedTuple):
+    path: str
+    etag: str
+    mimetype: str
+
+
+def _load_pillow():
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    # Images just above MAX_IMAGE_PIXELS only warn; reject them like larger ones
+    warnings.filterwarnings('error', category=Image.DecompressionBombWarning)
+    return Image
+
+
+def thumbnails_available() -> bool:
+    return _load_pillow() is not None
+
+
+def sniff_mimetype(data: bytes) -> str:
+    """Content type of an image from its leading bytes"""
+    for signature, mimetype in SIGNATURES:
+        if data.startswith(signature):
+            return mimetype
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    return 'application/octet-stream'
+
+
+def make_thumbnail(data: bytes, size: int) -> bytes:
+    """
+    Shrink an image to fit in size x size pixels, keeping its aspect ratio.
+
+    Raises:
+        ImageError: If the image cannot be decoded
+    """
+    Image = _load_pillow()
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image.thumbnail((size, size))
+            if image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+            buffer = io.BytesIO()
+            image.save(buffer, format='JPEG', quality=THUMBNAIL_QUALITY)
+    except (OSError, Image.DecompressionBombError, Image.DecompressionBombWarning) as e:
+        raise ImageError(f"Cannot make a thumbnail: {e}") from e
+    return buffer.getvalue()
+
+
+class DiskLRU:
+    """
+    Size-bounded directory of files keyed by string, evicted least recently used first.
+
+    Args:
+        directory (str): Where the files are kept (created if missing)
+        max_bytes (int): Size bound of the directory
+    """
+
+    def __init__(self, directory: str = IMAGE_CACHE_DIR, max_bytes: int = IMAGE_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # File name -> (etag, mimetype), so hits do not read the file
+        self._meta: Dict[str, Tuple[str, str]] = {}
+        self._lock = threading.Lock()
+
+    def _name(self, key: str) -> str:
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[CachedFile]:
+        """The cached file for a key, marked as recently used, or None"""
+        name = self._name(key)
+        path = os.path.join(self.directory, name)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            # Never written, or evicted by another worker
+            self._meta.pop(name, None)
+            return None
+        meta = self._meta.get(name)
+        if meta is None:
+            # Written by another worker or before a restart
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+            except FileNotFoundError:
+                return None
+            meta = self._meta[name] = (hashlib.sha1(data).hexdigest(), sniff_mimetype(data))
+        return CachedFile(path, *meta)
+
+    def put(self, key: str, data: bytes, mimetype: Optional[str] = None) -> CachedFile:
+        """Store a file atomically, then evict down to the size bound"""
+        name = self._name(key)
+        path = os.path.join(self.directory, name)
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        meta = self._meta[name] = (hashlib.sha1(data).hexdigest(), mimetype or sniff_mimetype(data))
+        self.evict(keep=path)
+        return CachedFile(path, *meta)
+
+    def evict(self, keep: Optional[str] = None) -> int:
+        """
+        Remove least recently used files until the directory fits in max_bytes.
+
+        Args:
+            keep (str): A file that is never removed (the one just written)
+
+        Returns:
+            int: Number of files removed
+        """
+        with self._lock:
+            files = []
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    if entry.name.endswith('.tmp') or not entry.is_file():
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    files.append((stat.st_mtime, stat.st_size, entry.path, entry.name))
+            total = sum(size for _, size, _, _ in files)
+            removed = 0
+            for _, size, path, name in sorted(files):
+                if total <= self.max_bytes:
+                    break
+                if path == keep:
+                    continue
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                self._meta.pop(name, None)
+                total -= size
+                removed += 1
+            return removed
+
+
+disk_cache = DiskLRU()
+
+
+def fetch(character_id: int, size: Optional[int], image_url: Callable[[], Optional[str]]) -> Optional[Tuple[CachedFile, bool]]:
+    """
+    A character's image or thumbnail, from the disk cache or the upstream.
+
+    Args:
+        character_id (int): The character
+        size (int): Thumbnail size, or None for the original
+        image_url (Callable): Returns the character's image URL (None if there is no such character)
+
+    Returns:
+        tuple: (cached file, whether it was a cache hit), or None without an image
+
+    Raises:
+        requests.exceptions.RequestException: If the upstream image cannot be fetched
+        ImageError: If the upstream image cannot be decoded for a thumbnail
+    """
+    key = f"{character_id}/{size or 'original'}"
+    cached = disk_cache.get(key)
+    if cached is not None:
+        return cached, True
+
+    original = disk_cache.get(f"{character_id}/original")
+    data = None
+    if original is not None:
+        try:
+            with open(original.path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            # Evicted by another worker since the lookup
+            pass
+    if data is None:
+        url = image_url()
+        if not url:
+            return None
+        with admission.controller.upstream_slot():
+            data = upstream.get(url, 'image', session=upstream.session).content
+        original = disk_cache.put(f"{character_id}/original", data)
+
+    if size is None:
+        return original, False
+    return disk_cache.put(key, make_thumbnail(data, size), 'image/jpeg'), False
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Logging setup for the Rick and Morty API.
+
+Request threads never touch log I/O: records go onto a bounded in-memory
+queue and a listener thread formats and writes them. Records are queued
+unformatted (the stdlib QueueHandler formats them in the calling thread),
+so callers should log with lazy %-style arguments, and messages below the
+configured level cost no more than a level check.
+
+Configuration (environment variables):
+    LOG_LEVEL: Minimum level (default: INFO)
+    LOG_FORMAT: json (default) or text
+    LOG_ASYNC: Write logs from a background thread (default: true)
+    LOG_QUEUE_SIZE: Records buffered before new ones are dropped (default: 10000)
+    LOG_HIT_SAMPLE_RATE: Fraction of high-volume cache-hit messages to log (default: 0.01)
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from typing import Optional
+
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json').lower()
+LOG_ASYNC = os.environ.get('LOG_ASYNC', 'true').lower() == 'true'
+LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', '10000'))
+LOG_HIT_SAMPLE_RATE = float(os.environ.get('LOG_HIT_SAMPLE_RATE', '0.01'))
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Attributes every LogRecord has; anything else was passed via extra=
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """Render records as one JSON object per line, including extra= fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'pid': record.process,
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+    def formatTime(self, record, datefmt=None):
+        return super().formatTime(record, '%Y-%m-%dT%H:%M:%S') + f".{int(record.msecs):03d}Z"
+
+    converter = time.gmtime
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that leaves formatting to the listener thread and drops
+    records instead of blocking when the queue is full.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional[DeferredQueueHandler] = None
+_configured = False
+_lock = threading.Lock()
+
+
+def _output_handler() -> logging.Handler:
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(JsonFormatter() if LOG_FORMAT == 'json' else logging.Formatter(TEXT_FORMAT))
+    return handler
+
+
+def _start_listener(output: logging.Handler) -> None:
+    """(Re)create the queue and listener thread feeding ``output``"""
+    global _listener
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    _queue_handler.queue = log_queue
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+
+
+def _restart_after_fork() -> None:
+    # Threads do not survive fork(): a worker forked from a master that
+    # already configured logging needs its own queue and listener.
+    if _listener is not None:
+        _start_listener(_listener.handlers[0])
+
+
+def configure_logging() -> None:
+    """Install the configured handlers on the root logger (idempotent)"""
+    global _queue_handler, _configured
+    with _lock:
+        if _configured:
+            return
+        _configured = True
+
+        root = logging.getLogger()
+        root.setLevel(LOG_LEVEL)
+        output = _output_handler()
+        if not LOG_ASYNC:
+            root.addHandler(output)
+            return
+
+        _queue_handler = DeferredQueueHandler(None)
+        _start_listener(output)
+        root.addHandler(_queue_handler)
+        os.register_at_fork(after_in_child=_restart_after_fork)
+        atexit.register(_stop)
+
+
+def _stop() -> None:
+    if _listener is not None and _listener._thread is not None:
+        _listener.stop()
+
+
+def flush() -> None:
+    """Write out every record queued so far"""
+    if _listener is not None:
+        _stop()
+        _listener.start()
+
+
+def sample_hit() -> bool:
+    """Whether to log this occurrence of a high-volume (cache hit) message"""
+    return LOG_HIT_SAMPLE_RATE >= 1 or (LOG_HIT_SAMPLE_RATE > 0 and random.random() < LOG_HIT_SAMPLE_RATE)
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Popularity tracking for character ids.
+
+A count-min sketch estimates how often each id is requested, in constant
+memory, with TinyLFU-style aging so that popularity follows current
+traffic. The estimates drive the detail cache:
+
+- admission: once the cache is full, a new id only replaces an entry that
+  is requested less often (expired entries are always replaced first);
+- retention: the refresher re-fetches the most requested ids before
+  their entries expire, so hot characters never miss.
+
+Configuration (environment variables):
+    POPULARITY_SKETCH_WIDTH: Counters per sketch row (default: 4096)
+    POPULARITY_SKETCH_DEPTH: Sketch rows (default: 4)
+    POPULARITY_HOT_IDS: Most requested ids kept warm by the refresher (default: 50)
+    HOT_REFRESH_INTERVAL: Seconds between refresher runs, 0 disables it (default: 30)
+"""
+
+import logging
+import os
+import random
+import threading
+import time
+from typing import Callable, Dict, Hashable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+POPULARITY_SKETCH_WIDTH = int(os.environ.get('POPULARITY_SKETCH_WIDTH', '4096'))
+POPULARITY_SKETCH_DEPTH = int(os.environ.get('POPULARITY_SKETCH_DEPTH', '4'))
+POPULARITY_HOT_IDS = int(os.environ.get('POPULARITY_HOT_IDS', '50'))
+HOT_REFRESH_INTERVAL = float(os.environ.get('HOT_REFRESH_INTERVAL', '30'))
+
+_PRIME = (1 << 61) - 1
+EVICTION_SAMPLE_SIZE = 8
+
+
+class FrequencySketch:
+    """
+    Count-min sketch with periodic halving and a small heavy-hitter list.
+
+    Args:
+        width (int): Counters per row
+        depth (int): Number of rows (independent hash functions)
+        hot_size (int): Number of most frequent keys to track
+        sample_size (int): Increments between halvings (default: 10 * width)
+        seed (int): Seed for the hash functions
+    """
+
+    def __init__(self, width: int = POPULARITY_SKETCH_WIDTH, depth: int = POPULARITY_SKETCH_DEPTH,
+                 hot_size: int = POPULARITY_HOT_IDS, sample_size: Optional[int] = None,
+                 seed: Optional[int] = None):
+        rng = random.Random(seed)
+        self.width = width
+        self.hot_size = hot_size
+        self.sample_size = sample_size or 10 * width
+        self._hashes = [(rng.randrange(1, _PRIME), rng.randrange(_PRIME)) for _ in range(depth)]
+        self._rows = [[0] * width for _ in range(depth)]
+        self._additions = 0
+        self._hot: Dict[Hashable, int] = {}
+        self._hot_floor = 0
+        self._lock = threading.Lock()
+
+    def _indexes(self, key: Hashable) -> List[int]:
+        h = hash(key)
+        return [((a * h + b) % _PRIME) % self.width for a, b in self._hashes]
+
+    def record(self, key: Hashable) -> int:
+        """
+        Count one request for ``key``.
+
+        Returns:
+            int: The key's new estimated frequency
+        """
+        indexes = self._indexes(key)
+        with self._lock:
+            # Conservative update: only raise the counters at the current minimum
+            estimate = min(row[i] for row, i in zip(self._rows, indexes)) + 1
+            for row, i in zip(self._rows, indexes):
+                if row[i] < estimate:
+                    row[i] = estimate
+
+            if key in self._hot or len(self._hot) < self.hot_size:
+                self._hot[key] = estimate
+            elif estimate > self._hot_floor:
+                # The floor is a lower bound; check against the actual coldest key
+                coldest = min(self._hot, key=self._hot.get)
+                if estimate > self._hot[coldest]:
+                    del self._hot[coldest]
+                    self._hot[key] = estimate
+                self._hot_floor = min(self._hot.values())
+
+            self._additions += 1
+            if self._additions >= self.sample_size:
+                self._age()
+        return estimate
+
+    def _age(self) -> None:
+        """Halve every counter so that old popularity fades out"""
+        for row in self._rows:
+            for i, count in enumerate(row):
+                if count:
+                    row[i] = count >> 1
+        self._hot = {key: count >> 1 for key, count in self._hot.items() if count > 1}
+        self._hot_floor = min(self._hot.values(), default=0)
+        self._additions //= 2
+
+    def estimate(self, key: Hashable) -> int:
+        """Estimated request count of ``key`` (never an underestimate before aging)"""
+        indexes = self._indexes(key)
+        return min(row[i] for row, i in zip(self._rows, indexes))
+
+    def admit(self, candidate: Hashable, victim: Hashable) -> bool:
+        """Whether ``candidate`` is popular enough to replace ``victim`` in a full cache"""
+        return self.estimate(candidate) > self.estimate(victim)
+
+    def discard(self, key: Hashable) -> None:
+        """Drop ``key`` from the hot keys (e.g. it no longer exists upstream)"""
+        with self._lock:
+            if self._hot.pop(key, None) is not None:
+                self._hot_floor = min(self._hot.values(), default=0)
+
+    def hot_keys(self, limit: Optional[int] = None) -> List[Hashable]:
+        """The most requested keys, most popular first"""
+        with self._lock:
+            ranked = sorted(self._hot, key=self._hot.get, reverse=True)
+        return ranked[:limit] if limit is not None else ranked
+
+
+def choose_victim(entries: dict, sketch: FrequencySketch, ttl: float, now: Optional[float] = None):
+    """
+    Pick the entry to evict from a full cache.
+
+    An expired entry is evicted if one turns up in a random sample of
+    entries; otherwise the least popular entry of the sample.
+
+    Args:
+        entries (dict): Cache entries by key, each with a "timestamp"
+        sketch (FrequencySketch): Popularity estimates
+        ttl (float): Entry time-to-live in seconds
+        now (float): Current time (defaults to time.time())
+
+    Returns:
+        tuple: (victim key or None if the cache is empty, whether it has expired)
+    """
+    keys = list(entries)
+    if not keys:
+        return None, False
+    now = now or time.time()
+    sample = random.sample(keys, min(EVICTION_SAMPLE_SIZE, len(keys)))
+    for key in sample:
+        entry = entries.get(key)
+        if entry is not None and now - entry["timestamp"] >= ttl:
+            return key, True
+    return min(sample, key=sketch.estimate), False
+
+
+class Refresher:
+    """
+    Background thread that keeps the hottest ids warm in each worker.
+
+    Threads do not survive fork(), so the thread is started lazily by the
+    first request each worker process serves.
+
+    Args:
+        interval (float): Seconds between runs (0 disables the refresher)
+        refresh (Callable): Called every interval; does the actual re-fetching
+    """
+
+    def __init__(self, interval: float, refresh: Callable[[], None]):
+        self.interval = interval
+        self.refresh = refresh
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def ensure_started(self) -> None:
+        """Start the refresher thread in this process if it is not running yet"""
+        if self.interval <= 0 or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, name='hot-refresher', daemon=True).start()
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception("Refreshing hot characters failed")
+
+
+sketch = FrequencySketch()
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+On-demand profiling of live requests for the Rick and Morty API.
+
+A profiling session covers a window of the next N requests (or S seconds)
+handled by the worker that started it. Two modes are available:
+
+- ``cprofile``: deterministic profiling of each request with cProfile; the
+  merged stats are returned as a pstats dump (for snakeviz / flameprof) or
+  as a text report.
+- ``sample``: a background thread samples the stacks of the threads that
+  are serving requests; the result is returned in collapsed-stack format,
+  ready for flamegraph.pl or speedscope.
+
+When no session is active the request hooks only check a single attribute,
+so leaving the profiler registered costs next to nothing.
+"""
+
+import io
+import marshal
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import TYPE_CHECKING, Dict, Optional, Tuple
+
+from flask import g, request
+
+# cProfile and pstats are imported when a cprofile session needs them
+if TYPE_CHECKING:
+    import pstats
+
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', 'false').lower() == 'true'
+
+MODES = ('cprofile', 'sample')
+MAX_REQUESTS = 10000
+MAX_SECONDS = 300
+
+
+class ProfilingError(Exception):
+    """Raised when a profiling session cannot be started or read."""
+
+
+class ProfileSession:
+    """State of one profiling window."""
+
+    def __init__(self, mode: str, max_requests: int, seconds: float, interval: float):
+        self.mode = mode
+        self.max_requests = max_requests
+        self.interval = interval
+        self.started_at = time.time()
+        self.deadline = time.monotonic() + seconds
+        self.profiled_requests = 0
+        self.finished = False
+        self.stats: Optional['pstats.Stats'] = None
+        self.samples: Counter = Counter()
+        self.active_threads: Dict[int, int] = {}
+
+    def expired(self) -> bool:
+        return self.profiled_requests >= self.max_requests or time.monotonic() >= self.deadline
+
+    def status(self) -> dict:
+        return {
+            'mode': self.mode,
+            'finished': self.finished,
+            'profiled_requests': self.profiled_requests,
+            'max_requests': self.max_requests,
+            'started_at': self.started_at,
+            'samples': sum(self.samples.values()),
+        }
+
+
+class RequestProfiler:
+    """Profile a window of live requests in the current worker."""
+
+    def __init__(self):
+        self.session: Optional[ProfileSession] = None
+        self._lock = threading.Lock()
+
+    def start(self, mode: str = 'cprofile', max_requests: int = 100,
+              seconds: float = 60, interval: float = 0.005) -> ProfileSession:
+        """
+        Begin a new profiling window, replacing any previous results.
+
+        Args:
+            mode (str): 'cprofile' or 'sample'
+            max_requests (int): Stop after this many profiled requests
+            seconds (float): Stop after this many seconds
+            interval (float): Sampling interval in seconds ('sample' mode)
+
+        Returns:
+            ProfileSession: The new session
+
+        Raises:
+            ValueError: If a parameter is out of range
+            ProfilingError: If a session is already running
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unknown profiling mode '{mode}', expected one of {', '.join(MODES)}")
+        if not 0 < max_requests <= MAX_REQUESTS:
+            raise ValueError(f"requests must be between 1 and {MAX_REQUESTS}")
+        if not 0 < seconds <= MAX_SECONDS:
+            raise ValueError(f"seconds must be between 0 and {MAX_SECONDS}")
+        if not 0.001 <= interval <= 1:
+            raise ValueError("interval must be between 0.001 and 1 second")
+
+        with self._lock:
+            if self.session is not None and not self.session.finished:
+                raise ProfilingError("A profiling session is already running")
+            session = ProfileSession(mode, max_requests, seconds, interval)
+            self.session = session
+
+        if mode == 'sample':
+            threading.Thread(target=self._sample, args=(session,),
+                             name='profile-sampler', daemon=True).start()
+        return session
+
+    def before_request(self) -> None:
+        session = self.session
+        if session is None or session.finished:
+            return
+        if session.expired():
+            self._finish(session)
+            return
+
+        if session.mode == 'cprofile':
+            import cProfile
+            profile = cProfile.Profile()
+            g.request_profile = (session, profile)
+            profile.enable()
+        else:
+            ident = threading.get_ident()
+            with self._lock:
+                session.active_threads[ident] = session.active_threads.get(ident, 0) + 1
+            g.request_profile = (session, ident)
+
+    def after_request(self) -> None:
+        entry = g.pop('request_profile', None)
+        if entry is None:
+            return
+
+        session, handle = entry
+        if session.mode == 'cprofile':
+            handle.disable()
+        with self._lock:
+            if session.mode == 'cprofile':
+                if session.stats is None:
+                    import pstats
+                    session.stats = pstats.Stats(handle)
+                else:
+                    session.stats.add(handle)
+            else:
+                remaining = session.active_threads.get(handle, 1) - 1
+                if remaining:
+                    session.active_threads[handle] = remaining
+                else:
+                    session.active_threads.pop(handle, None)
+            session.profiled_requests += 1
+        if session.expired():
+            self._finish(session)
+
+    def results(self, output_format: str) -> Tuple[bytes, str]:
+        """
+        Render the results of the latest session.
+
+        Args:
+            output_format (str): 'pstats' or 'text' for cprofile sessions,
+                'collapsed' for sample sessions
+
+        Returns:
+            tuple: Response body and its mimetype
+        """
+        session = self.session
+        if session is None:
+            raise ProfilingError("No profiling session has been started")
+        if not session.finished and session.expired():
+            self._finish(session)
+
+        with self._lock:
+            if session.mode == 'cprofile':
+                if session.stats is None:
+                    raise ProfilingError("No requests have been profiled yet")
+                if output_format == 'pstats':
+                    return marshal.dumps(session.stats.stats), 'application/octet-stream'
+                if output_format == 'text':
+                    import pstats
+                    stream = io.StringIO()
+                    stats = pstats.Stats(stream=stream)
+                    stats.add(session.stats)
+                    stats.sort_stats('cumulative').print_stats(50)
+                    return stream.getvalue().encode('utf-8'), 'text/plain'
+            elif output_format == 'collapsed':
+                lines = (f"{stack} {count}" for stack, count in session.samples.most_common())
+                return '\n'.join(lines).encode('utf-8'), 'text/plain'
+
+        raise ProfilingError(f"Format '{output_format}' is not available for {session.mode} sessions")
+
+    def _finish(self, session: ProfileSession) -> None:
+        with self._lock:
+            session.finished = True
+            session.active_threads.clear()
+
+    def _sample(self, session: ProfileSession) -> None:
+        sampler_ident = threading.get_ident()
+        while not session.finished:
+            if session.expired():
+                self._finish(session)
+                break
+            with self._lock:
+                idents = [ident for ident in session.active_threads if ident != sampler_ident]
+            if idents:
+                frames = sys._current_frames()
+                for ident in idents:
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        session.samples[_collapse(frame)] += 1
+            time.sleep(session.interval)
+
+
+def _collapse(frame) -> str:
+    """Render a stack as 'outer;...;inner' with module:function entries"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        module = frame.f_globals.get('__name__', '?')
+        names.append(f"{module}:{code.co_name}")
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+profiler = RequestProfiler()
+
+
+def init_profiling(app) -> None:
+    """
+    Register the request hooks that feed the profiler.
+
+    Args:
+        app: The Flask application instance
+    """
+    @app.before_request
+    def start_request_profile():
+        # Leave the admin endpoints themselves out of the profile
+        if profiler.session is not None and not request.path.startswith('/admin/'):
+            profiler.before_request()
+
+    @app.teardown_request
+    def finish_request_profile(exc):
+        if profiler.session is not None:
+            profiler.after_request()
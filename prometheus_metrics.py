@@ -7,11 +7,17 @@ Rick and Morty API wrapper, including request counts, response times,
 cache statistics, and rate limiting information.
 """
 
+import logging
+import os
 import time
-from typing import Callable, Any, Dict, Optional
+from contextlib import contextmanager
+from typing import Callable, Any, Dict, Iterator, Optional
 from functools import wraps
+from flask import g, request
 from prometheus_client import Counter, Histogram, Gauge, Summary
 
+logger = logging.getLogger(__name__)
+
 # Request metrics
 REQUEST_COUNT = Counter(
     'rickmorty_requests_total',
@@ -42,18 +48,56 @@ CACHE_MISS_COUNT = Counter(
 CACHE_SIZE = Gauge(
     'rickmorty_cache_size',
     'Current size of the cache',
-    ['endpoint']
+    ['endpoint'],
+    multiprocess_mode='livemax'
+)
+
+CACHE_EVICTIONS = Counter(
+    'rickmorty_cache_evictions_total',
+    'Cache entries evicted, or new entries rejected, when the cache is full',
+    ['endpoint', 'reason']
+)
+
+# Upstream (rickandmortyapi.com) metrics, timed separately from handler time
+UPSTREAM_LATENCY = Histogram(
+    'rickmorty_upstream_request_duration_seconds',
+    'Time spent waiting on the upstream Rick and Morty API',
+    ['endpoint', 'outcome'],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+
+# Admission control metrics
+UPSTREAM_INFLIGHT = Gauge(
+    'rickmorty_upstream_inflight_requests',
+    'Upstream-bound requests currently admitted',
+    multiprocess_mode='livesum'
+)
+
+LOAD_SHED_COUNT = Counter(
+    'rickmorty_load_shed_total',
+    'Upstream-bound requests rejected by admission control',
+    ['reason']
 )
 
 # Rate limit metrics
 RATE_LIMIT_REMAINING = Gauge(
     'rickmorty_rate_limit_remaining',
     'Remaining requests before rate limit is reached',
+    multiprocess_mode='livemin'
 )
 
 RATE_LIMIT_RESET = Gauge(
     'rickmorty_rate_limit_reset_seconds',
     'Time in seconds until the rate limit resets',
+    multiprocess_mode='livemax'
+)
+
+# Gunicorn worker model, set once in each worker
+WORKER_MODEL = Gauge(
+    'rickmorty_worker_model',
+    'Gunicorn worker settings and the container resources they were derived from',
+    ['setting', 'worker_class', 'serving_mode'],
+    multiprocess_mode='livemax'
 )
 
 RATE_LIMIT_DELAY = Histogram(
@@ -125,6 +169,27 @@ def track_cache_metrics(endpoint: str, hit: bool, cache_size: int) -> None:
     CACHE_SIZE.labels(endpoint=endpoint).set(cache_size)
 
 
+@contextmanager
+def track_upstream_latency(endpoint: str) -> Iterator[None]:
+    """
+    Time a call to the upstream API, independently of the request latency.
+    
+    Args:
+        endpoint (str): The API endpoint that triggered the upstream call
+    """
+    start_time = time.perf_counter()
+    outcome = 'success'
+    try:
+        yield
+    except Exception:
+        outcome = 'error'
+        raise
+    finally:
+        UPSTREAM_LATENCY.labels(endpoint=endpoint, outcome=outcome).observe(
+            time.perf_counter() - start_time
+        )
+
+
 def update_rate_limit_metrics(remaining: int, reset_time: float) -> None:
     """
     Update rate limit metrics based on API response headers.
@@ -151,6 +216,24 @@ def record_rate_limit_delay(delay_seconds: float) -> None:
     RATE_LIMIT_DELAY.observe(delay_seconds)
 
 
+def record_worker_model(model) -> None:
+    """
+    Expose the gunicorn worker model chosen by worker_tuning.
+    
+    Args:
+        model (worker_tuning.WorkerModel): The settings in use
+    """
+    settings = {
+        'workers': model.workers,
+        'threads': model.threads,
+        'cpus': model.cpus,
+        'memory_limit_bytes': model.memory_limit or 0,
+    }
+    for setting, value in settings.items():
+        WORKER_MODEL.labels(setting=setting, worker_class=model.worker_class,
+                            serving_mode=model.serving_mode).set(value)
+
+
 def record_response_size(endpoint: str, size_bytes: int) -> None:
     """
     Record the size of a response.
@@ -172,21 +255,26 @@ def get_metrics_middleware():
     def middleware(app):
         @app.before_request
         def before_request():
-            # Store start time in request context
-            app.request.start_time = time.time()
+            # Store start time in the application context for this request
+            g.metrics_start_time = time.perf_counter()
             
         @app.after_request
         def after_request(response):
+            start_time = g.pop('metrics_start_time', None)
+            if start_time is None:
+                # before_request did not run (e.g. an earlier hook failed)
+                return response
+            
             # Calculate request duration
-            duration = time.time() - app.request.start_time
-            endpoint = app.request.endpoint or 'unknown'
-            method = app.request.method
+            duration = time.perf_counter() - start_time
+            endpoint = request.endpoint or 'unknown'
+            method = request.method
             
             # Update metrics
             REQUEST_COUNT.labels(
                 endpoint=endpoint, 
                 method=method, 
-                status=response.status_code
+                status=str(response.status_code)
             ).inc()
             REQUEST_LATENCY.labels(
                 endpoint=endpoint, 
@@ -202,6 +290,28 @@ def get_metrics_middleware():
     return middleware
 
 
+def get_metrics_registry():
+    """
+    Build the registry served on /metrics.
+    
+    Under gunicorn each worker keeps its own counters, so when
+    PROMETHEUS_MULTIPROC_DIR is set the registry aggregates the per-process
+    files written by every worker instead of reporting only the one that
+    happens to answer the scrape.
+    
+    Returns:
+        CollectorRegistry: The registry to expose
+    """
+    from prometheus_client import REGISTRY, CollectorRegistry, multiprocess
+    
+    if not os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        return REGISTRY
+    
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
 def init_metrics_endpoint(app) -> None:
     """
     Initialize the metrics endpoint for the Flask application.
@@ -216,12 +326,12 @@ def init_metrics_endpoint(app) -> None:
     
     # Add metrics endpoint
     app.wsgi_app = DispatcherMiddleware(app.wsgi_app, {
-        '/metrics': make_wsgi_app()
+        '/metrics': make_wsgi_app(get_metrics_registry())
     })
     
     # Register metrics middleware
     metrics_middleware = get_metrics_middleware()
     metrics_middleware(app)
     
-    print("Prometheus metrics initialized - available at /metrics endpoint")
+    logger.info("Prometheus metrics initialized - available at /metrics endpoint")
 
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Per-client token-bucket rate limiting for the Rick and Morty API.
+
+Clients that send an API key (in the API_KEY_HEADER header) are limited
+per key, using the tier the key is assigned to in RATE_LIMIT_CONFIG. Other
+clients are limited per IP address with the default tier. Behind the
+ingress, set TRUSTED_PROXY_COUNT to the number of proxies in front of the
+app so the address is read from X-Forwarded-For, not from the proxy's own
+connection. Otherwise every client shares the proxy's bucket.
+
+Each bucket holds up to ``limit`` tokens and refills at ``limit / per``
+tokens per second. A request costs RATE_LIMIT_HIT_COST tokens up front.
+A request that turned out to call the upstream API (a cache miss) is
+charged RATE_LIMIT_UPSTREAM_COST more once it completes. Buckets may go
+into debt, which delays that client's next requests.
+
+RATE_LIMIT_CONFIG is inline JSON or the path to a JSON file, for example::
+
+    {"tiers": {"partner": {"limit": 600, "per": 60}},
+     "api_keys": {"<key>": "partner"}}
+
+Configuration (environment variables):
+    RATE_LIMIT_CONFIG: Tiers and API keys (default: none, every client uses the default tier)
+    API_KEY_HEADER: Header carrying the API key (default: X-API-Key)
+    TRUSTED_PROXY_COUNT: Proxies whose X-Forwarded-For entries are trusted (default: 0)
+    RATE_LIMIT_HIT_COST: Tokens charged per request (default: 1)
+    RATE_LIMIT_UPSTREAM_COST: Extra tokens charged when a request called upstream (default: 4)
+    RATE_LIMIT_MAX_CLIENTS: Buckets kept before full ones are pruned (default: 10000)
+"""
+
+import json
+import math
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from flask import g, request
+
+RATE_LIMIT_CONFIG = os.environ.get('RATE_LIMIT_CONFIG', '')
+API_KEY_HEADER = os.environ.get('API_KEY_HEADER', 'X-API-Key')
+TRUSTED_PROXY_COUNT = int(os.environ.get('TRUSTED_PROXY_COUNT', '0'))
+RATE_LIMIT_HIT_COST = float(os.environ.get('RATE_LIMIT_HIT_COST', '1'))
+RATE_LIMIT_UPSTREAM_COST = float(os.environ.get('RATE_LIMIT_UPSTREAM_COST', '4'))
+RATE_LIMIT_MAX_CLIENTS = int(os.environ.get('RATE_LIMIT_MAX_CLIENTS', '10000'))
+
+
+class InvalidApiKey(Exception):
+    """Raised when a request carries an API key that is not configured."""
+
+
+class Tier:
+    """
+    A token-bucket size and refill period.
+
+    Args:
+        name (str): Tier name
+        limit (int): Bucket capacity, i.e. requests allowed per period
+        per (float): Seconds for an empty bucket to refill completely
+    """
+
+    def __init__(self, name: str, limit: int, per: float):
+        if limit <= 0 or per <= 0:
+            raise ValueError(f"Rate limit tier {name!r} needs a positive limit and period")
+        self.name = name
+        self.limit = limit
+        self.per = per
+        self.rate = limit / per
+
+    def __repr__(self):
+        return f"Tier({self.name!r}, limit={self.limit}, per={self.per})"
+
+
+def load_config(source: str) -> Tuple[Dict[str, Tier], Dict[str, str]]:
+    """
+    Parse the tier configuration.
+
+    Args:
+        source (str): Inline JSON, a path to a JSON file, or '' for no configuration
+
+    Returns:
+        tuple: (tiers by name, tier name by API key)
+    """
+    if not source:
+        return {}, {}
+    if source.lstrip().startswith('{'):
+        config = json.loads(source)
+    else:
+        with open(source) as f:
+            config = json.load(f)
+
+    tiers = {
+        name: Tier(name, int(spec['limit']), float(spec['per']))
+        for name, spec in config.get('tiers', {}).items()
+    }
+    api_keys = config.get('api_keys', {})
+    for tier_name in api_keys.values():
+        if tier_name not in tiers:
+            raise ValueError(f"API key assigned to unknown rate limit tier {tier_name!r}")
+    return tiers, api_keys
+
+
+TIERS, API_KEYS = load_config(RATE_LIMIT_CONFIG)
+
+_lock = threading.Lock()
+
+
+def identify_client(default_tier: Tier) -> Tuple[str, Tier]:
+    """
+    Identify the client of the current request.
+
+    Args:
+        default_tier (Tier): Tier for clients without an API key
+
+    Returns:
+        tuple: (bucket key, tier)
+
+    Raises:
+        InvalidApiKey: If the request carries an unknown API key
+    """
+    # Without configured keys the header is ignored (and not even looked up)
+    api_key = request.headers.get(API_KEY_HEADER) if API_KEYS else None
+    if api_key:
+        tier_name = API_KEYS.get(api_key)
+        if tier_name is None:
+            raise InvalidApiKey()
+        return f"key:{api_key}", TIERS[tier_name]
+    # remote_addr already honours X-Forwarded-For when TRUSTED_PROXY_COUNT is set
+    return f"ip:{request.remote_addr}", default_tier
+
+
+def _refill(buckets: dict, key: str, tier: Tier, now: float) -> dict:
+    bucket = buckets.get(key)
+    if bucket is None:
+        if len(buckets) >= RATE_LIMIT_MAX_CLIENTS:
+            _prune(buckets, now)
+        bucket = buckets[key] = {"tokens": float(tier.limit), "updated": now, "tier": tier}
+    else:
+        bucket["tokens"] = min(tier.limit, bucket["tokens"] + (now - bucket["updated"]) * tier.rate)
+        bucket["updated"] = now
+        bucket["tier"] = tier
+    return bucket
+
+
+def _prune(buckets: dict, now: float) -> None:
+    """Forget buckets that have refilled completely; they would be recreated full"""
+    for key, bucket in list(buckets.items()):
+        tier = bucket["tier"]
+        if bucket["tokens"] + (now - bucket["updated"]) * tier.rate >= tier.limit:
+            del buckets[key]
+
+
+def take(buckets: dict, key: str, tier: Tier, cost: float, force: bool = False) -> Tuple[bool, float]:
+    """
+    Take ``cost`` tokens from a client's bucket.
+
+    Args:
+        buckets (dict): Bucket store, keyed by client
+        key (str): Client bucket key
+        tier (Tier): The client's tier
+        cost (float): Tokens to take
+        force (bool): Take the tokens even if that leaves the bucket in debt
+
+    Returns:
+        tuple: (whether the tokens were taken, tokens left)
+    """
+    now = time.time()
+    with _lock:
+        bucket = _refill(buckets, key, tier, now)
+        allowed = force or bucket["tokens"] >= cost
+        if allowed:
+            bucket["tokens"] -= cost
+        return allowed, bucket["tokens"]
+
+
+def quota_headers(tier: Tier, tokens: float, denied_cost: Optional[float] = None) -> Dict[str, str]:
+    """
+    Rate limit response headers.
+
+    Args:
+        tier (Tier): The client's tier
+        tokens (float): Tokens left in the client's bucket
+        denied_cost (float): Cost of a denied request, to compute Retry-After
+
+    Returns:
+        dict: X-RateLimit-* (and Retry-After) headers
+    """
+    headers = {
+        'X-RateLimit-Limit': str(tier.limit),
+        'X-RateLimit-Remaining': str(max(0, math.floor(tokens))),
+        'X-RateLimit-Reset': str(math.ceil((tier.limit - tokens) / tier.rate)),
+    }
+    if denied_cost is not None:
+        headers['Retry-After'] = str(max(1, math.ceil((denied_cost - tokens) / tier.rate)))
+    return headers
+
+
+def init_rate_limiting(app) -> None:
+    """
+    Trust X-Forwarded-For from the configured number of proxies, and
+    register the hook that charges upstream work and reports quotas.
+
+    Args:
+        app: The Flask application instance
+    """
+    if TRUSTED_PROXY_COUNT > 0:
+        from werkzeug.middleware.proxy_fix import ProxyFix
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_COUNT)
+
+    @app.after_request
+    def add_rate_limit_headers(response):
+        # Set by the rate_limit decorator of rate-limited routes
+        state = g.pop('rate_limit', None)
+        if state is None:
+            return response
+        buckets, key, tier, tokens = state
+        # Cache misses cost the upstream API real work; charge for it
+        if g.get('upstream_bound'):
+            _, tokens = take(buckets, key, tier, RATE_LIMIT_UPSTREAM_COST, force=True)
+        response.headers.extend(quota_headers(tier, tokens))
+        return response
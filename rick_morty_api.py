@@ -1,54 +1,110 @@
 import requests
 import logging
-from flask import Flask, jsonify, request, make_response
+from flask import Flask, Response, jsonify, request, make_response, abort, g, send_file, stream_with_context
 import os
+import hmac
+import threading
 from werkzeug.exceptions import HTTPException
 from functools import wraps
 import time
+import admission
+import cache_admin
+import cache_policy
+import cassette
+import character_records
+import change_feed
+import facets
+import image_cache
+import logging_config
+import popularity
+import prometheus_metrics
+import profiling
+import rate_limiting
+import serialization
+import tracing
+import upstream
 
 # Configure logging
-logging.basicConfig(level=logging.INFO, 
-                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logging_config.configure_logging()
 logger = logging.getLogger(__name__)
 
 # Initialize Flask app
 app = Flask(__name__)
+app.json = serialization.FastJSONProvider(app)
+prometheus_metrics.init_metrics_endpoint(app)
+tracing.init_tracing(app)
+profiling.init_profiling(app)
+rate_limiting.init_rate_limiting(app)
+cache_policy.init_cache_policy(app)
 
 # Constants
-API_BASE_URL = "https://rickandmortyapi.com/api/character"
-CACHE_TIMEOUT = 300  # 5 minutes cache
+API_BASE_URL = character_records.API_BASE_URL
+CACHE_TIMEOUT = cache_policy.CACHE_TIMEOUT  # 5 minutes cache by default
 character_cache = {"data": None, "timestamp": 0}
 character_detail_cache = {}
+filtered_character_cache = {"data": None, "source": None}
+# One crawl and one filter pass at a time; the other threads wait for their result
+character_crawl = {"lock": threading.Lock(), "attempts": 0, "result": None}
+filtered_character_lock = threading.Lock()
+character_facets = facets.FacetIndex()
+character_changes = change_feed.ChangeFeed()
+DETAIL_CACHE_MAX_ENTRIES = int(os.environ.get("DETAIL_CACHE_MAX_ENTRIES", 1000))  # 0 = unbounded
+PREWARM_BATCH_SIZE = int(os.environ.get("PREWARM_BATCH_SIZE", 100))
+# Crawl saved by load_dataset() so that preloading does not depend on the upstream API
+DATASET_SNAPSHOT = os.environ.get("DATASET_SNAPSHOT")
+
+# Admin endpoints are disabled unless a token is configured
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
 
 # Rate limiting setup
+RATE_LIMIT = int(os.environ.get("RATE_LIMIT", 10))
+RATE_LIMIT_PERIOD = int(os.environ.get("RATE_LIMIT_PERIOD", 60))
 requests_limit = {}
 
-def rate_limit(limit=10, per=60):
-    """Rate limiting decorator to prevent abuse"""
+def rate_limit(limit=RATE_LIMIT, per=RATE_LIMIT_PERIOD):
+    """
+    Token-bucket rate limiting per client (API key or IP address)
+    limit/per is the tier of clients without an API key; requests
+    that had to call the upstream API are charged extra afterwards
+    """
+    default_tier = rate_limiting.Tier('default', limit, per)
     def decorator(f):
         @wraps(f)
         def wrapped(*args, **kwargs):
-            client_ip = request.remote_addr
-            
-            # Check if IP has made requests
-            if client_ip not in requests_limit:
-                requests_limit[client_ip] = {"count": 0, "start": time.time()}
+            with tracing.stage('rate_limit'):
+                try:
+                    client, tier = rate_limiting.identify_client(default_tier)
+                except rate_limiting.InvalidApiKey:
+                    return make_response(jsonify({"error": "Invalid API key"}), 401)
+                
+                allowed, tokens = rate_limiting.take(requests_limit, client, tier, rate_limiting.RATE_LIMIT_HIT_COST)
             
-            # Reset counter if time period has passed
-            if time.time() - requests_limit[client_ip]["start"] > per:
-                requests_limit[client_ip] = {"count": 0, "start": time.time()}
-            
-            # Increment request count
-            requests_limit[client_ip]["count"] += 1
-            
-            # Check if limit exceeded
-            if requests_limit[client_ip]["count"] > limit:
-                return make_response(jsonify({"error": "Rate limit exceeded"}), 429)
+            if not allowed:
+                response = make_response(jsonify({"error": "Rate limit exceeded"}), 429)
+                response.headers.extend(rate_limiting.quota_headers(tier, tokens, rate_limiting.RATE_LIMIT_HIT_COST))
+                return response
             
+            # Upstream surcharge and X-RateLimit-* headers are added after the view
+            g.rate_limit = (requests_limit, client, tier, tokens)
             return f(*args, **kwargs)
         return wrapped
     return decorator
 
+def require_admin_token(f):
+    """Restrict an endpoint to callers presenting the admin token"""
+    @wraps(f)
+    def wrapped(*args, **kwargs):
+        if not ADMIN_TOKEN:
+            abort(404)
+        
+        auth_header = request.headers.get('Authorization', '')
+        token = auth_header[len('Bearer '):] if auth_header.startswith('Bearer ') else request.headers.get('X-Admin-Token', '')
+        if not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+            return make_response(jsonify({"error": "Unauthorized"}), 401)
+        
+        return f(*args, **kwargs)
+    return wrapped
+
 def fetch_characters(filtered=True):
     """
     Fetches characters from Rick & Morty API.
@@ -59,113 +115,271 @@ def fetch_characters(filtered=True):
     """
     # Check cache first
     current_time = time.time()
-    if character_cache["data"] is not None and current_time - character_cache["timestamp"] < CACHE_TIMEOUT:
-        logger.info("Returning characters from cache")
-        return character_cache["data"]
+    with tracing.stage('cache'):
+        cache_fresh = character_cache["data"] is not None and cache_policy.is_fresh(character_cache["timestamp"], cache_policy.CHARACTER_LIST_CACHE_TTL, current_time)
+    cache_policy.record(cache_fresh, character_cache["timestamp"], cache_policy.CHARACTER_LIST_CACHE_TTL)
+    if cache_fresh:
+        if logging_config.sample_hit():
+            logger.info("Returning characters from cache")
+        prometheus_metrics.track_cache_metrics('characters', True, len(character_cache["data"]))
+        return filter_characters(character_cache["data"]) if filtered else character_cache["data"]
+    
+    prometheus_metrics.track_cache_metrics('characters', False, 0)
+    attempts = character_crawl["attempts"]
+    with character_crawl["lock"]:
+        if character_crawl["attempts"] != attempts:
+            # Another thread crawled while this one waited: share its outcome,
+            # even if a slow crawl is already older than this request's max-age
+            characters = character_crawl["result"]
+        elif character_cache["data"] is not None and cache_policy.is_fresh(character_cache["timestamp"], cache_policy.CHARACTER_LIST_CACHE_TTL):
+            characters = character_cache["data"]
+        else:
+            characters = crawl_characters(current_time)
+            character_crawl["result"] = characters
+            character_crawl["attempts"] += 1
+        if characters is None:
+            return None
     
+    return filter_characters(characters) if filtered else characters
+
+def crawl_characters(current_time):
+    """Crawl the upstream character list into the list and detail caches"""
     logger.info("Fetching characters from Rick & Morty API")
-    url = API_BASE_URL
     characters = []
+    details = []
     
-    try:
-        while url:
-            logger.info(f"Fetching data from: {url}")
-            response = requests.get(url)
-            response.raise_for_status()  # Raise exception for HTTP errors
-            
-            data = response.json()
-            
-            # Process results
-            for character in data.get('results', []):
-                # Apply filters if requested
-                if filtered:
-                    if (character.get('species') == 'Human' and 
-                        character.get('status') == 'Alive' and 
-                        character.get('origin', {}).get('name') == 'Earth (C-137)'):
-                        
-                        # Extract required fields
-                        characters.append({
-                            'id': character.get('id'),
-                            'name': character.get('name'),
-                            'status': character.get('status'),
-                            'species': character.get('species'),
-                            'location': character.get('location', {}).get('name'),
-                            'origin': character.get('origin', {}).get('name'),
-                            'image_url': character.get('image')
-                        })
-                else:
-                    # Include all characters but with consistent schema
-                    characters.append({
-                        'id': character.get('id'),
-                        'name': character.get('name'),
-                        'status': character.get('status'),
-                        'species': character.get('species'),
-                        'location': character.get('location', {}).get('name'),
-                        'origin': character.get('origin', {}).get('name'),
-                        'image_url': character.get('image')
-                    })
-            
-            # Get URL for next page, if any
-            url = data.get('info', {}).get('next')
+    # Only cache misses count against the upstream concurrency limit
+    with admission.controller.upstream_slot():
+        try:
+            # Pages after the first are fetched in parallel within the adaptive limit
+            with tracing.stage('upstream'):
+                pages = upstream.crawl(API_BASE_URL, character_records.fetch_character_page)
+        except requests.exceptions.RequestException as e:
+            logger.error("API request error: %s", e)
+            return None
     
-    except requests.exceptions.RequestException as e:
-        logger.error(f"API request error: {str(e)}")
-        return None
+    # Process results: the full record feeds the detail cache,
+    # the list keeps a consistent subset of its fields
+    with tracing.stage('filter'):
+        for data in pages:
+            for character in data.get('results', []):
+                detail = character_records.format_character_detail(character)
+                details.append(detail)
+                characters.append({
+                    'id': detail['id'],
+                    'name': detail['name'],
+                    'status': detail['status'],
+                    'species': detail['species'],
+                    'location': detail['location'],
+                    'origin': detail['origin'],
+                    'image_url': detail['image_url']
+                })
     
-    # Update cache
+    # Update cache; every crawled character is now a detail cache hit as well
     character_cache["data"] = characters
     character_cache["timestamp"] = current_time
+    for detail in details:
+        if detail['id'] is not None:
+            store_character_detail(detail['id'], detail, current_time)
+    character_facets.refresh(characters)
+    character_changes.update(characters)
     
     return characters
 
+def filter_characters(characters):
+    """
+    Characters matching Species: Human, Status: Alive, Origin: Earth (C-137),
+    computed once per crawled list
+    """
+    with filtered_character_lock:
+        if filtered_character_cache["source"] is not characters:
+            filtered_character_cache["data"] = [
+                character for character in characters
+                if (character.get('species') == 'Human' and 
+                    character.get('status') == 'Alive' and 
+                    character.get('origin') == 'Earth (C-137)')
+            ]
+            filtered_character_cache["source"] = characters
+        return filtered_character_cache["data"]
+
+def store_character_detail(character_id, character_data, timestamp, admit=True):
+    """
+    Cache a character; when the cache is full, evict an expired or less
+    requested entry (with admit=True a less requested newcomer is rejected)
+    """
+    if character_id not in character_detail_cache and DETAIL_CACHE_MAX_ENTRIES and len(character_detail_cache) >= DETAIL_CACHE_MAX_ENTRIES:
+        victim, expired = popularity.choose_victim(character_detail_cache, popularity.sketch, cache_policy.CHARACTER_DETAIL_CACHE_TTL)
+        if victim is not None:
+            if admit and not expired and not popularity.sketch.admit(character_id, victim):
+                prometheus_metrics.CACHE_EVICTIONS.labels(endpoint='character', reason='rejected').inc()
+                return False
+            character_detail_cache.pop(victim, None)
+            prometheus_metrics.CACHE_EVICTIONS.labels(endpoint='character', reason='expired' if expired else 'capacity').inc()
+    
+    character_detail_cache[character_id] = {
+        "data": character_data,
+        "timestamp": timestamp
+    }
+    return True
+
 def fetch_character_by_id(character_id):
     """Fetch a specific character by ID from the Rick & Morty API"""
     # Check cache first
-    if character_id in character_detail_cache and time.time() - character_detail_cache[character_id]["timestamp"] < CACHE_TIMEOUT:
-        logger.info(f"Returning character {character_id} from cache")
-        return character_detail_cache[character_id]["data"]
+    with tracing.stage('cache'):
+        entry = character_detail_cache.get(character_id)
+        cache_fresh = entry is not None and cache_policy.is_fresh(entry["timestamp"], cache_policy.CHARACTER_DETAIL_CACHE_TTL)
+    cache_policy.record(cache_fresh, entry and entry["timestamp"], cache_policy.CHARACTER_DETAIL_CACHE_TTL)
+    if cache_fresh:
+        if logging_config.sample_hit():
+            logger.info("Returning character %s from cache", character_id)
+        prometheus_metrics.track_cache_metrics('character', True, len(character_detail_cache))
+        return entry["data"]
     
-    try:
-        url = f"{API_BASE_URL}/{character_id}"
-        logger.info(f"Fetching character data from: {url}")
-        
-        response = requests.get(url)
-        response.raise_for_status()
-        
-        character = response.json()
+    prometheus_metrics.track_cache_metrics('character', False, len(character_detail_cache))
+    with admission.controller.upstream_slot():
+        try:
+            url = f"{API_BASE_URL}/{character_id}"
+            logger.info("Fetching character data from: %s", url)
+            
+            with tracing.stage('upstream'):
+                response = upstream.get(url, 'character')
+            
+            character = response.json()
+            
+            # Format character data
+            with tracing.stage('filter'):
+                character_data = character_records.format_character_detail(character)
+            
+            # Update cache
+            store_character_detail(character_id, character_data, time.time())
+            
+            return character_data
         
-        # Format character data
-        character_data = {
-            'id': character.get('id'),
-            'name': character.get('name'),
-            'status': character.get('status'),
-            'species': character.get('species'),
-            'type': character.get('type'),
-            'gender': character.get('gender'),
-            'origin': character.get('origin', {}).get('name'),
-            'location': character.get('location', {}).get('name'),
-            'image_url': character.get('image'),
-            'episode': character.get('episode', []),
-            'url': character.get('url'),
-            'created': character.get('created')
-        }
+        except requests.exceptions.HTTPError as e:
+            if e.response.status_code == 404:
+                return None
+            logger.error("HTTP error: %s", e)
+            raise
+        except requests.exceptions.RequestException as e:
+            logger.error("API request error: %s", e)
+            raise
+
+def fetch_characters_by_ids(character_ids):
+    """Fetch several characters with one upstream call per batch of IDs"""
+    characters = []
+    for start in range(0, len(character_ids), PREWARM_BATCH_SIZE):
+        batch = character_ids[start:start + PREWARM_BATCH_SIZE]
+        url = f"{API_BASE_URL}/{','.join(str(character_id) for character_id in batch)}"
+        logger.info("Fetching character data from: %s", url)
         
-        # Update cache
-        character_detail_cache[character_id] = {
-            "data": character_data,
-            "timestamp": time.time()
-        }
+        try:
+            response = upstream.get(url, 'character_batch')
+        except requests.exceptions.HTTPError as e:
+            # A single unknown ID is a 404 rather than an empty list
+            if e.response.status_code == 404:
+                continue
+            raise
         
-        return character_data
+        data = response.json()
+        for character in data if isinstance(data, list) else [data]:
+            characters.append(character_records.format_character_detail(character))
     
-    except requests.exceptions.HTTPError as e:
-        if e.response.status_code == 404:
-            return None
-        logger.error(f"HTTP error: {str(e)}")
-        raise
-    except requests.exceptions.RequestException as e:
-        logger.error(f"API request error: {str(e)}")
-        raise
+    return characters
+
+def cache_entries():
+    """All cache entries by admin key ("characters", "character:<id>")"""
+    entries = {}
+    if character_cache["data"] is not None:
+        entries["characters"] = character_cache
+    for character_id, entry in list(character_detail_cache.items()):
+        entries[f"character:{character_id}"] = entry
+    return entries
+
+def invalidate_cache(command):
+    """Drop the cache entries selected by a command's keys or prefix"""
+    keys, prefix = command.get('keys'), command.get('prefix')
+    for key in cache_entries():
+        if not cache_admin.key_matches(key, keys, prefix):
+            continue
+        if key == "characters":
+            # Concurrent requests keep reading these dicts: reset their keys, never empty them
+            character_cache["data"] = None
+            character_cache["timestamp"] = 0
+            character_cache.pop("encoded", None)
+            filtered_character_cache["data"] = None
+            filtered_character_cache["source"] = None
+            filtered_character_cache.pop("encoded", None)
+        else:
+            character_detail_cache.pop(int(key.split(':', 1)[1]), None)
+
+def prewarm_cache(command):
+    """Store characters fetched by the worker that received a pre-warm command"""
+    for character in command['characters']:
+        store_character_detail(character['id'], character, command['timestamp'], admit=False)
+
+CACHE_COMMAND_HANDLERS = {'invalidate': invalidate_cache, 'prewarm': prewarm_cache}
+cache_admin.init_cache_admin(app, CACHE_COMMAND_HANDLERS)
+
+def refresh_hot_characters():
+    """Re-fetch the most requested characters before their cache entries expire"""
+    refresh_before = time.time() - cache_policy.CHARACTER_DETAIL_CACHE_TTL + 2 * popularity.HOT_REFRESH_INTERVAL
+    due = [
+        character_id for character_id in popularity.sketch.hot_keys()
+        if character_id not in character_detail_cache or character_detail_cache[character_id]["timestamp"] < refresh_before
+    ]
+    if not due:
+        return
+    
+    timestamp = time.time()
+    found = set()
+    for character in fetch_characters_by_ids(sorted(due)):
+        store_character_detail(character['id'], character, timestamp, admit=False)
+        found.add(character['id'])
+    # Ids the upstream does not know would otherwise be re-fetched every run
+    for character_id in set(due) - found:
+        popularity.sketch.discard(character_id)
+    logger.info("Refreshed %d hot characters", len(found))
+
+hot_refresher = popularity.Refresher(popularity.HOT_REFRESH_INTERVAL, refresh_hot_characters)
+
+def load_dataset(snapshot=None):
+    """
+    Fill the caches up front (used by gunicorn's preload mode before forking).
+    Reads the snapshot file if there is one, otherwise crawls the API and
+    saves the result as the snapshot. Returns False if nothing was loaded.
+    """
+    snapshot = snapshot or DATASET_SNAPSHOT
+    if snapshot and os.path.exists(snapshot):
+        with open(snapshot, 'rb') as f:
+            dataset = app.json.loads(f.read())
+        # Entries are as old as the crawl that made the snapshot, so the usual
+        # TTL refreshes an old snapshot (the file's mtime for older snapshots)
+        timestamp = dataset.get('timestamp') or os.path.getmtime(snapshot)
+        character_cache["data"] = dataset["characters"]
+        character_cache["timestamp"] = timestamp
+        for detail in dataset["details"]:
+            store_character_detail(detail['id'], detail, timestamp, admit=False)
+        logger.info("Loaded %d characters from %s", len(dataset["characters"]), snapshot)
+    else:
+        if fetch_characters(filtered=False) is None:
+            return False
+        if snapshot:
+            dataset = {
+                'timestamp': character_cache["timestamp"],
+                'characters': character_cache["data"],
+                'details': [entry["data"] for entry in character_detail_cache.values()]
+            }
+            # Write to a temporary file first so readers never see a partial snapshot
+            with open(snapshot + '.tmp', 'wb') as f:
+                f.write(app.json.dumps_bytes(dataset))
+            os.replace(snapshot + '.tmp', snapshot)
+            logger.info("Saved dataset snapshot to %s", snapshot)
+    
+    # Build the filtered list and facets now so that they are shared by the workers too
+    filter_characters(character_cache["data"])
+    character_facets.refresh(character_cache["data"])
+    character_changes.update(character_cache["data"])
+    return True
 
 # API Routes
 @app.route('/health', methods=['GET'])
@@ -187,21 +401,252 @@ def get_characters():
     if characters is None:
         return jsonify({'error': 'Failed to fetch characters from API'}), 503
     
-    return jsonify({
-        'count': len(characters),
-        'characters': characters
-    })
+    # Reuse the encoded body while the cached list is unchanged
+    cache_entry = None
+    for entry in (character_cache, filtered_character_cache):
+        if characters is entry["data"]:
+            cache_entry = entry
+    with tracing.stage('serialize'):
+        return serialization.cached_response(cache_entry, characters, lambda: {
+            'count': len(characters),
+            'characters': characters
+        })
+
+@app.route('/characters/stats', methods=['GET'])
+@rate_limit()
+def get_character_stats():
+    """
+    Character counts by status, species, origin and location
+    Optional query parameters status/species/origin/location
+    restrict the counts to matching characters
+    """
+    characters = fetch_characters(filtered=False)
+    
+    if characters is None:
+        return jsonify({'error': 'Failed to fetch characters from API'}), 503
+    
+    # Normally a no-op: the index is refreshed together with the list
+    character_facets.refresh(characters)
+    filters = {field: request.args[field] for field in facets.FACET_FIELDS if field in request.args}
+    stats = character_facets.query(filters)
+    stats['filters'] = filters
+    return jsonify(stats)
+
+@app.route('/characters/changes', methods=['GET'])
+@rate_limit()
+def get_character_changes():
+    """
+    Server-Sent Events stream of added, changed and removed character ids
+    Resumes after the Last-Event-ID header (or last_event_id parameter)
+    """
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    if fetch_characters(filtered=False) is None:
+        return jsonify({'error': 'Failed to fetch characters from API'}), 503
+    
+    try:
+        subscriber, backlog = character_changes.subscribe(last_event_id)
+    except change_feed.TooManyStreams:
+        response = jsonify({'error': 'Too many open change streams, please retry later'})
+        response.headers['Retry-After'] = str(max(1, int(change_feed.SSE_MAX_DURATION)))
+        return response, 503
+    character_changes.ensure_refresher(lambda: fetch_characters(filtered=False))
+    
+    events = change_feed.stream(character_changes, subscriber, backlog, last_event_id)
+    response = Response(stream_with_context(events), mimetype='text/event-stream')
+    # Frees the slot even if the stream never starts
+    response.call_on_close(lambda: character_changes.unsubscribe(subscriber))
+    response.headers['Cache-Control'] = 'no-cache'
+    # Stops nginx from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
 @app.route('/characters/<int:character_id>', methods=['GET'])
 @rate_limit()
 def get_character(character_id):
     """Get a specific character by ID"""
+    popularity.sketch.record(character_id)
+    hot_refresher.ensure_started()
     character = fetch_character_by_id(character_id)
     
     if character is None:
+        popularity.sketch.discard(character_id)
         return jsonify({'error': 'Character not found'}), 404
     
-    return jsonify(character)
+    cache_entry = character_detail_cache.get(character_id)
+    if cache_entry is not None and cache_entry["data"] is not character:
+        cache_entry = None
+    with tracing.stage('serialize'):
+        return serialization.cached_response(cache_entry, character, lambda: character)
+
+@app.route('/characters/<int:character_id>/image', methods=['GET'])
+@rate_limit()
+def get_character_image(character_id):
+    """
+    Character image from the on-disk image cache
+    Optional query parameter 'size' returns a JPEG thumbnail
+    of at most size x size pixels
+    """
+    size = request.args.get('size', type=int)
+    if 'size' in request.args and size not in image_cache.IMAGE_THUMBNAIL_SIZES:
+        sizes = ', '.join(str(s) for s in image_cache.IMAGE_THUMBNAIL_SIZES)
+        return jsonify({'error': f"size must be one of: {sizes}"}), 400
+    if size is not None and not image_cache.thumbnails_available():
+        return jsonify({'error': 'Thumbnails are not available'}), 501
+    
+    def image_url():
+        character = fetch_character_by_id(character_id)
+        return character and character.get('image_url')
+    
+    for attempt in range(2):
+        try:
+            result = image_cache.fetch(character_id, size, image_url)
+        except requests.exceptions.HTTPError as e:
+            if e.response.status_code == 404:
+                return jsonify({'error': 'Image not found'}), 404
+            logger.error("Image request error: %s", e)
+            return jsonify({'error': 'Failed to fetch image from API'}), 503
+        except requests.exceptions.RequestException as e:
+            logger.error("Image request error: %s", e)
+            return jsonify({'error': 'Failed to fetch image from API'}), 503
+        except image_cache.ImageError as e:
+            logger.error("%s", e)
+            return jsonify({'error': 'Invalid image from API'}), 502
+        
+        if result is None:
+            return jsonify({'error': 'Character not found'}), 404
+        
+        cached, hit = result
+        try:
+            response = send_file(cached.path, mimetype=cached.mimetype, etag=cached.etag,
+                                 max_age=image_cache.IMAGE_MAX_AGE)
+            break
+        except FileNotFoundError:
+            # Evicted by another worker since the lookup: fetch it again
+            if attempt:
+                raise
+    
+    # Streamed from disk by the WSGI file wrapper; X-Cache reports the image cache
+    g.pop('cache_status', None)
+    response.headers['X-Cache'] = 'HIT' if hit else 'MISS'
+    return response
+
+# Admin Routes
+@app.route('/admin/profile', methods=['POST'])
+@require_admin_token
+def start_profile():
+    """
+    Profile a window of live requests in this worker
+    Query parameters: mode=cprofile|sample, requests, seconds, interval
+    """
+    if not profiling.PROFILING_ENABLED:
+        abort(404)
+    
+    try:
+        max_requests = int(request.args.get('requests', 100))
+        seconds = float(request.args.get('seconds', 60))
+        interval = float(request.args.get('interval', 0.005))
+    except ValueError:
+        return jsonify({'error': 'requests, seconds and interval must be numbers'}), 400
+    
+    try:
+        session = profiling.profiler.start(
+            mode=request.args.get('mode', 'cprofile'),
+            max_requests=max_requests,
+            seconds=seconds,
+            interval=interval
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except profiling.ProfilingError as e:
+        return jsonify({'error': str(e)}), 409
+    
+    logger.info("Started %s profiling session in worker %s", session.mode, os.getpid())
+    return jsonify({'pid': os.getpid(), **session.status()}), 202
+
+@app.route('/admin/profile', methods=['GET'])
+@require_admin_token
+def get_profile():
+    """
+    Get the status or results of the latest profiling session in this worker
+    Optional query parameter 'format=pstats/text/collapsed' returns the results
+    """
+    if not profiling.PROFILING_ENABLED:
+        abort(404)
+    
+    output_format = request.args.get('format')
+    if output_format is None:
+        session = profiling.profiler.session
+        if session is None:
+            return jsonify({'error': 'No profiling session has been started'}), 404
+        return jsonify({'pid': os.getpid(), **session.status()})
+    
+    try:
+        body, mimetype = profiling.profiler.results(output_format)
+    except profiling.ProfilingError as e:
+        return jsonify({'error': str(e)}), 409
+    
+    return app.response_class(body, mimetype=mimetype)
+
+@app.route('/admin/cache', methods=['GET'])
+@require_admin_token
+def get_cache_stats():
+    """Get entry counts, sizes, ages and hit ratios of this worker's caches"""
+    entries = cache_entries()
+    details = {key: entry for key, entry in entries.items() if key != "characters"}
+    characters = {key: entry for key, entry in entries.items() if key == "characters"}
+    return jsonify({
+        'pid': os.getpid(),
+        'caches': {
+            'characters': cache_admin.entry_stats(characters, 'characters'),
+            'character': cache_admin.entry_stats(details, 'character')
+        },
+        'hot_ids': popularity.sketch.hot_keys(10)
+    })
+
+@app.route('/admin/cache/invalidate', methods=['POST'])
+@require_admin_token
+def invalidate_cache_entries():
+    """
+    Invalidate cache entries in every worker
+    JSON body: {"keys": ["characters", "character:1"]} or {"prefix": "character:"}
+    """
+    body = request.get_json(silent=True) or {}
+    keys, prefix = body.get('keys'), body.get('prefix')
+    if keys is None and prefix is None:
+        return jsonify({'error': 'Provide keys or prefix'}), 400
+    if (keys is not None and not isinstance(keys, list)) or (prefix is not None and not isinstance(prefix, str)):
+        return jsonify({'error': 'keys must be a list and prefix a string'}), 400
+    
+    matched = [key for key in cache_entries() if cache_admin.key_matches(key, keys, prefix)]
+    cache_admin.issue({'action': 'invalidate', 'keys': keys, 'prefix': prefix}, CACHE_COMMAND_HANDLERS)
+    logger.info("Invalidated %d cache entries", len(matched))
+    return jsonify({'invalidated': matched}), 202
+
+@app.route('/admin/cache/prewarm', methods=['POST'])
+@require_admin_token
+def prewarm_cache_entries():
+    """
+    Fetch characters into the detail cache of every worker
+    JSON body: {"ids": [1, 2, 3]}
+    """
+    body = request.get_json(silent=True) or {}
+    character_ids = body.get('ids')
+    if not isinstance(character_ids, list) or not all(isinstance(i, int) and not isinstance(i, bool) for i in character_ids):
+        return jsonify({'error': 'ids must be a list of integers'}), 400
+    
+    try:
+        characters = fetch_characters_by_ids(sorted(set(character_ids)))
+    except requests.exceptions.RequestException as e:
+        logger.error("API request error: %s", e)
+        return jsonify({'error': 'Failed to fetch characters from API'}), 503
+    
+    cache_admin.issue({'action': 'prewarm', 'characters': characters, 'timestamp': time.time()},
+                      CACHE_COMMAND_HANDLERS)
+    found = {character['id'] for character in characters}
+    return jsonify({
+        'prewarmed': sorted(found),
+        'not_found': sorted(set(character_ids) - found)
+    }), 202
 
 # Error Handlers
 @app.errorhandler(404)
@@ -212,7 +657,7 @@ def not_found(error):
 @app.errorhandler(500)
 def server_error(error):
     """Handle 500 errors"""
-    logger.error(f"Server error: {str(error)}")
+    logger.error("Server error: %s", error)
     return jsonify({'error': 'Internal server error'}), 500
 
 @app.errorhandler(HTTPException)
@@ -222,10 +667,25 @@ def handle_http_exception(error):
     response.status_code = error.code
     return response
 
+@app.errorhandler(admission.Overloaded)
+def handle_overloaded(error):
+    """Shed upstream-bound requests quickly instead of queueing them"""
+    logger.warning("%s", error)
+    response = jsonify({'error': 'Service overloaded, please retry later'})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+@app.errorhandler(cassette.CassetteMiss)
+def handle_cassette_miss(error):
+    """A URL missing from the replayed cassette is an unavailable upstream"""
+    logger.error("%s", error)
+    return jsonify({'error': 'Failed to fetch data from API'}), 503
+
 @app.errorhandler(Exception)
 def handle_exception(error):
     """Handle general exceptions"""
-    logger.error(f"Unhandled exception: {str(error)}")
+    logger.error("Unhandled exception: %s", error)
     return jsonify({'error': 'An unexpected error occurred'}), 500
 
 if __name__ == "__main__":
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Response serialization for the Rick and Morty API.
+
+``FastJSONProvider`` replaces Flask's default JSON provider with orjson (or
+msgspec) when one of them is installed, falling back to the standard
+library otherwise. Output matches Flask's default provider: keys are
+sorted, non-ASCII characters are escaped, and whenever the fast encoder
+cannot reproduce the stdlib output exactly (non-ASCII or DEL characters,
+non-string keys, integers beyond 64 bits, ...) the payload is re-encoded
+with the standard library. Floats are not inspected, as that would cost
+more than the encoding saves, so two differences remain:
+
+- floats written with an exponent are spelled differently but parse to the
+  same value (1e-7 for 1e-07, 1e16 for 1e+16);
+- NaN and infinities become null (the stdlib writes NaN and Infinity,
+  which are not valid JSON).
+
+msgspec also always renders datetimes in ISO 8601.
+
+``cached_response`` negotiates the response format from the Accept header
+(JSON, or MessagePack / CBOR for internal clients when msgpack / cbor2 are
+installed) and keeps encoded bodies on the cache entry that produced them,
+so repeated hits on the same cached data skip serialization entirely.
+
+Configuration (environment variables):
+    JSON_BACKEND: auto (default), orjson, msgspec or stdlib
+"""
+
+import importlib.util
+import os
+from typing import Any, Callable, Dict, Optional
+
+from flask import current_app, request
+from flask.json.provider import DefaultJSONProvider
+
+JSON_BACKEND = os.environ.get('JSON_BACKEND', 'auto').lower()
+
+JSON_MIMETYPE = 'application/json'
+MSGPACK_MIMETYPES = ('application/msgpack', 'application/x-msgpack', 'application/vnd.msgpack')
+CBOR_MIMETYPE = 'application/cbor'
+
+
+def _load_orjson():
+    try:
+        import orjson
+    except ImportError:
+        return None
+
+    def encode(obj, default, sort_keys):
+        # Dates and dataclasses go through Flask's default() so they are
+        # rendered exactly as the stdlib provider renders them
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=default, option=option)
+
+    return 'orjson', encode, orjson.JSONEncodeError
+
+
+def _load_msgspec():
+    try:
+        import msgspec
+    except ImportError:
+        return None
+
+    encoders = {}
+
+    def encode(obj, default, sort_keys):
+        # msgspec encodes datetimes natively (ISO 8601) rather than via default()
+        key = (default, sort_keys)
+        encoder = encoders.get(key)
+        if encoder is None:
+            encoder = encoders[key] = msgspec.json.Encoder(
+                enc_hook=default, order='sorted' if sort_keys else None)
+        return encoder.encode(obj)
+
+    return 'msgspec', encode, (msgspec.EncodeError, TypeError, OverflowError)
+
+
+def load_backend(name: Optional[str] = None):
+    """
+    Pick the fast JSON encoder.
+
+    Args:
+        name (str): 'auto', 'orjson', 'msgspec' or 'stdlib' (default: JSON_BACKEND)
+
+    Returns:
+        tuple: (name, encode function, exception types) or None for stdlib
+    """
+    name = name or JSON_BACKEND
+    if name == 'stdlib':
+        return None
+    loaders = {'orjson': (_load_orjson,), 'msgspec': (_load_msgspec,)}
+    for loader in loaders.get(name, (_load_orjson, _load_msgspec)):
+        backend = loader()
+        if backend is not None:
+            return backend
+    return None
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson/msgspec with a stdlib fallback."""
+
+    def __init__(self, app):
+        super().__init__(app)
+        backend = load_backend()
+        self.backend = backend[0] if backend else 'stdlib'
+        self._encode = backend[1] if backend else None
+        self._encode_errors = backend[2] if backend else ()
+
+    def dumps_bytes(self, obj: Any) -> bytes:
+        """
+        Serialize data to compact JSON bytes, as
+        ``json.dumps(obj, separators=(',', ':'), ...)`` with this provider's
+        settings would (see the module docstring for how floats differ).
+        """
+        if self._encode is not None:
+            try:
+                body = self._encode(obj, self.default, self.sort_keys)
+            except self._encode_errors:
+                pass
+            else:
+                # The stdlib escapes everything outside printable ASCII
+                if not self.ensure_ascii or (body.isascii() and b'\x7f' not in body):
+                    return body
+        return self.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+    def response(self, *args: Any, **kwargs: Any):
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            return super().response(*args, **kwargs)
+
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.dumps_bytes(obj) + b'\n', mimetype=self.mimetype)
+
+
+def _encode_msgpack(obj: Any) -> bytes:
+    import msgpack
+    return msgpack.packb(obj, use_bin_type=True)
+
+
+def _encode_cbor(obj: Any) -> bytes:
+    import cbor2
+    return cbor2.dumps(obj)
+
+
+def _binary_encoders() -> Dict[str, Callable[[Any], bytes]]:
+    """
+    Binary formats available in this installation, by mimetype. The modules
+    are only located here and imported by the first response in that format.
+    """
+    encoders = {}
+    if importlib.util.find_spec('msgpack') is not None:
+        for mimetype in MSGPACK_MIMETYPES:
+            encoders[mimetype] = _encode_msgpack
+    if importlib.util.find_spec('cbor2') is not None:
+        encoders[CBOR_MIMETYPE] = _encode_cbor
+    return encoders
+
+
+BINARY_ENCODERS = _binary_encoders()
+
+# JSON first, so that */* and missing Accept headers keep getting JSON
+OFFERED_MIMETYPES = (JSON_MIMETYPE,) + tuple(BINARY_ENCODERS)
+
+
+def negotiate_mimetype() -> str:
+    """Pick the response format for the current request from its Accept header"""
+    if len(OFFERED_MIMETYPES) == 1 or not request.accept_mimetypes:
+        return JSON_MIMETYPE
+    return request.accept_mimetypes.best_match(OFFERED_MIMETYPES, default=JSON_MIMETYPE)
+
+
+def encode(payload: Any, mimetype: str) -> bytes:
+    """Encode a payload in the given (offered) format"""
+    if mimetype == JSON_MIMETYPE:
+        return current_app.json.response(payload).get_data()
+    return BINARY_ENCODERS[mimetype](payload)
+
+
+def cached_response(entry: Optional[dict], source: Any, build_payload: Callable[[], Any]):
+    """
+    Build a response in the format negotiated from the Accept header,
+    reusing the body encoded for the same data and format before.
+
+    Encoded bodies are kept per mimetype on the cache entry under
+    ``"encoded"`` together with the data object they were built from; once
+    the entry's data is replaced the old bodies are ignored and rebuilt on
+    the next request.
+
+    Args:
+        entry (dict): Cache entry that ``source`` came from, or None if the
+            data is not cached (the body is then encoded every time)
+        source: The cached data object the payload is built from
+        build_payload (Callable): Returns the object to serialize
+
+    Returns:
+        Response: The encoded response
+    """
+    mimetype = negotiate_mimetype()
+    if entry is None:
+        body = encode(build_payload(), mimetype)
+    else:
+        encoded = entry.get('encoded')
+        if encoded is None or encoded[0] is not source:
+            encoded = (source, {})
+            entry['encoded'] = encoded
+
+        body = encoded[1].get(mimetype)
+        if body is None:
+            body = encode(build_payload(), mimetype)
+            encoded[1][mimetype] = body
+
+    response = current_app.response_class(body, mimetype=mimetype)
+    if len(OFFERED_MIMETYPES) > 1:
+        response.vary.add('Accept')
+    return response
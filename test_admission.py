@@ -0,0 +1,115 @@
+import unittest
+import threading
+from unittest.mock import patch
+import admission
+
+
+class TestQueueTime(unittest.TestCase):
+    """Test cases for parsing the X-Request-Start header"""
+    
+    def test_formats(self):
+        """Test the nginx, seconds, milliseconds and microseconds formats"""
+        now = 1700000010.0
+        for header in ('t=1700000000.000', '1700000000', '1700000000000', '1700000000000000'):
+            with self.subTest(header=header):
+                self.assertAlmostEqual(admission.queue_time(header, now), 10.0)
+    
+    def test_missing_or_invalid(self):
+        """Test that missing or malformed headers are ignored"""
+        self.assertIsNone(admission.queue_time(None))
+        self.assertIsNone(admission.queue_time('t=soon'))
+    
+    def test_clock_skew(self):
+        """Test that a start time in the future counts as no queueing"""
+        self.assertEqual(admission.queue_time('t=1700000020', 1700000010.0), 0.0)
+
+
+class TestAdmissionController(unittest.TestCase):
+    """Test cases for the per-worker upstream concurrency limit"""
+    
+    def test_sheds_when_slots_are_taken(self):
+        """Test that a request is shed once every slot stays busy past max_wait"""
+        controller = admission.AdmissionController(max_inflight=1, max_wait=0.01,
+                                                   max_queue_time=0, retry_after=7)
+        
+        with controller.upstream_slot():
+            self.assertEqual(controller.inflight, 1)
+            with self.assertRaises(admission.Overloaded) as ctx:
+                with controller.upstream_slot():
+                    pass
+        
+        self.assertEqual(ctx.exception.reason, 'concurrency')
+        self.assertEqual(ctx.exception.retry_after, 7)
+        self.assertEqual(controller.inflight, 0)
+        
+        # The slot is released, even when the block raises
+        with self.assertRaises(ValueError):
+            with controller.upstream_slot():
+                raise ValueError()
+        with controller.upstream_slot():
+            pass
+    
+    def test_waits_for_a_free_slot(self):
+        """Test that a request waiting less than max_wait gets the freed slot"""
+        controller = admission.AdmissionController(max_inflight=1, max_wait=5,
+                                                   max_queue_time=0, retry_after=1)
+        acquired = threading.Event()
+        release = threading.Event()
+        
+        def hold():
+            with controller.upstream_slot():
+                acquired.set()
+                release.wait(5)
+        
+        holder = threading.Thread(target=hold)
+        holder.start()
+        acquired.wait(5)
+        threading.Timer(0.05, release.set).start()
+        
+        with controller.upstream_slot():
+            self.assertEqual(controller.inflight, 1)
+        holder.join()
+    
+    def test_unlimited(self):
+        """Test that max_inflight=0 disables the concurrency limit"""
+        controller = admission.AdmissionController(max_inflight=0, max_wait=0,
+                                                   max_queue_time=0, retry_after=1)
+        with controller.upstream_slot(), controller.upstream_slot():
+            self.assertEqual(controller.inflight, 2)
+
+    
+    def test_resize(self):
+        """Test that a resized controller enforces the new limit"""
+        controller = admission.AdmissionController(max_inflight=0, max_wait=0.01,
+                                                   max_queue_time=0, retry_after=1)
+        controller.resize(1)
+        with controller.upstream_slot():
+            with self.assertRaises(admission.Overloaded):
+                with controller.upstream_slot():
+                    pass
+
+
+class TestInflightLimit(unittest.TestCase):
+    """Test cases for sizing the in-flight limit from the gunicorn worker"""
+    
+    def test_sync_worker(self):
+        """Test that a sync worker, which serves one request at a time, gets no in-flight limit"""
+        self.assertEqual(admission.inflight_limit('sync', 1), 0)
+    
+    def test_threaded_worker(self):
+        """Test that threaded workers keep one thread free for cache hits and /health"""
+        self.assertEqual(admission.inflight_limit('gthread', 4), 3)
+        self.assertEqual(admission.inflight_limit('gthread', 1), 0)
+        # gunicorn runs sync workers with threads as gthread
+        self.assertEqual(admission.inflight_limit('sync', 8), 7)
+    
+    def test_default_and_override(self):
+        """Test the limit outside gunicorn and an explicit ADMISSION_MAX_INFLIGHT"""
+        self.assertEqual(admission.inflight_limit(), admission.DEFAULT_MAX_INFLIGHT)
+        self.assertEqual(admission.inflight_limit('gevent', 1), admission.DEFAULT_MAX_INFLIGHT)
+        with patch('admission.ADMISSION_MAX_INFLIGHT', '2'):
+            self.assertEqual(admission.inflight_limit('sync', 1), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
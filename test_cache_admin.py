@@ -0,0 +1,110 @@
+import unittest
+import os
+import tempfile
+import cache_admin
+
+
+class TestCommandLog(unittest.TestCase):
+    """Test cases for the command log shared by the workers"""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, 'commands.log')
+
+    def test_commands_reach_every_reader(self):
+        """Test that every worker sees each command once, in order"""
+        worker1 = cache_admin.CommandLog(self.path)
+        worker2 = cache_admin.CommandLog(self.path)
+
+        worker1.append({'action': 'invalidate', 'keys': ['characters']})
+        worker2.append({'action': 'invalidate', 'prefix': 'character:'})
+
+        expected = [{'action': 'invalidate', 'keys': ['characters']},
+                    {'action': 'invalidate', 'prefix': 'character:'}]
+        self.assertEqual(worker1.poll(), expected)
+        self.assertEqual(worker2.poll(), expected)
+        self.assertEqual(worker1.poll(), [])
+
+    def test_skips_commands_before_start(self):
+        """Test that a worker started later does not replay older commands"""
+        cache_admin.CommandLog(self.path).append({'action': 'invalidate', 'keys': ['characters']})
+
+        self.assertEqual(cache_admin.CommandLog(self.path).poll(), [])
+
+    def test_partial_line_and_reset(self):
+        """Test that half-written commands wait and a truncated log is followed"""
+        reader = cache_admin.CommandLog(self.path)
+        with open(self.path, 'ab') as f:
+            f.write(b'{"action": "invali')
+        self.assertEqual(reader.poll(), [])
+
+        with open(self.path, 'ab') as f:
+            f.write(b'date", "keys": []}\n')
+        self.assertEqual(reader.poll(), [{'action': 'invalidate', 'keys': []}])
+
+        os.remove(self.path)
+        cache_admin.CommandLog(self.path).append({'action': 'prewarm'})
+        self.assertEqual(reader.poll(), [])
+        cache_admin.CommandLog(self.path).append({'action': 'prewarm'})
+        self.assertEqual(reader.poll(), [{'action': 'prewarm'}])
+
+    def test_rotation(self):
+        """Test that readers follow the log across a rotation without losing commands"""
+        writer = cache_admin.CommandLog(self.path, max_bytes=100)
+        reader = cache_admin.CommandLog(self.path, max_bytes=100)
+        commands = [{'action': 'prewarm', 'characters': [{'id': i, 'name': 'x' * 40}]} for i in range(3)]
+
+        writer.append(commands[0])
+        writer.append(commands[1])
+        self.assertTrue(os.path.exists(self.path + '.1'))
+        writer.append(commands[2])
+
+        self.assertEqual(reader.poll(), commands)
+        self.assertEqual(writer.poll(), commands)
+        self.assertLessEqual(os.path.getsize(self.path), 100)
+
+    def test_missed_rotation_invalidates_everything(self):
+        """Test that a reader that slept through two rotations drops every cache"""
+        writer = cache_admin.CommandLog(self.path, max_bytes=100)
+        reader = cache_admin.CommandLog(self.path, max_bytes=100)
+        writer.append({'action': 'prewarm', 'characters': [{'id': 1, 'name': 'x' * 120}]})
+        writer.append({'action': 'prewarm', 'characters': [{'id': 2, 'name': 'x' * 120}]})
+        writer.append({'action': 'invalidate', 'keys': ['characters']})
+
+        self.assertEqual(reader.poll(), [{'action': 'invalidate', 'keys': None, 'prefix': ''},
+                                         {'action': 'invalidate', 'keys': ['characters']}])
+
+    def test_reset_after_fork(self):
+        """Test that reset skips the commands logged before the worker started"""
+        log = cache_admin.CommandLog(self.path)
+        log.append({'action': 'invalidate', 'keys': ['characters']})
+        log.reset()
+
+        self.assertEqual(log.poll(), [])
+        log.append({'action': 'prewarm'})
+        self.assertEqual(log.poll(), [{'action': 'prewarm'}])
+
+    def test_in_process(self):
+        """Test that without a path commands only reach this process"""
+        log = cache_admin.CommandLog(None)
+        log.append({'action': 'prewarm'})
+
+        self.assertEqual(log.poll(), [{'action': 'prewarm'}])
+        self.assertEqual(log.poll(), [])
+
+
+class TestKeyMatches(unittest.TestCase):
+    """Test cases for selecting cache keys"""
+
+    def test_keys_and_prefix(self):
+        """Test selection by explicit keys and by prefix"""
+        self.assertTrue(cache_admin.key_matches('character:1', keys=['character:1']))
+        self.assertFalse(cache_admin.key_matches('character:12', keys=['character:1']))
+        self.assertTrue(cache_admin.key_matches('character:12', prefix='character:'))
+        self.assertTrue(cache_admin.key_matches('characters', prefix=''))
+        self.assertFalse(cache_admin.key_matches('characters'))
+
+
+if __name__ == '__main__':
+    unittest.main()
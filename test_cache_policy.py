@@ -0,0 +1,60 @@
+import unittest
+from unittest.mock import patch
+from flask import Flask
+import cache_policy
+
+
+@patch('cache_policy.CACHE_TTL_MIN', 5)
+@patch('cache_policy.CACHE_TTL_MAX', 600)
+class TestMaxAge(unittest.TestCase):
+    """Test cases for per-request freshness limits"""
+
+    def setUp(self):
+        self.app = Flask(__name__)
+
+    def max_age(self, path='/', headers=None, ttl=300):
+        with self.app.test_request_context(path, headers=headers):
+            return cache_policy.max_age(ttl)
+
+    def test_defaults_to_resource_ttl(self):
+        """Test that requests without a policy use the resource TTL"""
+        self.assertEqual(self.max_age(), 300)
+        self.assertEqual(cache_policy.max_age(300), 300)
+
+    def test_client_policy(self):
+        """Test that cache_ttl and Cache-Control set the limit"""
+        self.assertEqual(self.max_age('/?cache_ttl=60'), 60)
+        self.assertEqual(self.max_age('/?cache_ttl=900'), 600)
+        self.assertEqual(self.max_age(headers={'Cache-Control': 'max-age=30'}), 30)
+        self.assertEqual(self.max_age('/?cache_ttl=20', headers={'Cache-Control': 'max-age=30'}), 20)
+        self.assertEqual(self.max_age('/?cache_ttl=oops'), 300)
+
+    def test_server_bounds(self):
+        """Test that clients cannot force refreshes faster than CACHE_TTL_MIN"""
+        self.assertEqual(self.max_age(headers={'Cache-Control': 'no-cache'}), 5)
+        self.assertEqual(self.max_age(headers={'Cache-Control': 'max-age=0'}), 5)
+        self.assertEqual(self.max_age('/?cache_ttl=1'), 5)
+        # The floor never loosens a resource with a shorter TTL
+        self.assertEqual(self.max_age(headers={'Cache-Control': 'no-cache'}, ttl=3), 3)
+
+    def test_is_fresh(self):
+        """Test freshness against the request's limit"""
+        with self.app.test_request_context('/?cache_ttl=60'):
+            self.assertTrue(cache_policy.is_fresh(1000, 300, now=1059))
+            self.assertFalse(cache_policy.is_fresh(1000, 300, now=1060))
+
+
+class TestCacheControl(unittest.TestCase):
+    """Test cases for the shared-cache policy"""
+
+    def test_directives(self):
+        """Test that the policy carries the TTL and the stale allowances"""
+        with patch('cache_policy.CACHE_STALE_WHILE_REVALIDATE', 30), patch('cache_policy.CACHE_STALE_IF_ERROR', 600):
+            self.assertEqual(cache_policy.cache_control(300),
+                             'public, max-age=300, stale-while-revalidate=30, stale-if-error=600')
+        with patch('cache_policy.CACHE_STALE_WHILE_REVALIDATE', 0), patch('cache_policy.CACHE_STALE_IF_ERROR', 0):
+            self.assertEqual(cache_policy.cache_control(60.5), 'public, max-age=60')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import unittest
+from unittest.mock import patch
+import os
+import tempfile
+import time
+import requests
+import cassette
+import upstream
+from benchmarks.fake_upstream import FakeUpstream
+
+
+class TestCassette(unittest.TestCase):
+    """Test cases for the on-disk response store"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'cassette.sqlite3')
+
+    def test_round_trip(self):
+        """Test that a replayed response has the recorded status, headers and body"""
+        store = cassette.Cassette(self.path)
+        store.record('http://u/api/character/1', 200,
+                     {'Content-Type': 'application/json', 'Content-Encoding': 'gzip'}, b'{"id": 1}')
+        store.record('http://u/api/character/0', 404, {}, b'{"error": "Character not found"}')
+
+        response = cassette.Cassette(self.path).replay('http://u/api/character/1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'id': 1})
+        self.assertEqual(response.headers['content-type'], 'application/json')
+        self.assertNotIn('Content-Encoding', response.headers)
+
+        with self.assertRaises(requests.exceptions.HTTPError) as ctx:
+            store.replay('http://u/api/character/0').raise_for_status()
+        self.assertEqual(ctx.exception.response.status_code, 404)
+
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            store.replay('http://u/api/character/2')
+        self.assertEqual(len(store), 2)
+
+    def test_injected_latency(self):
+        """Test that replays sleep for the configured or the recorded latency"""
+        cassette.Cassette(self.path).record('http://u/api/character', 200, {}, b'{}', latency=0.05)
+        self.assertEqual(cassette.replay_latency('recorded'), None)
+        self.assertEqual(cassette.replay_latency('0.2'), 0.2)
+
+        for latency, expected in ((None, 0.05), (0.1, 0.1)):
+            with self.subTest(latency=latency):
+                start = time.time()
+                cassette.Cassette(self.path, latency=latency).replay('http://u/api/character')
+                self.assertGreaterEqual(time.time() - start, expected * 0.9)
+
+
+class TestRecordReplay(unittest.TestCase):
+    """Test cases for recording from and replaying to the upstream client"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.store = cassette.Cassette(os.path.join(directory.name, 'cassette.sqlite3'))
+        for target, value in (('cassette._store', self.store),
+                              ('upstream.limiter', upstream.AdaptiveLimiter(max_wait=1))):
+            patcher = patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_record_then_replay_offline(self):
+        """Test that calls recorded from a live upstream are replayed once it is gone"""
+        with FakeUpstream(pages=2) as fake, patch('cassette.UPSTREAM_MODE', 'record'):
+            live = upstream.get(f"{fake.api_url}?page=2", 'characters').json()
+            with self.assertRaises(requests.exceptions.HTTPError):
+                upstream.get(f"{fake.api_url}/{fake.count + 1}", 'character')
+            api_url = fake.api_url
+
+        with patch('cassette.UPSTREAM_MODE', 'replay'), patch('upstream.requests.get') as mock_get:
+            self.assertEqual(upstream.get(f"{api_url}?page=2", 'characters').json(), live)
+            with self.assertRaises(requests.exceptions.HTTPError) as ctx:
+                upstream.get(f"{api_url}/{len(live['results']) * 2 + 1}", 'character')
+            self.assertEqual(ctx.exception.response.status_code, 404)
+            with self.assertRaises(cassette.CassetteMiss):
+                upstream.get(f"{api_url}?page=1", 'characters')
+        mock_get.assert_not_called()
+
+    def test_record_list_page_records_details(self):
+        """Test that a list page recorded by the app also records its characters' detail URLs"""
+        with FakeUpstream(pages=2) as fake, patch('cassette.UPSTREAM_MODE', 'record'):
+            page = upstream.get(f"{fake.api_url}?page=2", 'characters').json()
+            api_url = fake.api_url
+
+        character = page['results'][0]
+        with patch('cassette.UPSTREAM_MODE', 'replay'):
+            self.assertEqual(upstream.get(f"{api_url}/{character['id']}", 'character').json(), character)
+        self.assertEqual(len(self.store), 1 + len(page['results']))
+
+    def test_record_crawl(self):
+        """Test that the recording CLI stores every page and every character's detail URL"""
+        with FakeUpstream(pages=3) as fake:
+            count = cassette.record_crawl(fake.api_url, self.store)
+            calls = fake.stats()['calls']
+
+        self.assertEqual(count, fake.count)
+        self.assertEqual(calls, 3)
+        self.assertEqual(len(self.store), 3 + fake.count)
+        self.assertEqual(self.store.replay(f"{fake.api_url}/7").json()['id'], 7)
+
+
+if __name__ == '__main__':
+    unittest.main()
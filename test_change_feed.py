@@ -0,0 +1,153 @@
+import os
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+import change_feed
+
+
+def characters(*changes, count=4):
+    """A character list with the given (id, name) overrides"""
+    names = dict(changes)
+    return [{'id': i, 'name': names.get(i, f"Character {i}")} for i in range(1, count + 1)]
+
+
+class TestChangeFeed(unittest.TestCase):
+    """Test cases for diffing character lists"""
+
+    def test_diff_and_versions(self):
+        """Test that added, changed and removed ids are published with content-based versions"""
+        feed = change_feed.ChangeFeed()
+        self.assertIsNone(feed.update(characters()))
+        first = feed.version
+
+        self.assertIsNone(feed.update(characters()))
+        self.assertEqual(feed.version, first)
+
+        updated = characters((2, 'Renamed'), count=5)[1:]
+        event = feed.update(updated)
+        self.assertEqual(event['data'], {'added': [5], 'changed': [2], 'removed': [1]})
+        self.assertEqual(event['id'], feed.version)
+
+        # The version only depends on the content
+        other = change_feed.ChangeFeed()
+        other.update(list(updated))
+        self.assertEqual(other.version, feed.version)
+
+    def test_resume(self):
+        """Test that a subscriber resumes after a known version and is reset after an unknown one"""
+        feed = change_feed.ChangeFeed(history_size=2)
+        feed.update(characters())
+        first = feed.version
+        second = feed.update(characters((1, 'A')))
+        third = feed.update(characters((1, 'B')))
+
+        self.assertEqual(feed.subscribe(second['id'])[1], [third])
+        self.assertEqual(feed.subscribe(third['id'])[1], [])
+        # The first version has dropped out of the history
+        self.assertIsNone(feed.subscribe(first)[1])
+
+    def test_bounded_buffer(self):
+        """Test that a subscriber that falls behind is flagged instead of buffering without bound"""
+        feed = change_feed.ChangeFeed(buffer_size=2)
+        feed.update(characters())
+        subscriber, _ = feed.subscribe()
+        for name in 'ABC':
+            feed.update(characters((1, name)))
+
+        self.assertEqual(subscriber.events.qsize(), 2)
+        self.assertTrue(subscriber.overflowed)
+
+        feed.unsubscribe(subscriber)
+        feed.update(characters((1, 'D')))
+        self.assertEqual(subscriber.events.qsize(), 2)
+
+    def test_stream_limit(self):
+        """Test that subscribers above the limit are refused until one leaves"""
+        feed = change_feed.ChangeFeed(stream_limit=2)
+        first, _ = feed.subscribe()
+        feed.subscribe()
+        with self.assertRaises(change_feed.TooManyStreams):
+            feed.subscribe()
+
+        feed.unsubscribe(first)
+        feed.subscribe()
+
+    def test_worker_stream_limit(self):
+        """Test the limit for each gunicorn worker class"""
+        self.assertEqual(change_feed.stream_limit('gthread', 4), 2)
+        self.assertEqual(change_feed.stream_limit('gthread', 32), 16)
+        self.assertEqual(change_feed.stream_limit('sync', 1), 0)
+        self.assertIsNone(change_feed.stream_limit('gevent', 1))
+        self.assertEqual(change_feed.stream_limit(), change_feed.DEFAULT_MAX_STREAMS)
+        with patch('change_feed.SSE_MAX_STREAMS', '3'):
+            self.assertEqual(change_feed.stream_limit('sync', 1), 3)
+
+        with patch('change_feed.max_streams', 0):
+            with self.assertRaises(change_feed.TooManyStreams):
+                change_feed.ChangeFeed().subscribe()
+
+    def test_shared_refresher(self):
+        """Test that one thread refreshes for every subscriber, and only while there are any"""
+        feed = change_feed.ChangeFeed()
+        calls = []
+        refreshed = threading.Event()
+        def refresh():
+            calls.append(threading.current_thread())
+            refreshed.set()
+
+        subscribers = [feed.subscribe()[0] for _ in range(3)]
+        for _ in subscribers:
+            feed.ensure_refresher(refresh, interval=0.01)
+        self.assertTrue(refreshed.wait(1))
+        self.assertEqual(len(set(calls)), 1)
+        self.assertEqual(feed._refresher_pid, os.getpid())
+
+        for subscriber in subscribers:
+            feed.unsubscribe(subscriber)
+        time.sleep(0.05)
+        count = len(calls)
+        time.sleep(0.05)
+        self.assertEqual(len(calls), count)
+
+
+class TestStream(unittest.TestCase):
+    """Test cases for the event stream"""
+
+    def test_events(self):
+        """Test that changes published while streaming are sent, with keep-alives in between"""
+        feed = change_feed.ChangeFeed()
+        feed.update(characters())
+        version = feed.version
+        subscriber, backlog = feed.subscribe()
+        timer = threading.Timer(0.05, feed.update, [characters((3, 'Changed'))])
+        timer.start()
+        self.addCleanup(timer.cancel)
+
+        chunks = list(change_feed.stream(feed, subscriber, backlog, None, poll_interval=0.01, max_duration=0.2))
+
+        self.assertEqual(chunks[0], f"retry: {change_feed.SSE_RETRY_MS}\n\n")
+        self.assertEqual(chunks[1], f"id: {version}\nevent: version\ndata: {{}}\n\n")
+        self.assertEqual(chunks[2], ": keep-alive\n\n")
+        self.assertIn(f"id: {feed.version}\nevent: changes\n"
+                      'data: {"added":[],"changed":[3],"removed":[]}\n\n', chunks)
+        self.assertEqual(feed._subscribers, [])
+
+    def test_overflow_resets(self):
+        """Test that an overflowed subscriber gets a reset event"""
+        feed = change_feed.ChangeFeed(buffer_size=1)
+        feed.update(characters())
+        subscriber, backlog = feed.subscribe()
+        events = change_feed.stream(feed, subscriber, backlog, None, poll_interval=0.01, max_duration=0.1)
+        next(events), next(events)
+        for name in 'AB':
+            feed.update(characters((1, name)))
+
+        self.assertEqual(next(events), f"id: {feed.version}\nevent: reset\ndata: {{}}\n\n")
+        events.close()
+        self.assertEqual(feed._subscribers, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import unittest
+from unittest.mock import patch
+import csv
+import json
+import os
+import tempfile
+import character_records
+import exporter
+from benchmarks.fake_upstream import FakeUpstream, make_character
+
+
+class TestExport(unittest.TestCase):
+    """Test cases for the batch exporter against the local fake upstream"""
+
+    def setUp(self):
+        self.upstream = FakeUpstream(pages=5).start()
+        self.addCleanup(self.upstream.stop)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.characters = [character_records.format_character_detail(make_character(i, self.upstream.base_url))
+                           for i in range(1, self.upstream.count + 1)]
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def test_step1_csv(self):
+        """Test that the default export is the Step 1 CSV of living humans from Earth (C-137)"""
+        result = exporter.export(self.upstream.api_url, self.path('characters.csv'))
+
+        with open(self.path('characters.csv'), newline='') as f:
+            rows = list(csv.reader(f))
+        expected = [[c['name'], c['location'], c['image_url']] for c in self.characters
+                    if all(c[field] == value for field, value in exporter.STEP1_FILTERS.items())]
+        self.assertEqual(rows[0], ['Name', 'Location', 'Image'])
+        self.assertEqual(rows[1:], expected)
+        self.assertGreater(len(expected), 0)
+        self.assertEqual(result, {'rows': len(expected), 'pages': 5, 'resumed_after': 0})
+        self.assertFalse(os.path.exists(self.path('characters.csv.checkpoint')))
+
+    def test_resume_after_interruption(self):
+        """Test that an interrupted export resumes after its last completed page"""
+        fetch_page = character_records.fetch_character_page
+
+        def failing_fetch(url):
+            if url.endswith('page=4'):
+                raise KeyboardInterrupt
+            return fetch_page(url)
+
+        output = self.path('characters.jsonl')
+        with patch('character_records.fetch_character_page', failing_fetch):
+            with self.assertRaises(KeyboardInterrupt):
+                exporter.export(self.upstream.api_url, output, filters={}, fields=['id', 'name'], workers=1)
+        with open(output, 'ab') as f:
+            f.write(b'{"id": "partial')
+
+        self.upstream.reset()
+        result = exporter.export(self.upstream.api_url, output, filters={}, fields=['id', 'name'], workers=1)
+
+        with open(output) as f:
+            rows = [json.loads(line) for line in f]
+        self.assertEqual(rows, [{'id': c['id'], 'name': c['name']} for c in self.characters])
+        self.assertEqual(result['resumed_after'], 3)
+        # The first page again for the page count, then pages 4 and 5
+        self.assertEqual(self.upstream.stats()['calls'], 3)
+
+    def test_changed_arguments_restart(self):
+        """Test that a checkpoint saved with other arguments is not resumed"""
+        output = self.path('characters.csv')
+        with open(f"{output}.checkpoint", 'w') as f:
+            json.dump({'settings': {'format': 'jsonl'}, 'pages': 2, 'offset': 10, 'rows': 1, 'next_url': None}, f)
+
+        result = exporter.export(self.upstream.api_url, output, filters={})
+
+        self.assertEqual(result, {'rows': self.upstream.count, 'pages': 5, 'resumed_after': 0})
+
+    @unittest.skipIf(exporter._load_pyarrow() is None, "pyarrow is not installed")
+    def test_parquet(self):
+        """Test that Parquet output holds the filtered rows"""
+        import pyarrow.parquet
+
+        exporter.export(self.upstream.api_url, self.path('aliens.parquet'), filters={'species': 'Alien'},
+                        fields=['id', 'species'])
+
+        table = pyarrow.parquet.read_table(self.path('aliens.parquet'))
+        self.assertEqual(table.to_pylist(), [{'id': c['id'], 'species': 'Alien'} for c in self.characters
+                                             if c['species'] == 'Alien'])
+        self.assertFalse(os.path.exists(self.path('aliens.parquet.jsonl')))
+
+
+if __name__ == '__main__':
+    unittest.main()
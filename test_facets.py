@@ -0,0 +1,62 @@
+import unittest
+import facets
+
+
+def character(character_id, status='Alive', species='Human', origin='Earth (C-137)', location='Citadel of Ricks'):
+    return {'id': character_id, 'name': f"Character {character_id}", 'status': status,
+            'species': species, 'origin': origin, 'location': location}
+
+
+CHARACTERS = [
+    character(1),
+    character(2, species='Alien'),
+    character(3, status='Dead'),
+    character(4, status='Dead', species='Alien', origin=None),
+]
+
+
+class TestFacetIndex(unittest.TestCase):
+    """Test cases for precomputed facet counts"""
+
+    def test_counts_match_a_scan(self):
+        """Test that every filter combination gives the same counts as filtering the list"""
+        index = facets.FacetIndex()
+        index.refresh(CHARACTERS)
+
+        for filters in ({}, {'status': 'Alive'}, {'status': 'Dead', 'species': 'Alien'},
+                        {'origin': 'unknown'}, {'species': 'Robot'}):
+            with self.subTest(filters=filters):
+                matching = [c for c in CHARACTERS
+                            if all((c[f] or facets.UNKNOWN) == v for f, v in filters.items())]
+                result = index.query(filters)
+                self.assertEqual(result['count'], len(matching))
+                for field in facets.FACET_FIELDS:
+                    expected = {}
+                    for c in matching:
+                        value = c[field] or facets.UNKNOWN
+                        expected[value] = expected.get(value, 0) + 1
+                    self.assertEqual(result['facets'][field], expected)
+
+    def test_incremental_refresh(self):
+        """Test that a new list only updates the changed characters"""
+        index = facets.FacetIndex()
+        index.refresh(CHARACTERS)
+
+        updated = [character(1, status='Dead'), CHARACTERS[1], CHARACTERS[2], character(5, species='Robot')]
+        index.refresh(updated)
+
+        self.assertEqual(index.query()['facets']['status'], {'Alive': 2, 'Dead': 2})
+        self.assertEqual(index.query()['facets']['species'], {'Human': 2, 'Alien': 1, 'Robot': 1})
+        self.assertEqual(index.query({'origin': 'unknown'})['count'], 0)
+        self.assertEqual(index.query({'status': 'Dead', 'species': 'Human'})['count'], 2)
+
+        fresh = facets.FacetIndex()
+        fresh.refresh(updated)
+        self.assertEqual(index._counts, fresh._counts)
+
+        index.refresh(None)
+        self.assertEqual(index.query(), {'count': 0, 'facets': {field: {} for field in facets.FACET_FIELDS}})
+
+
+if __name__ == '__main__':
+    unittest.main()
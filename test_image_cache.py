@@ -0,0 +1,84 @@
+import unittest
+from unittest.mock import patch
+import io
+import os
+import tempfile
+import time
+import image_cache
+from benchmarks.fake_upstream import make_avatar
+
+
+class TestDiskLRU(unittest.TestCase):
+    """Test cases for the size-bounded image directory"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def test_get_and_put(self):
+        """Test that stored files are found by key with a content ETag, in any instance"""
+        cache = image_cache.DiskLRU(self.directory, max_bytes=1000)
+        self.assertIsNone(cache.get('1/original'))
+
+        stored = cache.put('1/original', b'\xff\xd8\xff' + b'x' * 10)
+        self.assertEqual(stored.mimetype, 'image/jpeg')
+        with open(stored.path, 'rb') as f:
+            self.assertEqual(f.read(), b'\xff\xd8\xff' + b'x' * 10)
+
+        # Another worker sees the same file and ETag
+        other = image_cache.DiskLRU(self.directory, max_bytes=1000).get('1/original')
+        self.assertEqual(other, stored)
+
+        os.remove(stored.path)
+        self.assertIsNone(cache.get('1/original'))
+
+    def test_evicts_least_recently_used(self):
+        """Test that writes beyond the bound remove the least recently used files"""
+        cache = image_cache.DiskLRU(self.directory, max_bytes=250)
+        for key in ('a', 'b', 'c'):
+            cache.put(key, key.encode() * 100)
+            time.sleep(0.01)
+        self.assertIsNone(cache.get('a'))
+
+        self.assertIsNotNone(cache.get('b'))
+        time.sleep(0.01)
+        cache.put('d', b'd' * 100)
+
+        self.assertIsNotNone(cache.get('b'))
+        self.assertIsNone(cache.get('c'))
+        self.assertIsNotNone(cache.get('d'))
+
+        # A file larger than the bound is still kept until the next write
+        cache.put('e', b'e' * 300)
+        self.assertIsNotNone(cache.get('e'))
+        self.assertIsNone(cache.get('d'))
+
+
+@unittest.skipUnless(image_cache.thumbnails_available(), "Pillow is not installed")
+class TestThumbnail(unittest.TestCase):
+    """Test cases for resizing images"""
+
+    def test_make_thumbnail(self):
+        """Test that thumbnails fit in the requested size and bad images are rejected"""
+        from PIL import Image
+
+        thumbnail = image_cache.make_thumbnail(make_avatar(1), 64)
+        with Image.open(io.BytesIO(thumbnail)) as image:
+            self.assertEqual(image.size, (64, 64))
+            self.assertEqual(image.format, 'JPEG')
+
+        with self.assertRaises(image_cache.ImageError):
+            image_cache.make_thumbnail(b'not an image', 64)
+
+    def test_decompression_bomb(self):
+        """Test that images above Pillow's pixel limit are rejected, including those that only warn"""
+        # The 300x300 avatar is above the limit, and above twice the limit
+        for max_pixels in (60000, 30000):
+            with self.subTest(max_pixels=max_pixels), patch('PIL.Image.MAX_IMAGE_PIXELS', max_pixels):
+                with self.assertRaises(image_cache.ImageError):
+                    image_cache.make_thumbnail(make_avatar(1), 64)
+
+
+if __name__ == '__main__':
+    unittest.main()
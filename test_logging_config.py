@@ -0,0 +1,82 @@
+import unittest
+from unittest.mock import patch
+import json
+import logging
+import queue
+import sys
+import logging_config
+
+
+class TestJsonFormatter(unittest.TestCase):
+    """Test cases for the structured log format"""
+    
+    def make_record(self, msg, *args, **kwargs):
+        return logging.getLogger('rick_morty_api').makeRecord(
+            'rick_morty_api', logging.INFO, __file__, 1, msg, args, None, **kwargs)
+    
+    def test_fields_and_extras(self):
+        """Test that records render as one JSON object including extra= fields"""
+        record = self.make_record("Fetching data from: %s", "https://example.com",
+                                  extra={'character_id': 1})
+        
+        entry = json.loads(logging_config.JsonFormatter().format(record))
+        
+        self.assertEqual(entry['message'], 'Fetching data from: https://example.com')
+        self.assertEqual(entry['level'], 'INFO')
+        self.assertEqual(entry['logger'], 'rick_morty_api')
+        self.assertEqual(entry['character_id'], 1)
+        self.assertTrue(entry['time'].endswith('Z'))
+        self.assertNotIn('args', entry)
+    
+    def test_exception(self):
+        """Test that exception tracebacks are included"""
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            record = logging.getLogger('test').makeRecord(
+                'test', logging.ERROR, __file__, 1, "failed", (), sys.exc_info())
+        
+        entry = json.loads(logging_config.JsonFormatter().format(record))
+        self.assertIn('ValueError: boom', entry['exception'])
+
+
+class TestDeferredQueueHandler(unittest.TestCase):
+    """Test cases for the non-blocking queue handler"""
+    
+    def test_records_are_queued_unformatted(self):
+        """Test that formatting is left to the listener thread"""
+        log_queue = queue.Queue()
+        handler = logging_config.DeferredQueueHandler(log_queue)
+        handler.setFormatter(logging_config.JsonFormatter())
+        logger = logging.Logger('deferred')
+        logger.addHandler(handler)
+        
+        with patch.object(logging_config.JsonFormatter, 'format') as fmt:
+            logger.info("Returning character %s from cache", 42)
+        
+        fmt.assert_not_called()
+        record = log_queue.get_nowait()
+        self.assertEqual(record.msg, "Returning character %s from cache")
+        self.assertEqual(record.args, (42,))
+    
+    def test_full_queue_drops_records(self):
+        """Test that a full queue drops records instead of blocking the caller"""
+        handler = logging_config.DeferredQueueHandler(queue.Queue(maxsize=1))
+        logger = logging.Logger('deferred')
+        logger.addHandler(handler)
+        
+        logger.info("first")
+        logger.info("second")
+        
+        self.assertEqual(handler.dropped, 1)
+
+
+class TestSampling(unittest.TestCase):
+    """Test cases for sampling high-volume messages"""
+    
+    def test_sample_rates(self):
+        """Test the boundary sample rates"""
+        with patch('logging_config.LOG_HIT_SAMPLE_RATE', 0):
+            self.assertFalse(any(logging_config.sample_hit() for _ in range(100)))
+        with patch('logging_config.LOG_HIT_SAMPLE_RATE', 1):
+            self.assertTrue(all(logging_config.sample_hit() for _ in range(100)))
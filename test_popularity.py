@@ -0,0 +1,90 @@
+import unittest
+from unittest.mock import patch
+import threading
+import popularity
+
+
+class TestFrequencySketch(unittest.TestCase):
+    """Test cases for the count-min popularity sketch"""
+
+    def test_estimates_skewed_traffic(self):
+        """Test that frequent ids are estimated above rare ones and never underestimated"""
+        sketch = popularity.FrequencySketch(width=256, depth=4, hot_size=3, seed=1)
+        counts = {1: 200, 2: 120, 3: 80}
+        counts.update({character_id: 1 for character_id in range(4, 400)})
+        for character_id, count in counts.items():
+            for _ in range(count):
+                sketch.record(character_id)
+
+        for character_id, count in counts.items():
+            self.assertGreaterEqual(sketch.estimate(character_id), count)
+        self.assertEqual(sketch.hot_keys(), [1, 2, 3])
+        self.assertTrue(sketch.admit(2, 250))
+        self.assertFalse(sketch.admit(250, 2))
+
+    def test_aging(self):
+        """Test that counters are halved once the sample size is reached"""
+        sketch = popularity.FrequencySketch(width=64, depth=2, hot_size=2, sample_size=100, seed=1)
+        for _ in range(99):
+            sketch.record('rick')
+        self.assertEqual(sketch.estimate('rick'), 99)
+
+        sketch.record('morty')
+        self.assertEqual(sketch.estimate('rick'), 49)
+        self.assertEqual(sketch.hot_keys(), ['rick'])
+
+    def test_discard(self):
+        """Test that a discarded key leaves the hot keys but keeps its estimate"""
+        sketch = popularity.FrequencySketch(width=64, depth=2, hot_size=2, seed=1)
+        for key in ('rick', 'rick', 'morty'):
+            sketch.record(key)
+
+        sketch.discard('rick')
+        sketch.discard('summer')
+        self.assertEqual(sketch.hot_keys(), ['morty'])
+        self.assertEqual(sketch.estimate('rick'), 2)
+
+
+class TestChooseVictim(unittest.TestCase):
+    """Test cases for picking the entry to evict"""
+
+    def test_expired_first_then_least_popular(self):
+        """Test that expired entries go first, then the least requested one"""
+        sketch = popularity.FrequencySketch(width=64, seed=1)
+        for _ in range(5):
+            sketch.record(1)
+        sketch.record(2)
+        entries = {1: {"timestamp": 1000}, 2: {"timestamp": 1000}, 3: {"timestamp": 500}}
+
+        self.assertEqual(popularity.choose_victim(entries, sketch, ttl=300, now=1100), (3, True))
+
+        del entries[3]
+        self.assertEqual(popularity.choose_victim(entries, sketch, ttl=300, now=1100), (2, False))
+        self.assertEqual(popularity.choose_victim({}, sketch, ttl=300), (None, False))
+
+
+class TestRefresher(unittest.TestCase):
+    """Test cases for the hot-id refresher thread"""
+
+    def test_started_once_per_process(self):
+        """Test that the refresher thread is started once and runs periodically"""
+        ran = threading.Event()
+        refresher = popularity.Refresher(0.01, ran.set)
+
+        with patch('popularity.threading.Thread', wraps=threading.Thread) as thread:
+            refresher.ensure_started()
+            refresher.ensure_started()
+
+        self.assertEqual(thread.call_count, 1)
+        self.assertTrue(ran.wait(5))
+
+    def test_disabled(self):
+        """Test that an interval of 0 disables the refresher"""
+        refresher = popularity.Refresher(0, lambda: None)
+        with patch('popularity.threading.Thread') as thread:
+            refresher.ensure_started()
+        thread.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
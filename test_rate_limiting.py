@@ -0,0 +1,142 @@
+import unittest
+from unittest.mock import patch
+import json
+import os
+import tempfile
+from flask import Flask
+import rate_limiting
+
+
+class TestLoadConfig(unittest.TestCase):
+    """Test cases for the tier configuration"""
+    
+    CONFIG = {
+        'tiers': {'partner': {'limit': 600, 'per': 60}},
+        'api_keys': {'abc123': 'partner'}
+    }
+    
+    def test_inline_and_file(self):
+        """Test that the config is read from inline JSON or a file"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'tiers.json')
+            with open(path, 'w') as f:
+                json.dump(self.CONFIG, f)
+        
+            for source in (json.dumps(self.CONFIG), path):
+                with self.subTest(source=source):
+                    tiers, api_keys = rate_limiting.load_config(source)
+                    self.assertEqual(tiers['partner'].limit, 600)
+                    self.assertEqual(tiers['partner'].rate, 10)
+                    self.assertEqual(api_keys, {'abc123': 'partner'})
+    
+    def test_empty(self):
+        """Test that no configuration means no tiers or keys"""
+        self.assertEqual(rate_limiting.load_config(''), ({}, {}))
+    
+    def test_invalid(self):
+        """Test that unknown tiers and non-positive limits are rejected"""
+        with self.assertRaises(ValueError):
+            rate_limiting.load_config(json.dumps({'api_keys': {'abc123': 'gold'}}))
+        with self.assertRaises(ValueError):
+            rate_limiting.load_config(json.dumps({'tiers': {'free': {'limit': 0, 'per': 60}}}))
+
+
+class TestTokenBucket(unittest.TestCase):
+    """Test cases for taking tokens from client buckets"""
+    
+    def setUp(self):
+        self.buckets = {}
+        self.tier = rate_limiting.Tier('test', limit=10, per=10)
+        self.now = 1000.0
+        patcher = patch('rate_limiting.time.time', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def take(self, cost, force=False, key='ip:1.2.3.4'):
+        """Take tokens and return the resulting response headers"""
+        allowed, tokens = rate_limiting.take(self.buckets, key, self.tier, cost, force=force)
+        return allowed, rate_limiting.quota_headers(self.tier, tokens, None if allowed else cost)
+    
+    def test_burst_and_refill(self):
+        """Test that a full bucket allows a burst and then refills over time"""
+        for _ in range(10):
+            allowed, headers = self.take(1)
+            self.assertTrue(allowed)
+        self.assertEqual(headers['X-RateLimit-Remaining'], '0')
+        self.assertEqual(headers['X-RateLimit-Reset'], '10')
+        
+        allowed, headers = self.take(1)
+        self.assertFalse(allowed)
+        self.assertEqual(headers['Retry-After'], '1')
+        
+        self.now += 2
+        allowed, headers = self.take(1)
+        self.assertTrue(allowed)
+        self.assertEqual(headers['X-RateLimit-Remaining'], '1')
+    
+    def test_forced_charge_goes_into_debt(self):
+        """Test that upstream surcharges can leave a bucket in debt"""
+        self.take(8)
+        allowed, headers = self.take(6, force=True)
+        
+        self.assertTrue(allowed)
+        self.assertEqual(headers['X-RateLimit-Remaining'], '0')
+        
+        allowed, headers = self.take(1)
+        self.assertFalse(allowed)
+        self.assertEqual(headers['Retry-After'], '5')
+    
+    def test_prune_full_buckets(self):
+        """Test that refilled buckets are dropped once the store is full"""
+        with patch('rate_limiting.RATE_LIMIT_MAX_CLIENTS', 2):
+            self.take(1, key='ip:a')
+            self.take(10, key='ip:b')
+            self.now += 5
+            self.take(1, key='ip:c')
+        
+        self.assertEqual(set(self.buckets), {'ip:b', 'ip:c'})
+
+
+class TestClientIdentity(unittest.TestCase):
+    """Test cases for identifying clients by API key or address"""
+    
+    def setUp(self):
+        self.default_tier = rate_limiting.Tier('default', limit=10, per=60)
+        self.app = self.make_app()
+    
+    def make_app(self):
+        app = Flask(__name__)
+        
+        @app.route('/')
+        def whoami():
+            client, tier = rate_limiting.identify_client(self.default_tier)
+            return {'client': client, 'tier': tier.name}
+        return app
+    
+    @patch('rate_limiting.API_KEYS', {'abc123': 'partner'})
+    @patch('rate_limiting.TIERS', {'partner': rate_limiting.Tier('partner', 600, 60)})
+    def test_api_key(self):
+        """Test that API keys select their tier and unknown keys are rejected"""
+        with self.app.test_request_context('/', headers={'X-API-Key': 'abc123'}):
+            client, tier = rate_limiting.identify_client(self.default_tier)
+        self.assertEqual(client, 'key:abc123')
+        self.assertEqual(tier.name, 'partner')
+        
+        with self.app.test_request_context('/', headers={'X-API-Key': 'nope'}):
+            with self.assertRaises(rate_limiting.InvalidApiKey):
+                rate_limiting.identify_client(self.default_tier)
+    
+    def test_forwarded_for(self):
+        """Test that X-Forwarded-For is only trusted behind configured proxies"""
+        headers = {'X-Forwarded-For': '203.0.113.7, 10.0.0.2'}
+        rate_limiting.init_rate_limiting(self.app)
+        self.assertEqual(self.app.test_client().get('/', headers=headers).json['client'], 'ip:127.0.0.1')
+        
+        behind_proxies = self.make_app()
+        with patch('rate_limiting.TRUSTED_PROXY_COUNT', 2):
+            rate_limiting.init_rate_limiting(behind_proxies)
+        self.assertEqual(behind_proxies.test_client().get('/', headers=headers).json['client'], 'ip:203.0.113.7')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,29 @@
 import unittest
 from unittest.mock import patch, MagicMock
 import json
+import marshal
+import os
+import sys
+import tempfile
+import threading
 import time
 import requests
+from werkzeug.http import http_date
+from prometheus_client import REGISTRY
+import admission
+import cache_admin
+import cassette
+import cache_policy
+import change_feed
+import image_cache
+import popularity
+import profiling
+import rate_limiting
+import tracing
+import upstream
+from benchmarks import fake_upstream
+from benchmarks.fake_upstream import FakeUpstream
+import rick_morty_api
 from rick_morty_api import app, fetch_characters, fetch_character_by_id, character_cache, character_detail_cache, CACHE_TIMEOUT, requests_limit
 
 class TestHealthEndpoint(unittest.TestCase):
@@ -28,9 +49,10 @@ class TestCharactersEndpoint(unittest.TestCase):
         self.app = app.test_client()
         self.app.testing = True
         
-        # Reset cache before each test
+        # Reset cache and rate limiting data before each test
         character_cache["data"] = None
         character_cache["timestamp"] = 0
+        requests_limit.clear()
     
     @patch('rick_morty_api.requests.get')
     def test_get_filtered_characters(self, mock_get):
@@ -204,8 +226,9 @@ class TestCharacterDetailEndpoint(unittest.TestCase):
         self.app = app.test_client()
         self.app.testing = True
         
-        # Reset cache before each test
+        # Reset cache and rate limiting data before each test
         character_detail_cache.clear()
+        requests_limit.clear()
     
     @patch('rick_morty_api.requests.get')
     def test_get_character_by_id(self, mock_get):
@@ -351,6 +374,40 @@ class TestRateLimiting(unittest.TestCase):
         
         self.assertEqual(response.status_code, 429)
         self.assertEqual(data['error'], 'Rate limit exceeded')
+        self.assertIn('Retry-After', response.headers)
+    
+    @patch('rick_morty_api.requests.get')
+    def test_upstream_fetches_cost_more(self, mock_get):
+        """Test that cache misses are charged more than cache hits"""
+        mock_response = MagicMock()
+        mock_response.json.return_value = {'id': 1, 'name': 'Rick Sanchez'}
+        mock_get.return_value = mock_response
+        character_detail_cache.clear()
+        
+        with patch('rate_limiting.RATE_LIMIT_UPSTREAM_COST', 4):
+            miss = self.app.get('/characters/1')
+            hit = self.app.get('/characters/1')
+        
+        self.assertEqual(miss.headers['X-RateLimit-Limit'], '10')
+        self.assertEqual(miss.headers['X-RateLimit-Remaining'], '5')
+        self.assertEqual(hit.headers['X-RateLimit-Remaining'], '4')
+    
+    @patch('rate_limiting.API_KEYS', {'abc123': 'partner'})
+    @patch('rate_limiting.TIERS', {'partner': rate_limiting.Tier('partner', 600, 60)})
+    @patch('rick_morty_api.fetch_characters')
+    def test_api_key_tiers(self, mock_fetch):
+        """Test that API-key clients get their tier's bucket instead of the per-IP one"""
+        mock_fetch.return_value = [{'id': 1, 'name': 'Character 1'}]
+        
+        for _ in range(11):
+            response = self.app.get('/characters', headers={'X-API-Key': 'abc123'})
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['X-RateLimit-Limit'], '600')
+        self.assertEqual(self.app.get('/characters').status_code, 200)
+        
+        response = self.app.get('/characters', headers={'X-API-Key': 'wrong'})
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(json.loads(response.data)['error'], 'Invalid API key')
 
 
 class TestCacheFunctions(unittest.TestCase):
@@ -378,3 +435,850 @@ class TestCacheFunctions(unittest.TestCase):
         }
 
 
+
+
+class TestMetrics(unittest.TestCase):
+    """Test cases for the Prometheus metrics integration"""
+    
+    def setUp(self):
+        self.app = app.test_client()
+        self.app.testing = True
+        requests_limit.clear()
+        character_detail_cache.clear()
+    
+    def test_metrics_endpoint(self):
+        """Test that /metrics exposes request metrics recorded via flask.g"""
+        self.app.get('/health')
+        
+        response = self.app.get('/metrics')
+        body = response.data.decode('utf-8')
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('rickmorty_requests_total{endpoint="health_check",method="GET",status="200"}', body)
+        self.assertIn('rickmorty_request_duration_seconds_count{endpoint="health_check",method="GET"}', body)
+    
+    @patch('rick_morty_api.requests.get')
+    def test_cache_and_upstream_metrics(self, mock_get):
+        """Test that cache hits/misses and upstream latency are recorded"""
+        mock_response = MagicMock()
+        mock_response.raise_for_status.return_value = None
+        mock_response.json.return_value = {'id': 1, 'name': 'Rick Sanchez'}
+        mock_get.return_value = mock_response
+        
+        def sample(name, **labels):
+            return REGISTRY.get_sample_value(name, labels) or 0
+        
+        hits = sample('rickmorty_cache_hits_total', endpoint='character')
+        misses = sample('rickmorty_cache_misses_total', endpoint='character')
+        upstream = sample('rickmorty_upstream_request_duration_seconds_count',
+                          endpoint='character', outcome='success')
+        
+        self.app.get('/characters/1')
+        self.app.get('/characters/1')
+        
+        self.assertEqual(sample('rickmorty_cache_hits_total', endpoint='character'), hits + 1)
+        self.assertEqual(sample('rickmorty_cache_misses_total', endpoint='character'), misses + 1)
+        self.assertEqual(sample('rickmorty_upstream_request_duration_seconds_count',
+                                endpoint='character', outcome='success'), upstream + 1)
+
+
+class TestServerTiming(unittest.TestCase):
+    """Test cases for per-stage timings and span export"""
+    
+    def setUp(self):
+        self.app = app.test_client()
+        self.app.testing = True
+        requests_limit.clear()
+        character_detail_cache.clear()
+        
+        mock_response = MagicMock()
+        mock_response.raise_for_status.return_value = None
+        mock_response.json.return_value = {'id': 1, 'name': 'Rick Sanchez'}
+        patcher = patch('rick_morty_api.requests.get', return_value=mock_response)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def test_server_timing_header(self):
+        """Test that each hot-path stage is reported in Server-Timing"""
+        response = self.app.get('/characters/1')
+        
+        stages = [entry.split(';')[0] for entry in response.headers['Server-Timing'].split(', ')]
+        self.assertEqual(stages, ['rate_limit', 'cache', 'upstream', 'filter', 'serialize', 'total'])
+    
+    def test_sampled_requests_export_spans(self):
+        """Test that sampled requests are exported as OTLP spans"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            exporter = tracing.SpanExporter(os.path.join(tmpdir, 'traces.jsonl'))
+            with patch('tracing.TRACE_SAMPLE_RATE', 1.0), patch('tracing.exporter', exporter):
+                self.app.get('/characters/1')
+                exporter.flush()
+            
+            with open(exporter.path) as f:
+                document = json.loads(f.readline())
+        
+        spans = document['resourceSpans'][0]['scopeSpans'][0]['spans']
+        root = spans[0]
+        self.assertEqual(root['name'], '/characters/<int:character_id>')
+        self.assertEqual(root['kind'], tracing.SPAN_KIND_SERVER)
+        self.assertEqual([span['name'] for span in spans[1:]],
+                         ['rate_limit', 'cache', 'upstream', 'filter', 'serialize'])
+        for span in spans[1:]:
+            self.assertEqual(span['traceId'], root['traceId'])
+            self.assertEqual(span['parentSpanId'], root['spanId'])
+
+
+@patch('rick_morty_api.ADMIN_TOKEN', 'secret')
+@patch('profiling.PROFILING_ENABLED', True)
+class TestProfiling(unittest.TestCase):
+    """Test cases for the admin profiling endpoint"""
+    
+    headers = {'Authorization': 'Bearer secret'}
+    
+    def setUp(self):
+        self.app = app.test_client()
+        self.app.testing = True
+        requests_limit.clear()
+        profiling.profiler.session = None
+        self.addCleanup(setattr, profiling.profiler, 'session', None)
+    
+    def test_requires_admin_token(self):
+        """Test that the endpoint rejects missing or wrong tokens"""
+        response = self.app.post('/admin/profile')
+        self.assertEqual(response.status_code, 401)
+        
+        response = self.app.post('/admin/profile', headers={'Authorization': 'Bearer wrong'})
+        self.assertEqual(response.status_code, 401)
+    
+    def test_disabled_without_admin_token(self):
+        """Test that the endpoint does not exist when no admin token is configured"""
+        with patch('rick_morty_api.ADMIN_TOKEN', None):
+            response = self.app.post('/admin/profile', headers=self.headers)
+        self.assertEqual(response.status_code, 404)
+    
+    def test_invalid_parameters(self):
+        """Test that bad parameters are rejected with 400 and a running session with 409"""
+        for query in ('mode=bogus', 'requests=0', 'seconds=abc', 'interval=5'):
+            response = self.app.post(f'/admin/profile?{query}', headers=self.headers)
+            self.assertEqual(response.status_code, 400, query)
+        
+        self.assertEqual(self.app.post('/admin/profile', headers=self.headers).status_code, 202)
+        self.assertEqual(self.app.post('/admin/profile', headers=self.headers).status_code, 409)
+    
+    @patch('rick_morty_api.fetch_character_by_id')
+    def test_cprofile_window(self, mock_fetch):
+        """Test that a cProfile session covers exactly the requested window"""
+        mock_fetch.return_value = {'id': 1, 'name': 'Rick Sanchez'}
+        
+        response = self.app.post('/admin/profile?mode=cprofile&requests=2', headers=self.headers)
+        self.assertEqual(response.status_code, 202)
+        
+        for _ in range(3):
+            self.app.get('/characters/1')
+        
+        status = json.loads(self.app.get('/admin/profile', headers=self.headers).data)
+        self.assertTrue(status['finished'])
+        self.assertEqual(status['profiled_requests'], 2)
+        
+        response = self.app.get('/admin/profile?format=text', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('get_character', response.data.decode('utf-8'))
+        
+        response = self.app.get('/admin/profile?format=pstats', headers=self.headers)
+        stats = marshal.loads(response.data)
+        self.assertTrue(any(func[2] == 'get_character' for func in stats))
+    
+    @patch('rick_morty_api.fetch_character_by_id')
+    def test_sampling_window_collapsed_output(self, mock_fetch):
+        """Test that sampling mode returns collapsed stacks of live requests"""
+        def slow_fetch(character_id):
+            time.sleep(0.05)
+            return {'id': character_id}
+        mock_fetch.side_effect = slow_fetch
+        
+        response = self.app.post('/admin/profile?mode=sample&requests=2&interval=0.002',
+                                 headers=self.headers)
+        self.assertEqual(response.status_code, 202)
+        
+        self.app.get('/characters/1')
+        self.app.get('/characters/2')
+        
+        response = self.app.get('/admin/profile?format=collapsed', headers=self.headers)
+        lines = response.data.decode('utf-8').splitlines()
+        self.assertTrue(lines)
+        stack, count = lines[0].rsplit(' ', 1)
+        self.assertIn('test_rick_morty_api:slow_fetch', stack)
+        self.assertGreater(int(count), 0)
+
+
+class TestFakeUpstreamCrawl(unittest.TestCase):
+    """Test cases running the crawl against the local fake upstream over HTTP"""
+    
+    def setUp(self):
+        self.upstream = FakeUpstream(pages=3).start()
+        self.addCleanup(self.upstream.stop)
+        
+        patcher = patch('rick_morty_api.API_BASE_URL', self.upstream.api_url)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        
+        character_cache["data"] = None
+        character_cache["timestamp"] = 0
+        character_detail_cache.clear()
+    
+    def test_crawl_follows_every_page(self):
+        """Test that fetch_characters pages through the whole upstream list"""
+        characters = fetch_characters(filtered=False)
+        
+        self.assertEqual(len(characters), self.upstream.count)
+        self.assertEqual([c['id'] for c in characters], list(range(1, self.upstream.count + 1)))
+        self.assertEqual(self.upstream.stats()['calls'], 3)
+    
+    def test_concurrent_misses_crawl_once(self):
+        """Test that threads missing the list cache together share one crawl and one filter pass"""
+        self.upstream.latency = 0.05
+        barrier = threading.Barrier(8)
+        results = [None] * 8
+        def worker(index):
+            barrier.wait()
+            results[index] = fetch_characters(filtered=index % 2 == 0)
+        
+        threads = [threading.Thread(target=worker, args=(index,)) for index in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        self.assertEqual(self.upstream.stats()['calls'], 3)
+        self.assertTrue(all(result is results[0] for result in results[::2]))
+        self.assertTrue(all(result is character_cache["data"] for result in results[1::2]))
+        self.assertEqual(results[0], rick_morty_api.filter_characters(character_cache["data"]))
+    
+    @patch('cache_policy.CHARACTER_LIST_CACHE_TTL', 0.05)
+    def test_slow_crawl_shared_beyond_ttl(self):
+        """Test that threads waiting for a crawl slower than the TTL get its list rather than a failure"""
+        self.upstream.latency = 0.1
+        barrier = threading.Barrier(4)
+        results = [None] * 4
+        def worker(index):
+            barrier.wait()
+            results[index] = fetch_characters(filtered=False)
+        
+        threads = [threading.Thread(target=worker, args=(index,)) for index in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        self.assertEqual(self.upstream.stats()['calls'], 3)
+        self.assertIsNotNone(results[0])
+        self.assertTrue(all(result is results[0] for result in results))
+        
+        # A crawl that failed is shared as a failure
+        self.upstream.stop()
+        character_cache["timestamp"] = 0
+        with patch('rick_morty_api.API_BASE_URL', 'http://127.0.0.1:1/api/character'):
+            self.assertIsNone(fetch_characters(filtered=False))
+        self.assertIsNone(rick_morty_api.character_crawl["result"])
+    
+    def test_character_by_id(self):
+        """Test that fetch_character_by_id reads from the fake upstream"""
+        character = fetch_character_by_id(7)
+        
+        self.assertEqual(character['id'], 7)
+        self.assertIsNone(fetch_character_by_id(self.upstream.count + 1))
+    
+    def test_crawl_fills_detail_cache(self):
+        """Test that after one crawl every character detail is served without upstream calls"""
+        fetch_characters(filtered=False)
+        self.upstream.reset()
+        
+        for character_id in range(1, self.upstream.count + 1):
+            character = fetch_character_by_id(character_id)
+            self.assertEqual(character['id'], character_id)
+            self.assertIn('episode', character)
+        self.assertEqual(self.upstream.stats()['calls'], 0)
+    
+    def test_filtered_and_unfiltered_share_one_crawl(self):
+        """Test that both list variants are served from the same crawl"""
+        unfiltered = fetch_characters(filtered=False)
+        filtered = fetch_characters(filtered=True)
+        
+        self.assertEqual(self.upstream.stats()['calls'], 3)
+        self.assertEqual(len(unfiltered), self.upstream.count)
+        self.assertEqual(filtered, [c for c in unfiltered if c['species'] == 'Human' and c['status'] == 'Alive'
+                                    and c['origin'] == 'Earth (C-137)'])
+        self.assertIs(fetch_characters(filtered=True), filtered)
+    
+    def test_character_stats(self):
+        """Test that /characters/stats returns facet counts from the crawled list"""
+        client = app.test_client()
+        requests_limit.clear()
+        unfiltered = fetch_characters(filtered=False)
+        
+        response = client.get('/characters/stats')
+        self.assertEqual(response.status_code, 200)
+        stats = json.loads(response.data)
+        self.assertEqual(stats['count'], self.upstream.count)
+        self.assertEqual(sum(stats['facets']['species'].values()), self.upstream.count)
+        self.assertEqual(stats['filters'], {})
+        
+        response = client.get('/characters/stats?status=Alive&species=Human&page=2')
+        stats = json.loads(response.data)
+        alive_humans = [c for c in unfiltered if c['status'] == 'Alive' and c['species'] == 'Human']
+        self.assertEqual(stats['count'], len(alive_humans))
+        self.assertEqual(stats['facets']['species'], {'Human': len(alive_humans)})
+        self.assertEqual(stats['filters'], {'status': 'Alive', 'species': 'Human'})
+        self.assertEqual(self.upstream.stats()['calls'], 3)
+    
+    @patch('rate_limiting.RATE_LIMIT_UPSTREAM_COST', 0)
+    def test_character_image(self):
+        """Test that /characters/<id>/image caches originals and thumbnails on disk with ETags"""
+        client = app.test_client()
+        requests_limit.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        session = MagicMock(wraps=requests.Session())
+        for target, value in (('image_cache.disk_cache', image_cache.DiskLRU(directory.name, max_bytes=10 ** 6)),
+                              ('upstream.session', session)):
+            patcher = patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        
+        response = client.get('/characters/7/image')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'image/jpeg')
+        self.assertEqual(response.headers['X-Cache'], 'MISS')
+        self.assertEqual(response.get_data(), fake_upstream.make_avatar(7))
+        etag = response.headers['ETag']
+        response.close()
+        # The character detail, then the image through the pooled session
+        self.assertEqual(self.upstream.stats()['calls'], 2)
+        self.assertEqual(session.get.call_count, 1)
+        
+        response = client.get('/characters/7/image?size=64')
+        self.assertEqual(response.headers['X-Cache'], 'MISS')
+        self.assertLess(len(response.get_data()), len(fake_upstream.make_avatar(7)))
+        response.close()
+        
+        response = client.get('/characters/7/image', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        response = client.get('/characters/7/image?size=64')
+        self.assertEqual(response.headers['X-Cache'], 'HIT')
+        self.assertIn(f"max-age={image_cache.IMAGE_MAX_AGE}", response.headers['Cache-Control'])
+        response.close()
+        self.assertEqual(self.upstream.stats()['calls'], 2)
+        
+        self.assertEqual(client.get('/characters/7/image?size=65').status_code, 400)
+        self.assertEqual(client.get(f"/characters/{self.upstream.count + 1}/image").status_code, 404)
+    
+    @patch('rate_limiting.RATE_LIMIT_UPSTREAM_COST', 0)
+    def test_character_image_evicted_before_send(self):
+        """Test that an image evicted by another worker between the lookup and sending it is fetched again"""
+        client = app.test_client()
+        requests_limit.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        patcher = patch('image_cache.disk_cache', image_cache.DiskLRU(directory.name, max_bytes=10 ** 6))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        client.get('/characters/7/image').close()
+        
+        fetch = image_cache.fetch
+        evictions = []
+        def fetch_then_evict(*args):
+            result = fetch(*args)
+            if not evictions:
+                evictions.append(result[0].path)
+                os.remove(result[0].path)
+            return result
+        
+        with patch('image_cache.fetch', fetch_then_evict):
+            response = client.get('/characters/7/image')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_data(), fake_upstream.make_avatar(7))
+        response.close()
+        self.assertEqual(len(evictions), 1)
+        self.assertEqual(self.upstream.stats()['calls'], 3)
+    
+    @patch('change_feed.SSE_POLL_INTERVAL', 0.01)
+    @patch('change_feed.SSE_MAX_DURATION', 0.3)
+    @patch('rate_limiting.RATE_LIMIT_UPSTREAM_COST', 0)
+    def test_change_feed(self):
+        """Test that /characters/changes pushes the ids that changed in a new crawl and resumes"""
+        client = app.test_client()
+        requests_limit.clear()
+        patcher = patch('rick_morty_api.character_changes', change_feed.ChangeFeed())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        
+        response = client.get('/characters/changes')
+        self.assertEqual(response.mimetype, 'text/event-stream')
+        self.assertEqual(response.headers['Cache-Control'], 'no-cache')
+        self.assertNotIn('X-Cache', response.headers)
+        version = response.get_data(as_text=True).split('id: ')[1].split('\n')[0]
+        self.assertIn(f"id: {version}\nevent: version\n", response.get_data(as_text=True))
+        
+        # The next crawl renames character 3
+        make_character = fake_upstream.make_character
+        def renamed(character_id, base_url):
+            character = make_character(character_id, base_url)
+            if character_id == 3:
+                character['name'] = 'Renamed'
+            return character
+        character_cache["timestamp"] = 0
+        with patch('benchmarks.fake_upstream.make_character', renamed):
+            body = client.get('/characters/changes', headers={'Last-Event-ID': version}).get_data(as_text=True)
+        self.assertIn('event: changes\ndata: {"added":[],"changed":[3],"removed":[]}\n', body)
+        
+        # Resuming from the old version replays the change; unknown versions reset
+        body = client.get(f'/characters/changes?last_event_id={version}').get_data(as_text=True)
+        self.assertIn('"changed":[3]', body)
+        body = client.get('/characters/changes', headers={'Last-Event-ID': 'unknown'}).get_data(as_text=True)
+        self.assertIn('event: reset\n', body)
+        
+        # A worker without free stream slots sheds new streams
+        with patch('change_feed.max_streams', 0):
+            response = client.get('/characters/changes')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers['Retry-After'], '1')
+        self.assertEqual(rick_morty_api.character_changes._subscribers, [])
+    
+    def test_load_dataset_snapshot(self):
+        """Test that the preloaded dataset is saved and reloaded without upstream calls"""
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        snapshot = os.path.join(tmp.name, 'dataset.json')
+        
+        self.assertTrue(rick_morty_api.load_dataset(snapshot))
+        crawled = character_cache["data"]
+        self.assertTrue(os.path.exists(snapshot))
+        
+        character_cache["data"] = None
+        character_detail_cache.clear()
+        self.upstream.reset()
+        self.assertTrue(rick_morty_api.load_dataset(snapshot))
+        
+        self.assertEqual(character_cache["data"], crawled)
+        self.assertEqual(len(character_detail_cache), self.upstream.count)
+        self.assertEqual(fetch_character_by_id(5)['id'], 5)
+        self.assertIs(fetch_characters(filtered=True), rick_morty_api.filtered_character_cache["data"])
+        self.assertEqual(self.upstream.stats()['calls'], 0)
+    
+    def test_load_dataset_old_snapshot(self):
+        """Test that a snapshot keeps the age of its crawl and is refreshed once expired"""
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        snapshot = os.path.join(tmp.name, 'dataset.json')
+        self.assertTrue(rick_morty_api.load_dataset(snapshot))
+        
+        with open(snapshot) as f:
+            dataset = json.load(f)
+        dataset['timestamp'] -= CACHE_TIMEOUT + 60
+        with open(snapshot, 'w') as f:
+            json.dump(dataset, f)
+        
+        character_cache["data"] = None
+        character_detail_cache.clear()
+        self.upstream.reset()
+        self.assertTrue(rick_morty_api.load_dataset(snapshot))
+        
+        self.assertEqual(character_cache["timestamp"], dataset['timestamp'])
+        fetch_characters(filtered=False)
+        self.assertEqual(self.upstream.stats()['calls'], 3)
+        
+        # Snapshots without a timestamp are as old as the file
+        del dataset['timestamp']
+        with open(snapshot, 'w') as f:
+            json.dump(dataset, f)
+        os.utime(snapshot, (1000000000, 1000000000))
+        self.assertTrue(rick_morty_api.load_dataset(snapshot))
+        self.assertEqual(character_cache["timestamp"], 1000000000)
+    
+    def test_load_dataset_upstream_failure(self):
+        """Test that a failed crawl leaves the caches empty and reports it"""
+        with patch('rick_morty_api.API_BASE_URL', 'http://127.0.0.1:1/api/character'):
+            self.assertFalse(rick_morty_api.load_dataset())
+        self.assertIsNone(character_cache["data"])
+    
+    def test_replay_mode(self):
+        """Test that a recorded cassette serves the list and details with the upstream gone"""
+        with tempfile.TemporaryDirectory() as directory:
+            store = cassette.Cassette(os.path.join(directory, 'cassette.sqlite3'))
+            cassette.record_crawl(self.upstream.api_url, store)
+            self.upstream.stop()
+            
+            with patch('cassette.UPSTREAM_MODE', 'replay'), patch('cassette._store', store):
+                characters = fetch_characters(filtered=False)
+                character_detail_cache.clear()
+                character = fetch_character_by_id(7)
+                
+                self.assertEqual([c['id'] for c in characters], list(range(1, self.upstream.count + 1)))
+                self.assertEqual(character['id'], 7)
+                with self.assertRaises(requests.exceptions.ConnectionError):
+                    fetch_character_by_id(self.upstream.count + 1)
+                
+                # Not recorded: the upstream is unavailable rather than the service broken
+                response = app.test_client().get(f"/characters/{self.upstream.count + 1}")
+                self.assertEqual(response.status_code, 503)
+
+
+class TestAdmissionControl(unittest.TestCase):
+    """Test cases for shedding upstream-bound requests under load"""
+    
+    def setUp(self):
+        self.app = app.test_client()
+        self.app.testing = True
+        requests_limit.clear()
+        
+        character_cache["data"] = None
+        character_cache["timestamp"] = 0
+        character_detail_cache.clear()
+        
+        controller = admission.AdmissionController(max_inflight=1, max_wait=0.01,
+                                                   max_queue_time=5, retry_after=3)
+        patcher = patch('admission.controller', controller)
+        self.controller = patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    @patch('rick_morty_api.requests.get')
+    def test_sheds_cache_misses_only(self, mock_get):
+        """Test that a saturated worker sheds cache misses but serves hits and health checks"""
+        mock_response = MagicMock()
+        mock_response.json.return_value = {'id': 1, 'name': 'Rick Sanchez'}
+        mock_get.return_value = mock_response
+        self.app.get('/characters/1')
+        
+        with self.controller.upstream_slot():
+            response = self.app.get('/characters/2')
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response.headers['Retry-After'], '3')
+            self.assertEqual(json.loads(response.data)['error'], 'Service overloaded, please retry later')
+            
+            self.assertEqual(self.app.get('/characters/1').status_code, 200)
+            self.assertEqual(self.app.get('/health').status_code, 200)
+        
+        self.assertEqual(mock_get.call_count, 1)
+        self.assertEqual(self.app.get('/characters/2').status_code, 200)
+    
+    @patch('rick_morty_api.requests.get')
+    def test_sheds_requests_that_queued_too_long(self, mock_get):
+        """Test that requests queued past the limit in front of the worker are shed"""
+        stale = {'X-Request-Start': f"t={time.time() - 30:.3f}"}
+        response = self.app.get('/characters', headers=stale)
+        
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response.headers)
+        mock_get.assert_not_called()
+    
+    @patch('rick_morty_api.requests.get')
+    def test_sync_worker_sheds_on_queue_time(self, mock_get):
+        """Test that a sync worker, without an in-flight limit, still sheds queued misses"""
+        mock_response = MagicMock()
+        mock_response.json.return_value = {'id': 1, 'name': 'Rick Sanchez'}
+        mock_get.return_value = mock_response
+        self.controller.resize(admission.inflight_limit('sync', 1))
+        
+        stale = {'X-Request-Start': f"t={time.time() - 30:.3f}"}
+        fresh = {'X-Request-Start': f"t={time.time():.3f}"}
+        self.assertEqual(self.app.get('/characters/1', headers=stale).status_code, 503)
+        self.assertEqual(self.app.get('/characters/1', headers=fresh).status_code, 200)
+        self.assertEqual(self.app.get('/health', headers=stale).status_code, 200)
+    
+    @patch('rick_morty_api.requests.get')
+    def test_upstream_throttling_passed_on(self, mock_get):
+        """Test that an upstream 429 with a long Retry-After becomes a 503 with the same Retry-After"""
+        mock_get.return_value = MagicMock(status_code=429, headers={'Retry-After': '30'})
+        with patch('upstream.limiter', upstream.AdaptiveLimiter(max_wait=1)) as limiter:
+            response = self.app.get('/characters/1')
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response.headers['Retry-After'], '30')
+            
+            # Further misses wait for the upstream instead of calling it again
+            self.assertEqual(self.app.get('/characters/2').status_code, 503)
+            self.assertEqual(limiter.inflight, 0)
+        self.assertEqual(mock_get.call_count, 1)
+
+
+@patch('rick_morty_api.ADMIN_TOKEN', 'secret')
+class TestCacheAdmin(unittest.TestCase):
+    """Test cases for the cache admin endpoints"""
+    
+    headers = {'Authorization': 'Bearer secret'}
+    
+    def setUp(self):
+        self.app = app.test_client()
+        self.app.testing = True
+        requests_limit.clear()
+        
+        self.upstream = FakeUpstream(pages=2).start()
+        self.addCleanup(self.upstream.stop)
+        patcher = patch('rick_morty_api.API_BASE_URL', self.upstream.api_url)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        
+        character_cache["data"] = None
+        character_cache["timestamp"] = 0
+        character_detail_cache.clear()
+    
+    def test_requires_admin_token(self):
+        """Test that the cache endpoints reject callers without the token"""
+        self.assertEqual(self.app.get('/admin/cache').status_code, 401)
+        self.assertEqual(self.app.post('/admin/cache/invalidate', json={'prefix': ''}).status_code, 401)
+    
+    def test_stats(self):
+        """Test that stats report entries, sizes and ages per cache"""
+        self.app.get('/characters/1')
+        self.app.get('/characters/1')
+        
+        response = self.app.get('/admin/cache', headers=self.headers)
+        caches = json.loads(response.data)['caches']
+        
+        self.assertEqual(caches['characters']['entries'], 0)
+        self.assertEqual(caches['character']['entries'], 1)
+        self.assertGreater(caches['character']['bytes'], 0)
+        self.assertGreaterEqual(caches['character']['oldest_age_seconds'], 0)
+        self.assertGreater(caches['character']['hit_ratio'], 0)
+    
+    def test_invalidate_by_key_and_prefix(self):
+        """Test that invalidation drops exactly the selected entries"""
+        fetch_characters()
+        
+        response = self.app.post('/admin/cache/invalidate', json={'keys': ['character:1']}, headers=self.headers)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(json.loads(response.data)['invalidated'], ['character:1'])
+        self.assertEqual(set(character_detail_cache), set(range(2, self.upstream.count + 1)))
+        self.assertIsNotNone(character_cache["data"])
+        
+        self.app.post('/admin/cache/invalidate', json={'prefix': ''}, headers=self.headers)
+        self.assertEqual(character_detail_cache, {})
+        self.assertIsNone(character_cache["data"])
+        
+        response = self.app.post('/admin/cache/invalidate', json={}, headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+    
+    def test_invalidate_keeps_list_cache_keys(self):
+        """Test that invalidating the list resets its entries in place, never leaving them without keys"""
+        self.app.get('/characters')
+        self.assertIn('encoded', rick_morty_api.filtered_character_cache)
+        
+        # A request thread reading the list cache while another worker's invalidations are applied
+        missing = []
+        done = threading.Event()
+        def reader():
+            while not done.is_set():
+                try:
+                    character_cache["data"], character_cache["timestamp"]
+                    rick_morty_api.filtered_character_cache["source"]
+                except KeyError as e:
+                    missing.append(e)
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        self.addCleanup(sys.setswitchinterval, switch_interval)
+        thread = threading.Thread(target=reader)
+        thread.start()
+        for _ in range(5000):
+            rick_morty_api.invalidate_cache({'keys': ['characters']})
+            character_cache["data"] = []
+        done.set()
+        thread.join()
+        
+        self.assertEqual(missing, [])
+        rick_morty_api.invalidate_cache({'keys': ['characters']})
+        self.assertEqual(character_cache, {"data": None, "timestamp": 0})
+        self.assertEqual(rick_morty_api.filtered_character_cache, {"data": None, "source": None})
+    
+    def test_prewarm_in_bulk(self):
+        """Test that pre-warming fetches ids in batches and fills the detail cache"""
+        with patch('rick_morty_api.PREWARM_BATCH_SIZE', 3):
+            response = self.app.post('/admin/cache/prewarm', json={'ids': [1, 2, 3, 4, 999]},
+                                     headers=self.headers)
+        data = json.loads(response.data)
+        
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(data['prewarmed'], [1, 2, 3, 4])
+        self.assertEqual(data['not_found'], [999])
+        self.assertEqual(self.upstream.stats()['calls'], 2)
+        
+        self.app.get('/characters/4')
+        self.assertEqual(self.upstream.stats()['calls'], 2)
+    
+    def test_commands_propagate_between_workers(self):
+        """Test that commands issued by one worker are applied by the others"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'commands.log')
+            other_worker = cache_admin.CommandLog(path)
+            with patch('cache_admin.command_log', cache_admin.CommandLog(path)):
+                self.app.post('/admin/cache/prewarm', json={'ids': [5]}, headers=self.headers)
+                
+                # What another worker replays before its next request
+                commands = other_worker.poll()
+                self.assertEqual([c['action'] for c in commands], ['prewarm'])
+                self.assertEqual(commands[0]['characters'][0]['id'], 5)
+                
+                character_detail_cache.clear()
+                other_worker.append({'action': 'prewarm', 'characters': commands[0]['characters'],
+                                     'timestamp': time.time()})
+                self.app.get('/health')
+                self.assertIn(5, character_detail_cache)
+
+
+class TestPopularityCache(unittest.TestCase):
+    """Test cases for popularity-driven detail cache retention"""
+    
+    def setUp(self):
+        self.app = app.test_client()
+        self.app.testing = True
+        requests_limit.clear()
+        character_detail_cache.clear()
+        
+        self.upstream = FakeUpstream(pages=2).start()
+        self.addCleanup(self.upstream.stop)
+        for target, value in (('rick_morty_api.API_BASE_URL', self.upstream.api_url),
+                              ('rick_morty_api.DETAIL_CACHE_MAX_ENTRIES', 2),
+                              ('rate_limiting.RATE_LIMIT_UPSTREAM_COST', 0),
+                              ('popularity.sketch', popularity.FrequencySketch(width=256, hot_size=2, seed=1)),
+                              ('rick_morty_api.hot_refresher', popularity.Refresher(0, None))):
+            patcher = patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+    
+    def test_hot_ids_stay_cached(self):
+        """Test that a rarely requested id does not evict popular ones"""
+        for _ in range(3):
+            self.app.get('/characters/1')
+            self.app.get('/characters/2')
+        
+        response = self.app.get('/characters/3')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(character_detail_cache), {1, 2})
+        
+        calls = self.upstream.stats()['calls']
+        self.app.get('/characters/1')
+        self.app.get('/characters/2')
+        self.assertEqual(self.upstream.stats()['calls'], calls)
+    
+    def test_expired_entries_make_room(self):
+        """Test that an expired entry is replaced regardless of popularity"""
+        for _ in range(3):
+            self.app.get('/characters/1')
+        self.app.get('/characters/2')
+        character_detail_cache[1]["timestamp"] -= CACHE_TIMEOUT
+        
+        self.app.get('/characters/3')
+        self.assertEqual(set(character_detail_cache), {2, 3})
+    
+    def test_refresher_keeps_hot_ids_warm(self):
+        """Test that hot ids close to expiry are re-fetched in one batch"""
+        for character_id in (1, 1, 2, 2, 3):
+            self.app.get(f'/characters/{character_id}')
+        for entry in character_detail_cache.values():
+            entry["timestamp"] -= CACHE_TIMEOUT - 1
+        calls = self.upstream.stats()['calls']
+        
+        rick_morty_api.refresh_hot_characters()
+        
+        self.assertEqual(self.upstream.stats()['calls'], calls + 1)
+        for character_id in (1, 2):
+            self.assertLess(time.time() - character_detail_cache[character_id]["timestamp"], 5)
+    
+    def test_unknown_ids_do_not_stay_hot(self):
+        """Test that ids the upstream answers with 404 are not kept warm"""
+        unknown = self.upstream.count + 1
+        for _ in range(3):
+            self.assertEqual(self.app.get(f'/characters/{unknown}').status_code, 404)
+        self.app.get('/characters/1')
+        self.assertEqual(popularity.sketch.hot_keys(), [1])
+        
+        # An id that disappears upstream after becoming hot is dropped by the refresher
+        popularity.sketch.record(unknown)
+        self.assertIn(unknown, popularity.sketch.hot_keys())
+        rick_morty_api.refresh_hot_characters()
+        self.assertEqual(popularity.sketch.hot_keys(), [1])
+
+
+class TestCachePolicy(unittest.TestCase):
+    """Test cases for cache status headers and per-request freshness"""
+    
+    def setUp(self):
+        self.app = app.test_client()
+        self.app.testing = True
+        requests_limit.clear()
+        character_cache["data"] = None
+        character_cache["timestamp"] = 0
+        character_detail_cache.clear()
+        
+        self.upstream = FakeUpstream(pages=1).start()
+        self.addCleanup(self.upstream.stop)
+        for target, value in (('rick_morty_api.API_BASE_URL', self.upstream.api_url),
+                              ('rate_limiting.RATE_LIMIT_UPSTREAM_COST', 0),
+                              ('cache_policy.CACHE_TTL_MIN', 1)):
+            patcher = patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+    
+    def test_x_cache_and_age(self):
+        """Test that responses report cache hits and the entry's age"""
+        first = self.app.get('/characters/1')
+        self.assertEqual(first.headers['X-Cache'], 'MISS')
+        self.assertEqual(first.headers['Age'], '0')
+        
+        character_detail_cache[1]["timestamp"] -= 42
+        second = self.app.get('/characters/1')
+        self.assertEqual(second.headers['X-Cache'], 'HIT')
+        self.assertEqual(second.headers['Age'], '42')
+        
+        self.assertNotIn('X-Cache', self.app.get('/health').headers)
+    
+    def test_cache_ttl_parameter(self):
+        """Test that cache_ttl shortens freshness for that request"""
+        self.app.get('/characters?cache_ttl=1')
+        self.assertEqual(self.app.get('/characters?cache_ttl=1').headers['X-Cache'], 'HIT')
+        
+        character_cache["timestamp"] -= 1.5
+        self.assertEqual(self.app.get('/characters?cache_ttl=1').headers['X-Cache'], 'MISS')
+        self.assertEqual(self.app.get('/characters').headers['X-Cache'], 'HIT')
+        self.assertEqual(self.upstream.stats()['calls'], 2)
+    
+    def test_client_cache_control(self):
+        """Test that no-cache and max-age are honored within the server minimum"""
+        self.app.get('/characters/2')
+        
+        # Younger than CACHE_TTL_MIN: still served from cache
+        response = self.app.get('/characters/2', headers={'Cache-Control': 'no-cache'})
+        self.assertEqual(response.headers['X-Cache'], 'HIT')
+        
+        character_detail_cache[2]["timestamp"] -= 10
+        response = self.app.get('/characters/2', headers={'Cache-Control': 'max-age=20'})
+        self.assertEqual(response.headers['X-Cache'], 'HIT')
+        response = self.app.get('/characters/2', headers={'Cache-Control': 'no-cache'})
+        self.assertEqual(response.headers['X-Cache'], 'MISS')
+    
+    def test_shared_cache_headers(self):
+        """Test that successful cache lookups are cacheable by the ingress"""
+        self.app.get('/characters/3')
+        stored = int(time.time()) - 42
+        character_detail_cache[3]["timestamp"] = stored
+        
+        response = self.app.get('/characters/3')
+        self.assertIn(response.headers['Age'], ('42', '43'))
+        self.assertEqual(response.cache_control.max_age, cache_policy.CHARACTER_DETAIL_CACHE_TTL)
+        self.assertTrue(response.cache_control.public)
+        self.assertIn('stale-while-revalidate', response.headers['Cache-Control'])
+        self.assertIn('stale-if-error', response.headers['Cache-Control'])
+        self.assertEqual(response.headers['Vary'], 'Accept')
+        self.assertEqual(response.headers['Last-Modified'], http_date(stored))
+        
+        response = self.app.get('/characters/3', headers={'If-Modified-Since': http_date(stored)})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b'')
+        
+        response = self.app.get('/characters', headers={'If-Modified-Since': http_date(stored)})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.cache_control.max_age, cache_policy.CHARACTER_LIST_CACHE_TTL)
+    
+    def test_errors_not_cacheable(self):
+        """Test that error responses carry no shared-cache headers"""
+        response = self.app.get('/characters/9999')
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn('Cache-Control', response.headers)
+        self.assertNotIn('Cache-Control', self.app.get('/health').headers)
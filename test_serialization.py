@@ -0,0 +1,194 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import datetime
+import json
+import uuid
+import cbor2
+import msgpack
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+import serialization
+from rick_morty_api import app, character_cache, character_detail_cache, requests_limit
+
+PAYLOADS = [
+    {'count': 2, 'characters': [
+        {'id': 1, 'name': 'Rick Sanchez', 'status': 'Alive', 'species': 'Human',
+         'location': 'Citadel of Ricks', 'origin': 'Earth (C-137)',
+         'image_url': 'https://rickandmortyapi.com/api/character/avatar/1.jpeg'},
+        {'id': 2, 'name': 'Morty Smith', 'status': 'Alive', 'species': 'Human',
+         'location': None, 'origin': 'unknown', 'image_url': ''},
+    ]},
+    {'name': 'Señor Poopybutthole \U0001F4A9', 'type': ''},
+    {'control': 'tab\there\nnewline \x00 \x1f \x7f "quoted" \\ /'},
+    {'b': [1, 2.5, True, False, None], 'a': {'z': -1, 'y': 10 ** 30}},
+    {1: 'int key'},
+    {'created': datetime.datetime(2017, 11, 4, 18, 48, 46), 'id': uuid.UUID(int=1)},
+    [],
+    'plain string',
+]
+
+
+class TestFastJSONProvider(unittest.TestCase):
+    """Test cases for the fast JSON provider"""
+    
+    def setUp(self):
+        self.flask_app = Flask(__name__)
+        self.reference = DefaultJSONProvider(self.flask_app)
+    
+    def assert_identical(self, backend):
+        with patch('serialization.JSON_BACKEND', backend):
+            provider = serialization.FastJSONProvider(self.flask_app)
+        
+        for payload in PAYLOADS:
+            with self.subTest(backend=provider.backend, payload=payload):
+                expected = self.reference.response(payload).get_data()
+                self.assertEqual(provider.response(payload).get_data(), expected)
+        return provider
+    
+    def test_orjson_output_is_byte_identical(self):
+        """Test that the orjson backend matches Flask's default provider byte for byte"""
+        provider = self.assert_identical('orjson')
+        self.assertEqual(provider.backend, 'orjson')
+    
+    def test_msgspec_output_is_byte_identical(self):
+        """Test that the msgspec backend matches Flask's default provider (datetimes aside)"""
+        with patch('serialization.JSON_BACKEND', 'msgspec'):
+            provider = serialization.FastJSONProvider(self.flask_app)
+        self.assertEqual(provider.backend, 'msgspec')
+        
+        for payload in PAYLOADS:
+            if isinstance(payload, dict) and 'created' in payload:
+                continue
+            with self.subTest(payload=payload):
+                self.assertEqual(provider.response(payload).get_data(),
+                                 self.reference.response(payload).get_data())
+    
+    def test_float_differences(self):
+        """Test that exponent floats keep their value and non-finite floats become null"""
+        payload = {'small': 1e-07, 'large': 1e+16, 'plain': 0.1, 'nan': float('nan'), 'inf': float('inf')}
+        
+        for backend in ('orjson', 'msgspec'):
+            with patch('serialization.JSON_BACKEND', backend):
+                provider = serialization.FastJSONProvider(self.flask_app)
+            with self.subTest(backend=backend):
+                decoded = json.loads(provider.dumps_bytes(payload))
+                self.assertEqual(decoded, {'small': 1e-07, 'large': 1e+16, 'plain': 0.1, 'nan': None, 'inf': None})
+        
+        self.assertIn(b'NaN', self.reference.dumps(payload).encode('utf-8'))
+    
+    def test_stdlib_fallback(self):
+        """Test that the stdlib backend is used when requested or nothing faster is installed"""
+        provider = self.assert_identical('stdlib')
+        self.assertEqual(provider.backend, 'stdlib')
+        
+        with patch.dict('sys.modules', {'orjson': None, 'msgspec': None}):
+            self.assertIsNone(serialization.load_backend('auto'))
+    
+    def test_debug_mode_keeps_indentation(self):
+        """Test that debug mode still produces indented output"""
+        self.flask_app.debug = True
+        provider = serialization.FastJSONProvider(self.flask_app)
+        
+        self.assertEqual(provider.response(PAYLOADS[0]).get_data(),
+                         self.reference.response(PAYLOADS[0]).get_data())
+
+
+class TestCachedResponse(unittest.TestCase):
+    """Test cases for reusing encoded bodies of cached data"""
+    
+    def setUp(self):
+        self.app = app.test_client()
+        requests_limit.clear()
+        character_cache["data"] = None
+        character_cache["timestamp"] = 0
+        character_cache.pop("encoded", None)
+    
+    @patch('rick_morty_api.requests.get')
+    def test_cached_list_is_encoded_once(self, mock_get):
+        """Test that cache hits on /characters reuse the encoded body"""
+        mock_response = MagicMock()
+        mock_response.raise_for_status.return_value = None
+        mock_response.json.return_value = {
+            'info': {'next': None},
+            'results': [{'id': 1, 'name': 'Rick Sanchez', 'status': 'Alive', 'species': 'Human',
+                         'origin': {'name': 'Earth (C-137)'}, 'location': {'name': 'Earth'},
+                         'image': 'https://rickandmortyapi.com/api/character/avatar/1.jpeg'}]
+        }
+        mock_get.return_value = mock_response
+        
+        with patch.object(app.json, 'dumps_bytes', wraps=app.json.dumps_bytes) as dumps_bytes:
+            first = self.app.get('/characters')
+            second = self.app.get('/characters')
+        
+        self.assertEqual(dumps_bytes.call_count, 1)
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(json.loads(second.data)['count'], 1)
+        
+        # A new crawl replaces the data, so the old body must not be served
+        character_cache["data"] = [{'id': 2, 'name': 'Morty Smith', 'status': 'Alive', 'species': 'Human',
+                                    'origin': 'Earth (C-137)'}]
+        character_cache["timestamp"] = character_cache["timestamp"] + 1
+        third = self.app.get('/characters')
+        self.assertEqual(json.loads(third.data)['characters'][0]['name'], 'Morty Smith')
+
+
+class TestContentNegotiation(unittest.TestCase):
+    """Test cases for MessagePack/CBOR responses"""
+    
+    def setUp(self):
+        self.app = app.test_client()
+        requests_limit.clear()
+        character_detail_cache.clear()
+        
+        mock_response = MagicMock()
+        mock_response.raise_for_status.return_value = None
+        mock_response.json.return_value = {
+            'id': 1, 'name': 'Rick Sanchez', 'status': 'Alive', 'species': 'Human',
+            'type': '', 'gender': 'Male', 'origin': {'name': 'Earth (C-137)'},
+            'location': {'name': 'Citadel of Ricks'},
+            'image': 'https://rickandmortyapi.com/api/character/avatar/1.jpeg',
+            'episode': ['https://rickandmortyapi.com/api/episode/1'],
+            'url': 'https://rickandmortyapi.com/api/character/1',
+            'created': '2017-11-04T18:48:46.250Z'
+        }
+        patcher = patch('rick_morty_api.requests.get', return_value=mock_response)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def test_msgpack(self):
+        """Test that Accept: application/msgpack returns MessagePack"""
+        expected = json.loads(self.app.get('/characters/1').data)
+        
+        response = self.app.get('/characters/1', headers={'Accept': 'application/msgpack'})
+        
+        self.assertEqual(response.mimetype, 'application/msgpack')
+        self.assertEqual(msgpack.unpackb(response.data), expected)
+        self.assertIn('Accept', response.vary)
+    
+    def test_cbor(self):
+        """Test that Accept: application/cbor returns CBOR"""
+        expected = json.loads(self.app.get('/characters/1').data)
+        
+        response = self.app.get('/characters/1', headers={'Accept': 'application/cbor'})
+        
+        self.assertEqual(response.mimetype, 'application/cbor')
+        self.assertEqual(cbor2.loads(response.data), expected)
+    
+    def test_json_remains_the_default(self):
+        """Test that browsers and wildcard clients keep getting JSON"""
+        for accept in ('*/*', 'text/html,application/xhtml+xml,*/*;q=0.8', 'application/json'):
+            with self.subTest(accept=accept):
+                response = self.app.get('/characters/1', headers={'Accept': accept})
+                self.assertEqual(response.mimetype, 'application/json')
+    
+    def test_encoded_variants_cached_per_entry(self):
+        """Test that each format is encoded once and kept next to the JSON bytes"""
+        with patch('msgpack.packb', wraps=msgpack.packb) as packb:
+            self.app.get('/characters/1', headers={'Accept': 'application/msgpack'})
+            self.app.get('/characters/1', headers={'Accept': 'application/msgpack'})
+            self.app.get('/characters/1')
+        
+        self.assertEqual(packb.call_count, 1)
+        source, bodies = character_detail_cache[1]['encoded']
+        self.assertIs(source, character_detail_cache[1]['data'])
+        self.assertEqual(set(bodies), {'application/msgpack', 'application/json'})
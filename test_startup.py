@@ -0,0 +1,83 @@
+import unittest
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import requests
+from benchmarks.fake_upstream import FakeUpstream
+from benchmarks.worker_boot import boot
+
+# Worker boot (imports and first response) must stay within this many seconds
+STARTUP_BUDGET = float(os.environ.get('STARTUP_BUDGET_SECONDS', '1.0'))
+
+# Optional or rarely used modules that must not be imported at boot
+DEFERRED_MODULES = ('PIL', 'pyarrow', 'sqlite3', 'cProfile', 'pstats', 'msgpack', 'cbor2', 'concurrent.futures',
+                    'argparse')
+
+class TestStartup(unittest.TestCase):
+    """Test cases for the worker startup budget"""
+
+    def test_boot_to_first_response_within_budget(self):
+        """Test that a worker imports the app and answers its first request within the budget"""
+        reports = [boot() for _ in range(3)]
+
+        self.assertEqual(reports[0]['status'], 200)
+        best = min(report['seconds'] for report in reports)
+        self.assertLess(best, STARTUP_BUDGET,
+                        f"Worker boot took {best:.3f}s (budget {STARTUP_BUDGET}s); "
+                        "see python benchmarks/bench_startup.py for the slowest imports")
+
+    def test_optional_modules_deferred(self):
+        """Test that optional and rarely used modules are only imported on first use"""
+        modules = set(boot()['modules'])
+
+        self.assertEqual([module for module in DEFERRED_MODULES if module in modules], [])
+
+
+class TestGunicornPreload(unittest.TestCase):
+    """Test cases for booting gunicorn with the app preloaded in the master"""
+
+    def test_preload_with_missing_multiproc_dir(self):
+        """Test that the master creates the Prometheus directory before importing the app"""
+        upstream = FakeUpstream(pages=1).start()
+        self.addCleanup(upstream.stop)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+
+        env = dict(os.environ, PRELOAD_APP='true', API_BASE_URL=upstream.api_url,
+                   PROMETHEUS_MULTIPROC_DIR=os.path.join(tmp.name, 'missing', 'prometheus'),
+                   DATASET_SNAPSHOT=os.path.join(tmp.name, 'dataset.json'), WEB_CONCURRENCY='1')
+        env.pop('PROMETHEUS_MULTIPROC_RESET', None)
+        log = open(os.path.join(tmp.name, 'gunicorn.log'), 'w+')
+        self.addCleanup(log.close)
+        server = subprocess.Popen([sys.executable, '-m', 'gunicorn', '--config', 'gunicorn.conf.py',
+                                   '--bind', f"127.0.0.1:{port}", 'rick_morty_api:app'],
+                                  cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+                                  stdout=subprocess.DEVNULL, stderr=log)
+        self.addCleanup(server.wait, 30)
+        self.addCleanup(server.terminate)
+
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline and server.poll() is None:
+            try:
+                response = requests.get(f"http://127.0.0.1:{port}/characters", timeout=1)
+                break
+            except requests.exceptions.ConnectionError:
+                time.sleep(0.1)
+        if server.poll() is not None:
+            log.seek(0)
+            self.fail(f"gunicorn exited with status {server.returncode}:\n{log.read()[-2000:]}")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['X-Cache'], 'HIT')
+        metrics = requests.get(f"http://127.0.0.1:{port}/metrics", timeout=5).text
+        self.assertIn('rickmorty_worker_model', metrics)
+
+
+if __name__ == '__main__':
+    unittest.main()
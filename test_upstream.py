@@ -0,0 +1,170 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import threading
+import time
+import requests
+import admission
+import upstream
+from benchmarks.fake_upstream import FakeUpstream
+
+
+def make_response(status_code, headers=None):
+    response = MagicMock(status_code=status_code, headers=headers or {})
+    if status_code >= 400:
+        response.raise_for_status.side_effect = requests.exceptions.HTTPError(response=response)
+    return response
+
+
+class TestRetryAfter(unittest.TestCase):
+    """Test cases for parsing Retry-After"""
+
+    def test_formats(self):
+        """Test delay-seconds, HTTP dates and invalid values"""
+        self.assertEqual(upstream.retry_after({'Retry-After': '7'}), 7.0)
+        self.assertEqual(upstream.retry_after({'Retry-After': 'Tue, 14 Nov 2023 22:13:30 GMT'}, now=1700000000), 10.0)
+        self.assertIsNone(upstream.retry_after({'Retry-After': 'soon'}))
+        self.assertIsNone(upstream.retry_after({}))
+
+
+class TestAdaptiveLimiter(unittest.TestCase):
+    """Test cases for the AIMD concurrency window"""
+
+    def test_additive_increase_multiplicative_decrease(self):
+        """Test that healthy calls grow the window and congestion halves it once"""
+        limiter = upstream.AdaptiveLimiter(initial=4, minimum=1, maximum=8, max_wait=0.01)
+        for _ in range(20):
+            limiter.release(limiter.acquire(), congested=False, latency=0.01)
+        self.assertGreater(limiter.window, 7)
+        self.assertLessEqual(limiter.window, 8)
+
+        # Two calls in flight fail together: the window is halved only once
+        first, second = limiter.acquire(), limiter.acquire()
+        limiter.release(first, congested=True, latency=0.01)
+        window = limiter.window
+        limiter.release(second, congested=True, latency=0.01)
+        self.assertEqual(limiter.window, window)
+        self.assertLessEqual(window, 4)
+
+        for _ in range(5):
+            time.sleep(0.001)
+            limiter.release(limiter.acquire(), congested=True, latency=0.01)
+        self.assertEqual(limiter.window, 1)
+
+    def test_latency_spike(self):
+        """Test that a call much slower than the healthy average counts as congestion"""
+        limiter = upstream.AdaptiveLimiter(initial=8, maximum=8, spike_factor=3)
+        limiter.release(limiter.acquire(), congested=False, latency=0.1)
+        limiter.release(limiter.acquire(), congested=False, latency=0.25)
+        self.assertEqual(limiter.window, 8)
+
+        limiter.release(limiter.acquire(), congested=False, latency=1.0)
+        self.assertEqual(limiter.window, 4)
+
+    def test_window_bounds_concurrency(self):
+        """Test that calls beyond the window wait and are shed after max_wait"""
+        limiter = upstream.AdaptiveLimiter(initial=1, maximum=1, max_wait=0.05)
+        started = limiter.acquire()
+        with self.assertRaises(admission.Overloaded) as ctx:
+            limiter.acquire()
+        self.assertEqual(ctx.exception.reason, 'upstream_concurrency')
+
+        threading.Timer(0.01, limiter.release, (started, False, 0.01)).start()
+        limiter.release(limiter.acquire(), congested=False, latency=0.01)
+        self.assertEqual(limiter.inflight, 0)
+
+    def test_pause(self):
+        """Test that a pause holds calls back and long pauses shed them"""
+        limiter = upstream.AdaptiveLimiter(max_wait=1)
+        limiter.pause(0.05)
+        start = time.time()
+        limiter.release(limiter.acquire(), congested=False, latency=0.01)
+        self.assertGreaterEqual(time.time() - start, 0.04)
+
+        limiter.pause(5)
+        with self.assertRaises(admission.Overloaded) as ctx:
+            limiter.acquire()
+        self.assertEqual(ctx.exception.reason, 'upstream_throttled')
+        self.assertEqual(ctx.exception.retry_after, 5)
+
+    def test_upstream_rate_limit_headers(self):
+        """Test that an exhausted X-RateLimit-Remaining pauses calls until the reset"""
+        limiter = upstream.AdaptiveLimiter(max_wait=0.01)
+        with patch('upstream.prometheus_metrics.update_rate_limit_metrics') as update:
+            limiter.observe_headers({'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': '30'})
+        update.assert_called_once()
+        self.assertEqual(update.call_args[0][0], 0)
+        self.assertGreater(limiter.paused_until, time.time() + 25)
+
+
+class TestGet(unittest.TestCase):
+    """Test cases for upstream calls through the limiter"""
+
+    def setUp(self):
+        patcher = patch('upstream.limiter', upstream.AdaptiveLimiter(initial=4, max_wait=1))
+        self.limiter = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @patch('upstream.requests.get')
+    def test_retries_after_short_retry_after(self, mock_get):
+        """Test that a 429 with a short Retry-After is retried once the pause is over"""
+        mock_get.side_effect = [make_response(429, {'Retry-After': '0'}), make_response(200)]
+
+        response = upstream.get('http://upstream/api/character', 'characters')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(mock_get.call_count, 2)
+        # Halved by the 429, then grown by the successful retry
+        self.assertEqual(self.limiter.window, 2.5)
+
+    @patch('upstream.requests.get')
+    def test_sheds_on_long_retry_after(self, mock_get):
+        """Test that a Retry-After beyond the wait budget is passed on to the client"""
+        mock_get.return_value = make_response(503, {'Retry-After': '30'})
+
+        with self.assertRaises(admission.Overloaded) as ctx:
+            upstream.get('http://upstream/api/character', 'characters')
+
+        self.assertEqual(ctx.exception.retry_after, 30)
+        self.assertEqual(mock_get.call_count, 1)
+        self.assertEqual(self.limiter.inflight, 0)
+
+    @patch('upstream.requests.get')
+    def test_http_errors(self, mock_get):
+        """Test that errors without Retry-After are raised, and only 5xx shrink the window"""
+        mock_get.return_value = make_response(404)
+        with self.assertRaises(requests.exceptions.HTTPError):
+            upstream.get('http://upstream/api/character/0', 'character')
+        self.assertGreater(self.limiter.window, 4)
+
+        mock_get.return_value = make_response(500)
+        with self.assertRaises(requests.exceptions.HTTPError):
+            upstream.get('http://upstream/api/character/1', 'character')
+        self.assertLess(self.limiter.window, 4)
+
+
+class TestCrawl(unittest.TestCase):
+    """Test cases for the parallel page crawl"""
+
+    def test_page_urls(self):
+        """Test that page URLs are derived only from a recognisable next link"""
+        self.assertEqual(upstream.page_urls({'next': 'http://u/api/character?page=2', 'pages': 3}),
+                         ['http://u/api/character?page=2', 'http://u/api/character?page=3'])
+        self.assertIsNone(upstream.page_urls({'next': 'http://u/api/character?cursor=abc', 'pages': 3}))
+        self.assertIsNone(upstream.page_urls({'next': None, 'pages': 1}))
+
+    def test_parallel_crawl_within_throttled_upstream(self):
+        """Test that a parallel crawl backs off a throttling upstream and still gets every page"""
+        limiter = upstream.AdaptiveLimiter(initial=8, maximum=8, max_wait=5)
+        with FakeUpstream(pages=12, latency=0.02, max_concurrency=2) as fake, patch('upstream.limiter', limiter):
+            pages = upstream.crawl(fake.api_url, lambda url: upstream.get(url, 'characters', retries=5).json())
+            stats = fake.stats()
+
+        ids = [character['id'] for page in pages for character in page['results']]
+        self.assertEqual(ids, list(range(1, fake.count + 1)))
+        self.assertGreater(stats['throttled'], 0)
+        self.assertLess(limiter.window, 8)
+        self.assertEqual(stats['calls'] - stats['throttled'], 12)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,154 @@
+import unittest
+import os
+import tempfile
+from unittest.mock import patch
+
+import worker_tuning
+
+MIB = 1024 * 1024
+
+
+class TestCgroupLimits(unittest.TestCase):
+    """Test cases for reading container limits from the cgroup filesystem"""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def write(self, path, content):
+        path = os.path.join(self.root, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(content)
+
+    def test_cgroup_v2(self):
+        """Test the cpu.max quota and memory.max limit of cgroup v2"""
+        self.write('cpu.max', '50000 100000\n')
+        self.write('memory.max', f"{512 * MIB}\n")
+
+        self.assertEqual(worker_tuning.cgroup_cpu_limit(self.root), 0.5)
+        self.assertEqual(worker_tuning.cgroup_memory_limit(self.root), 512 * MIB)
+
+    def test_cgroup_v2_unlimited(self):
+        """Test that "max" means no limit"""
+        self.write('cpu.max', 'max 100000\n')
+        self.write('memory.max', 'max\n')
+
+        self.assertIsNone(worker_tuning.cgroup_cpu_limit(self.root))
+        self.assertIsNone(worker_tuning.cgroup_memory_limit(self.root))
+
+    def test_cgroup_v1(self):
+        """Test the CFS quota and memory limit of cgroup v1"""
+        self.write('cpu,cpuacct/cpu.cfs_quota_us', '200000\n')
+        self.write('cpu,cpuacct/cpu.cfs_period_us', '100000\n')
+        self.write('memory/memory.limit_in_bytes', f"{256 * MIB}\n")
+
+        self.assertEqual(worker_tuning.cgroup_cpu_limit(self.root), 2.0)
+        self.assertEqual(worker_tuning.cgroup_memory_limit(self.root), 256 * MIB)
+
+    def test_cgroup_v1_unlimited(self):
+        """Test that a -1 quota and the huge default memory limit mean no limit"""
+        self.write('cpu/cpu.cfs_quota_us', '-1\n')
+        self.write('cpu/cpu.cfs_period_us', '100000\n')
+        self.write('memory/memory.limit_in_bytes', '9223372036854771712\n')
+
+        self.assertIsNone(worker_tuning.cgroup_cpu_limit(self.root))
+        self.assertIsNone(worker_tuning.cgroup_memory_limit(self.root))
+
+    def test_no_cgroup(self):
+        """Test that outside a container the CPUs present are used"""
+        with patch.dict(os.environ, {}, clear=True), \
+             patch.object(worker_tuning, 'available_cpus', return_value=8):
+            self.assertEqual(worker_tuning.container_resources(self.root), (8, None))
+
+    def test_quota_above_cpus_present(self):
+        """Test that a quota above the CPUs present is capped to them"""
+        self.write('cpu.max', '800000 100000\n')
+
+        with patch.dict(os.environ, {}, clear=True), \
+             patch.object(worker_tuning, 'available_cpus', return_value=2):
+            self.assertEqual(worker_tuning.container_resources(self.root), (2, None))
+
+
+class TestChoose(unittest.TestCase):
+    """Test cases for deriving the worker model"""
+
+    def test_mixed(self):
+        """Test gthread workers, one per CPU and at least two, in mixed mode"""
+        self.assertEqual(worker_tuning.choose(0.5, None)[:3], ('gthread', 2, 4))
+        self.assertEqual(worker_tuning.choose(3.5, None)[:3], ('gthread', 4, 4))
+
+    def test_cpu(self):
+        """Test sync workers, one per CPU plus one, in cpu mode"""
+        self.assertEqual(worker_tuning.choose(4, None, 'cpu')[:3], ('sync', 5, 1))
+
+    def test_streaming(self):
+        """Test gevent workers in streaming mode only when gevent can be used"""
+        self.assertEqual(worker_tuning.choose(2, None, 'streaming', gevent_available=True)[:3], ('gevent', 2, 1))
+        self.assertEqual(worker_tuning.choose(2, None, 'streaming', preload=True, gevent_available=True)[:3],
+                         ('gthread', 2, 32))
+        self.assertEqual(worker_tuning.choose(2, None, 'streaming')[:3], ('gthread', 2, 32))
+
+    def test_memory_cap(self):
+        """Test that the worker count fits in the memory limit, with more room when preloading"""
+        self.assertEqual(worker_tuning.choose(8, 256 * MIB, 'cpu', worker_memory_mb=64).workers, 3)
+        self.assertEqual(worker_tuning.choose(8, 256 * MIB, 'cpu', preload=True, worker_memory_mb=64).workers, 6)
+        self.assertEqual(worker_tuning.choose(8, 32 * MIB, 'cpu', worker_memory_mb=64).workers, 1)
+
+    def test_max_workers(self):
+        """Test that the worker count is bounded"""
+        self.assertEqual(worker_tuning.choose(64, None, 'cpu', max_workers=16).workers, 16)
+
+    def test_unknown_serving_mode(self):
+        """Test that an unknown serving mode is rejected"""
+        with self.assertRaises(ValueError):
+            worker_tuning.choose(2, None, 'batch')
+
+
+class TestRequestThreads(unittest.TestCase):
+    """Test cases for the concurrency of a gunicorn worker"""
+
+    def test_request_threads(self):
+        """Test threads for gthread and threaded sync workers, one for sync, none for async workers"""
+        self.assertEqual(worker_tuning.request_threads('gthread', 4), 4)
+        self.assertEqual(worker_tuning.request_threads('sync', 8), 8)
+        self.assertEqual(worker_tuning.request_threads('sync', 1), 1)
+        self.assertIsNone(worker_tuning.request_threads('gevent', 1))
+        self.assertIsNone(worker_tuning.request_threads(None))
+
+
+class TestWorkerModel(unittest.TestCase):
+    """Test cases for the worker model with environment overrides"""
+
+    def test_emulated_limits(self):
+        """Test that CONTAINER_CPU_LIMIT and CONTAINER_MEMORY_LIMIT_MB replace the cgroup limits"""
+        env = {'CONTAINER_CPU_LIMIT': '0.5', 'CONTAINER_MEMORY_LIMIT_MB': '512'}
+        with patch.dict(os.environ, env, clear=True):
+            model = worker_tuning.worker_model()
+
+        self.assertEqual(model.cpus, 0.5)
+        self.assertEqual(model.memory_limit, 512 * MIB)
+        self.assertEqual(model.workers, 2)
+        self.assertIn('2 gthread workers x 4 threads', model.describe())
+
+    def test_overrides(self):
+        """Test that explicit gunicorn settings win over the derived ones"""
+        env = {'CONTAINER_CPU_LIMIT': '2', 'WEB_CONCURRENCY': '4', 'GUNICORN_WORKER_CLASS': 'sync'}
+        with patch.dict(os.environ, env, clear=True):
+            model = worker_tuning.worker_model()
+
+        self.assertEqual(model[:3], ('sync', 4, 1))
+
+    def test_threads_override(self):
+        """Test that GUNICORN_THREADS replaces the serving mode's thread count"""
+        with patch.dict(os.environ, {'CONTAINER_CPU_LIMIT': '1', 'GUNICORN_THREADS': '8'}, clear=True):
+            self.assertEqual(worker_tuning.worker_model().threads, 8)
+
+    def test_unknown_worker_class(self):
+        """Test that an unsupported worker class is rejected"""
+        with patch.dict(os.environ, {'GUNICORN_WORKER_CLASS': 'tornado'}, clear=True):
+            with self.assertRaises(ValueError):
+                worker_tuning.worker_model()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+Per-stage latency breakdown for the Rick and Morty API.
+
+Hot-path code wraps each stage of a request (rate limiting, cache lookup,
+upstream paging, filtering, serialization) in ``stage(name)``. The timings
+are reported back to the client in a ``Server-Timing`` response header and,
+for a sampled fraction of requests, exported as OpenTelemetry spans in the
+OTLP/JSON file format so that a local collector (``otlpjsonfile`` receiver)
+or any OTLP tooling can pick them up.
+
+Configuration (environment variables):
+    SERVER_TIMING_ENABLED: Emit the Server-Timing header (default: true)
+    TRACE_SAMPLE_RATE: Fraction of requests exported as spans (default: 0)
+    TRACE_EXPORT_PATH: JSON-lines file the spans are appended to
+    TRACE_EXPORT_QUEUE_SIZE: Pending span batches kept before dropping (default: 1000)
+"""
+
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, List, Optional
+
+from flask import g, has_request_context, request
+
+logger = logging.getLogger(__name__)
+
+SERVER_TIMING_ENABLED = os.environ.get('SERVER_TIMING_ENABLED', 'true').lower() == 'true'
+TRACE_SAMPLE_RATE = float(os.environ.get('TRACE_SAMPLE_RATE', '0'))
+TRACE_EXPORT_PATH = os.environ.get('TRACE_EXPORT_PATH', '/tmp/rick-morty-api-traces.jsonl')
+TRACE_EXPORT_QUEUE_SIZE = int(os.environ.get('TRACE_EXPORT_QUEUE_SIZE', '1000'))
+
+SERVICE_NAME = 'rick-morty-api'
+
+# OTLP span kinds
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+
+
+class RequestTimings:
+    """Stage timings collected for a single request."""
+
+    __slots__ = ('stages', 'stack', 'sampled', 'start_ns', 'wall_start_ns')
+
+    def __init__(self, sampled: bool):
+        # Each stage is [name, start_ns, end_ns, parent_index]
+        self.stages: List[list] = []
+        self.stack: List[int] = []
+        self.sampled = sampled
+        self.start_ns = time.perf_counter_ns()
+        self.wall_start_ns = time.time_ns()
+
+    def server_timing(self, total_ns: int) -> str:
+        """Render the stages as a Server-Timing header value (durations in ms)"""
+        durations = {}
+        for name, start_ns, end_ns, _ in self.stages:
+            durations[name] = durations.get(name, 0) + (end_ns - start_ns)
+        durations['total'] = total_ns
+        return ', '.join(f"{name};dur={ns / 1e6:.2f}" for name, ns in durations.items())
+
+
+class SpanExporter:
+    """
+    Append finished spans to a local OTLP/JSON-lines file.
+
+    Requests only enqueue their spans; a daemon thread does the file I/O. The
+    queue is bounded, so when the writer falls behind new spans are dropped
+    rather than slowing requests down.
+    """
+
+    def __init__(self, path: str, max_queue_size: int = 1000):
+        self.path = path
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def export(self, spans: List[dict]) -> None:
+        """Queue a batch of spans for writing"""
+        if self._thread is None:
+            self._start()
+        try:
+            self._queue.put_nowait(spans)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self, timeout: float = 5.0) -> None:
+        """Wait until every queued batch has been written"""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='span-exporter', daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            spans = self._queue.get()
+            try:
+                line = json.dumps(_otlp_document(spans), separators=(',', ':'))
+                with open(self.path, 'a') as f:
+                    f.write(line + '\n')
+            except OSError as e:
+                logger.warning("Failed to export spans to %s: %s", self.path, e)
+            finally:
+                self._queue.task_done()
+
+
+exporter = SpanExporter(TRACE_EXPORT_PATH, TRACE_EXPORT_QUEUE_SIZE)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """
+    Time a stage of the current request.
+
+    Outside of a request (or when timing is disabled for it) this is a no-op,
+    so library code can be instrumented unconditionally.
+
+    Args:
+        name (str): Stage name, reported as the Server-Timing metric / span name
+    """
+    timings = g.get('request_timings') if has_request_context() else None
+    if timings is None:
+        yield
+        return
+
+    index = len(timings.stages)
+    parent = timings.stack[-1] if timings.stack else None
+    timings.stages.append([name, time.perf_counter_ns(), 0, parent])
+    timings.stack.append(index)
+    try:
+        yield
+    finally:
+        timings.stack.pop()
+        timings.stages[index][2] = time.perf_counter_ns()
+
+
+def _random_id(nbytes: int) -> str:
+    return random.getrandbits(nbytes * 8).to_bytes(nbytes, 'big').hex()
+
+
+def _attribute(key: str, value) -> dict:
+    if isinstance(value, int):
+        return {'key': key, 'value': {'intValue': str(value)}}
+    return {'key': key, 'value': {'stringValue': str(value)}}
+
+
+def _otlp_document(spans: List[dict]) -> dict:
+    return {
+        'resourceSpans': [{
+            'resource': {'attributes': [_attribute('service.name', SERVICE_NAME)]},
+            'scopeSpans': [{'scope': {'name': __name__}, 'spans': spans}],
+        }]
+    }
+
+
+def build_spans(timings: RequestTimings, end_ns: int, attributes: dict) -> List[dict]:
+    """
+    Convert request timings into OTLP spans: one server span for the request
+    and one internal child span per stage.
+
+    Args:
+        timings (RequestTimings): Timings collected during the request
+        end_ns (int): perf_counter_ns() at the end of the request
+        attributes (dict): Attributes for the server span
+
+    Returns:
+        List[dict]: Spans in OTLP/JSON form
+    """
+    offset = timings.wall_start_ns - timings.start_ns
+    trace_id = _random_id(16)
+    root_id = _random_id(8)
+    span_ids = [_random_id(8) for _ in timings.stages]
+
+    spans = [{
+        'traceId': trace_id,
+        'spanId': root_id,
+        'name': attributes.get('http.route', 'request'),
+        'kind': SPAN_KIND_SERVER,
+        'startTimeUnixNano': str(timings.wall_start_ns),
+        'endTimeUnixNano': str(end_ns + offset),
+        'attributes': [_attribute(k, v) for k, v in attributes.items()],
+    }]
+    for span_id, (name, start_ns, stage_end_ns, parent) in zip(span_ids, timings.stages):
+        spans.append({
+            'traceId': trace_id,
+            'spanId': span_id,
+            'parentSpanId': root_id if parent is None else span_ids[parent],
+            'name': name,
+            'kind': SPAN_KIND_INTERNAL,
+            'startTimeUnixNano': str(start_ns + offset),
+            'endTimeUnixNano': str(stage_end_ns + offset),
+        })
+    return spans
+
+
+def init_tracing(app) -> None:
+    """
+    Register the request hooks that collect stage timings.
+
+    Args:
+        app: The Flask application instance
+    """
+    @app.before_request
+    def start_request_timings():
+        sampled = TRACE_SAMPLE_RATE > 0 and random.random() < TRACE_SAMPLE_RATE
+        if SERVER_TIMING_ENABLED or sampled:
+            g.request_timings = RequestTimings(sampled)
+
+    @app.after_request
+    def finish_request_timings(response):
+        timings = g.pop('request_timings', None)
+        if timings is None:
+            return response
+
+        end_ns = time.perf_counter_ns()
+        if SERVER_TIMING_ENABLED:
+            response.headers['Server-Timing'] = timings.server_timing(end_ns - timings.start_ns)
+        if timings.sampled:
+            exporter.export(build_spans(timings, end_ns, {
+                'http.method': request.method,
+                'http.route': request.url_rule.rule if request.url_rule else request.path,
+                'http.status_code': response.status_code,
+            }))
+        return response
@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+"""
+Client for the upstream Rick and Morty API with adaptive concurrency.
+
+Every upstream call goes through ``get``, which holds a slot of the
+per-worker ``AdaptiveLimiter``. The limiter's window of concurrent calls
+follows AIMD: it grows by about one call per window of healthy responses
+and is halved on a 429, a 5xx, a connection error or a latency spike (a
+call slower than UPSTREAM_LATENCY_SPIKE_FACTOR times the recent healthy
+latency). A ``Retry-After`` (or an exhausted ``X-RateLimit-Remaining``)
+pauses all calls until the given time; calls that would have to wait longer
+than UPSTREAM_MAX_WAIT are shed with ``admission.Overloaded`` instead.
+
+The window is reported through the rate limit metrics: the upstream's own
+``X-RateLimit-Remaining`` / ``X-RateLimit-Reset`` when it sends them,
+otherwise the free slots in the window and the end of any pause. Time spent
+waiting for a slot is recorded as rate limit delay.
+
+Configuration (environment variables):
+    UPSTREAM_CONCURRENCY_INITIAL: Starting window (default: 4)
+    UPSTREAM_CONCURRENCY_MIN: Smallest window (default: 1)
+    UPSTREAM_CONCURRENCY_MAX: Largest window (default: 16)
+    UPSTREAM_LATENCY_SPIKE_FACTOR: Latency, relative to the healthy average,
+        that counts as congestion (default: 3)
+    UPSTREAM_MAX_WAIT: Seconds a call may wait for a slot or a pause (default: 5)
+"""
+
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, Optional
+from urllib.parse import parse_qs, urlencode, urlsplit, urlunsplit
+
+import requests
+from werkzeug.http import parse_date
+
+import admission
+import cassette
+import prometheus_metrics
+
+UPSTREAM_CONCURRENCY_INITIAL = int(os.environ.get('UPSTREAM_CONCURRENCY_INITIAL', '4'))
+UPSTREAM_CONCURRENCY_MIN = int(os.environ.get('UPSTREAM_CONCURRENCY_MIN', '1'))
+UPSTREAM_CONCURRENCY_MAX = int(os.environ.get('UPSTREAM_CONCURRENCY_MAX', '16'))
+UPSTREAM_LATENCY_SPIKE_FACTOR = float(os.environ.get('UPSTREAM_LATENCY_SPIKE_FACTOR', '3'))
+UPSTREAM_MAX_WAIT = float(os.environ.get('UPSTREAM_MAX_WAIT', '5'))
+
+# Calls faster than this never count as a latency spike
+LATENCY_SPIKE_FLOOR = 0.1
+# Weight of the latest healthy call in the average latency
+LATENCY_SMOOTHING = 0.2
+
+
+def _header_number(headers, name: str) -> Optional[float]:
+    value = headers.get(name)
+    if not isinstance(value, str):
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def retry_after(headers, now: Optional[float] = None) -> Optional[float]:
+    """
+    Seconds to wait according to a ``Retry-After`` header.
+
+    Args:
+        headers: Response headers
+        now (float): Current Unix time (defaults to time.time())
+
+    Returns:
+        float: Delay in seconds, or None without a valid header
+    """
+    value = headers.get('Retry-After')
+    if not isinstance(value, str):
+        return None
+    if value.strip().isdigit():
+        return float(value)
+    date = parse_date(value)
+    if date is None:
+        return None
+    return max(0.0, date.timestamp() - (now or time.time()))
+
+
+class AdaptiveLimiter:
+    """
+    AIMD limit on concurrent upstream calls.
+
+    Args:
+        initial (int): Starting window
+        minimum (int): Smallest window
+        maximum (int): Largest window
+        spike_factor (float): Latency relative to the healthy average that counts as congestion
+        max_wait (float): Seconds a call may wait for a slot before being shed
+    """
+
+    def __init__(self, initial: int = UPSTREAM_CONCURRENCY_INITIAL, minimum: int = UPSTREAM_CONCURRENCY_MIN,
+                 maximum: int = UPSTREAM_CONCURRENCY_MAX, spike_factor: float = UPSTREAM_LATENCY_SPIKE_FACTOR,
+                 max_wait: float = UPSTREAM_MAX_WAIT):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.window = float(min(max(initial, self.minimum), self.maximum))
+        self.spike_factor = spike_factor
+        self.max_wait = max_wait
+        self.inflight = 0
+        self.paused_until = 0.0
+        self.latency: Optional[float] = None
+        self._last_decrease = 0.0
+        self._upstream_reports = False
+        self._cond = threading.Condition()
+
+    def acquire(self) -> float:
+        """
+        Wait for a free slot.
+
+        Returns:
+            float: When the call started (for ``release``)
+
+        Raises:
+            admission.Overloaded: If no slot frees up within max_wait
+        """
+        start = time.time()
+        deadline = start + self.max_wait
+        with self._cond:
+            while True:
+                now = time.time()
+                paused = self.paused_until > now
+                if not paused and self.inflight < int(self.window):
+                    break
+                if self.paused_until > deadline or now >= deadline:
+                    reason = 'upstream_throttled' if paused else 'upstream_concurrency'
+                    prometheus_metrics.LOAD_SHED_COUNT.labels(reason=reason).inc()
+                    raise admission.Overloaded(reason, max(1, math.ceil(self.paused_until - now)))
+                self._cond.wait((self.paused_until if paused else deadline) - now)
+            self.inflight += 1
+            self._report()
+        if now > start:
+            prometheus_metrics.record_rate_limit_delay(now - start)
+        return now
+
+    def release(self, started: float, congested: bool, latency: float) -> None:
+        """
+        Free a slot and adjust the window from the call's outcome.
+
+        Args:
+            started (float): Value returned by ``acquire``
+            congested (bool): Whether the upstream rejected or failed the call
+            latency (float): Duration of the call in seconds
+        """
+        with self._cond:
+            self.inflight -= 1
+            spike = (self.latency is not None and latency > LATENCY_SPIKE_FLOOR
+                     and latency > self.spike_factor * self.latency)
+            if congested or spike:
+                # Calls started before the last decrease reflect the old window
+                if started >= self._last_decrease:
+                    self.window = max(self.minimum, self.window / 2)
+                    self._last_decrease = time.time()
+            else:
+                self.window = min(self.maximum, self.window + 1 / self.window)
+                self.latency = latency if self.latency is None else (
+                    (1 - LATENCY_SMOOTHING) * self.latency + LATENCY_SMOOTHING * latency)
+            self._report()
+            self._cond.notify_all()
+
+    def pause(self, seconds: float) -> None:
+        """Hold back every call for ``seconds``"""
+        with self._cond:
+            self.paused_until = max(self.paused_until, time.time() + seconds)
+            self._report()
+
+    def observe_headers(self, headers) -> None:
+        """Follow the upstream's X-RateLimit-* headers, when it sends them"""
+        remaining = _header_number(headers, 'X-RateLimit-Remaining')
+        reset = _header_number(headers, 'X-RateLimit-Reset')
+        if remaining is None or reset is None:
+            return
+        # Reset is either a Unix time or seconds from now
+        now = time.time()
+        reset_time = reset if reset > 1e9 else now + reset
+        self._upstream_reports = True
+        prometheus_metrics.update_rate_limit_metrics(int(remaining), reset_time)
+        if remaining <= 0:
+            self.pause(reset_time - now)
+
+    def _report(self) -> None:
+        if self._upstream_reports:
+            return
+        prometheus_metrics.update_rate_limit_metrics(max(0, int(self.window) - self.inflight),
+                                                     max(self.paused_until, time.time()))
+
+    @contextmanager
+    def slot(self) -> Iterator[dict]:
+        """
+        Hold a slot for the duration of one upstream call. The block sets
+        ``outcome["congested"]`` when the call was rejected or failed.
+        """
+        started = self.acquire()
+        outcome = {'congested': True}
+        try:
+            yield outcome
+        finally:
+            self.release(started, outcome['congested'], time.time() - started)
+
+
+def is_congestion(status_code) -> bool:
+    """Whether a response status means the upstream is throttling or overloaded"""
+    return status_code == 429 or status_code in range(500, 600)
+
+
+def get(url: str, endpoint: str, retries: int = 1, session: Optional[requests.Session] = None):
+    """
+    GET an upstream URL within the adaptive limit.
+
+    In replay mode the response comes from the cassette instead, and in
+    record mode it is also stored there (see ``cassette``).
+
+    A 429 or 503 with a ``Retry-After`` pauses the limiter; the call is
+    retried once the pause is over if it fits within UPSTREAM_MAX_WAIT,
+    otherwise it is shed with ``admission.Overloaded``.
+
+    Args:
+        url (str): The URL to fetch
+        endpoint (str): Label for the upstream latency metrics
+        retries (int): Retries after a Retry-After
+        session (requests.Session): Session to call through (default: a new connection per call)
+
+    Returns:
+        requests.Response: The response, after ``raise_for_status()``
+
+    Raises:
+        requests.exceptions.RequestException: On connection and HTTP errors
+        admission.Overloaded: When the upstream asks to back off for too long
+    """
+    if cassette.UPSTREAM_MODE == 'replay':
+        with prometheus_metrics.track_upstream_latency(endpoint):
+            response = cassette.store().replay(url)
+        response.raise_for_status()
+        return response
+
+    while True:
+        with limiter.slot() as outcome, prometheus_metrics.track_upstream_latency(endpoint):
+            started = time.time()
+            response = (session or requests).get(url)
+            outcome['congested'] = is_congestion(response.status_code)
+            limiter.observe_headers(response.headers)
+            delay = retry_after(response.headers) if outcome['congested'] else None
+            if delay is None:
+                if cassette.UPSTREAM_MODE == 'record' and not outcome['congested']:
+                    cassette.store().record(url, response.status_code, response.headers, response.content,
+                                            time.time() - started)
+                    # Details are only replayed if they were recorded too
+                    if endpoint == 'characters' and response.ok:
+                        cassette.record_details(cassette.store(), response.json(), url.split('?')[0])
+                response.raise_for_status()
+                return response
+            limiter.pause(delay)
+            if retries <= 0 or delay > limiter.max_wait:
+                prometheus_metrics.LOAD_SHED_COUNT.labels(reason='upstream_throttled').inc()
+                raise admission.Overloaded('upstream_throttled', max(1, math.ceil(delay)))
+        retries -= 1
+
+
+def page_urls(info: dict) -> Optional[List[str]]:
+    """
+    URLs of the remaining list pages, derived from the first page's ``info``.
+
+    Returns:
+        list: URLs of pages 2..N, or None when they cannot be derived (the
+        crawl then follows ``next`` links one by one)
+    """
+    next_url, pages = info.get('next'), info.get('pages')
+    if not next_url or not isinstance(pages, int):
+        return None
+    parts = urlsplit(next_url)
+    query = parse_qs(parts.query)
+    if query.get('page') != ['2']:
+        return None
+    urls = []
+    for page in range(2, pages + 1):
+        query['page'] = [str(page)]
+        urls.append(urlunsplit(parts._replace(query=urlencode(query, doseq=True))))
+    return urls
+
+
+def crawl(url: str, fetch_page: Callable[[str], dict]) -> List[dict]:
+    """
+    Fetch every page of a paginated list.
+
+    After the first page, the remaining pages are fetched in parallel, as
+    many at a time as the limiter allows.
+
+    Args:
+        url (str): URL of the first page
+        fetch_page (Callable): Fetches and decodes one page
+
+    Returns:
+        list: The decoded pages, in order
+    """
+    first = fetch_page(url)
+    pages = [first]
+    urls = page_urls(first.get('info', {}))
+    if urls is None:
+        next_url = first.get('info', {}).get('next')
+        while next_url:
+            pages.append(fetch_page(next_url))
+            next_url = pages[-1].get('info', {}).get('next')
+        return pages
+
+    if urls:
+        # Imported by the first crawl rather than at worker boot
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=min(limiter.maximum, len(urls)),
+                                thread_name_prefix='upstream-crawl') as pool:
+            pages.extend(pool.map(fetch_page, urls))
+    return pages
+
+
+limiter = AdaptiveLimiter()
+
+# Keeps connections to the image host open between the many avatar downloads
+session = requests.Session()
+session.mount('https://', requests.adapters.HTTPAdapter(pool_maxsize=UPSTREAM_CONCURRENCY_MAX))
+session.mount('http://', requests.adapters.HTTPAdapter(pool_maxsize=UPSTREAM_CONCURRENCY_MAX))
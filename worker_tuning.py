@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Gunicorn worker model derived from the container's resources.
+
+``gunicorn.conf.py`` asks ``worker_model`` for the worker class, worker
+count and threads instead of running a fixed number of sync workers. The
+CPU and memory limits are read from the cgroup (v2, or v1) the process runs
+in, falling back to the CPUs it may run on and no memory limit outside a
+container. The serving mode says where request time goes:
+
+- ``mixed`` (default): cache hits and upstream calls on misses. gthread
+  workers, one per CPU (at least 2), with threads to overlap the upstream
+  waits.
+- ``cpu``: data preloaded or replayed, so requests never wait on the
+  upstream. Sync workers, one per CPU plus one.
+- ``streaming``: many long-lived /characters/changes clients. gevent
+  workers when gevent is installed and the app is not preloaded (gevent
+  has to patch the standard library before the app is imported), gthread
+  workers with many threads otherwise.
+
+The worker count is then capped by the memory limit, at WORKER_MEMORY_MB
+per worker (half of it with preloading, as the workers share the dataset)
+within MEMORY_HEADROOM of the limit. Explicit settings always win.
+
+Configuration (environment variables):
+    SERVING_MODE: mixed, cpu or streaming (default: mixed)
+    WEB_CONCURRENCY: Worker count, overriding the derived one
+    GUNICORN_WORKER_CLASS: sync, gthread or gevent, overriding the derived one
+    GUNICORN_THREADS: Threads per gthread worker, overriding the derived count
+    WORKER_MEMORY_MB: Memory budgeted per worker (default: 64)
+    WORKER_MAX: Largest derived worker count (default: 16)
+    CONTAINER_CPU_LIMIT: CPUs to assume instead of the cgroup limit (e.g. 0.5)
+    CONTAINER_MEMORY_LIMIT_MB: Memory limit to assume instead of the cgroup limit
+"""
+
+import importlib.util
+import math
+import os
+from typing import NamedTuple, Optional
+
+SERVING_MODE = os.environ.get('SERVING_MODE', 'mixed').lower()
+WORKER_MEMORY_MB = int(os.environ.get('WORKER_MEMORY_MB', '64'))
+WORKER_MAX = int(os.environ.get('WORKER_MAX', '16'))
+
+SERVING_MODES = ('mixed', 'cpu', 'streaming')
+WORKER_CLASSES = ('sync', 'gthread', 'gevent')
+
+# Threads per gthread worker by serving mode
+THREADS = {'mixed': 4, 'cpu': 1, 'streaming': 32}
+
+# Share of the memory limit the workers may use; the rest is for the
+# master, the page cache and the image cache
+MEMORY_HEADROOM = 0.75
+
+CGROUP_ROOT = '/sys/fs/cgroup'
+
+# cgroup v1 reports "no limit" as a number close to 2**63
+UNLIMITED_MEMORY = 2 ** 60
+
+
+class WorkerModel(NamedTuple):
+    worker_class: str
+    workers: int
+    threads: int
+    cpus: float
+    memory_limit: Optional[int]
+    serving_mode: str
+
+    def describe(self) -> str:
+        memory = f"{self.memory_limit // (1024 * 1024)} MiB" if self.memory_limit else 'unlimited'
+        return (f"{self.workers} {self.worker_class} workers x {self.threads} threads "
+                f"(serving mode {self.serving_mode}, {self.cpus:g} CPUs, memory {memory})")
+
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def cgroup_cpu_limit(root: str = CGROUP_ROOT) -> Optional[float]:
+    """CPUs allowed by the cgroup CPU quota, or None without a quota"""
+    # cgroup v2: "<quota> <period>" or "max <period>"
+    cpu_max = _read(os.path.join(root, 'cpu.max'))
+    if cpu_max:
+        quota, _, period = cpu_max.partition(' ')
+        if quota == 'max' or not period:
+            return None
+        return int(quota) / int(period)
+
+    # cgroup v1: a quota of -1 means no limit
+    for directory in ('cpu', 'cpu,cpuacct'):
+        quota = _read(os.path.join(root, directory, 'cpu.cfs_quota_us'))
+        period = _read(os.path.join(root, directory, 'cpu.cfs_period_us'))
+        if quota and period:
+            return int(quota) / int(period) if int(quota) > 0 else None
+    return None
+
+
+def cgroup_memory_limit(root: str = CGROUP_ROOT) -> Optional[int]:
+    """Bytes allowed by the cgroup memory limit, or None without a limit"""
+    memory_max = _read(os.path.join(root, 'memory.max'))
+    if memory_max is None:
+        memory_max = _read(os.path.join(root, 'memory', 'memory.limit_in_bytes'))
+    if not memory_max or memory_max == 'max' or int(memory_max) >= UNLIMITED_MEMORY:
+        return None
+    return int(memory_max)
+
+
+def available_cpus() -> int:
+    """CPUs this process may run on"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def container_resources(root: str = CGROUP_ROOT):
+    """
+    CPU and memory limits of the container.
+
+    Returns:
+        tuple: (CPUs, memory limit in bytes or None)
+    """
+    cpus = os.environ.get('CONTAINER_CPU_LIMIT')
+    cpus = float(cpus) if cpus else cgroup_cpu_limit(root)
+    # A quota above the CPUs present cannot be used
+    cpus = min(cpus, available_cpus()) if cpus else available_cpus()
+
+    memory = os.environ.get('CONTAINER_MEMORY_LIMIT_MB')
+    memory = int(memory) * 1024 * 1024 if memory else cgroup_memory_limit(root)
+    return cpus, memory
+
+
+def choose(cpus: float, memory_limit: Optional[int], serving_mode: str = 'mixed', preload: bool = False,
+           gevent_available: bool = False, worker_memory_mb: int = WORKER_MEMORY_MB,
+           max_workers: int = WORKER_MAX) -> WorkerModel:
+    """
+    Derive the worker model from resources and the serving mode.
+
+    Args:
+        cpus (float): CPUs available (fractional for a CPU quota)
+        memory_limit (int): Memory limit in bytes, or None
+        serving_mode (str): mixed, cpu or streaming
+        preload (bool): Whether the app is preloaded in the master
+        gevent_available (bool): Whether the gevent worker can be used
+        worker_memory_mb (int): Memory budgeted per worker without preloading
+        max_workers (int): Largest worker count
+
+    Returns:
+        WorkerModel: The chosen settings
+    """
+    if serving_mode not in SERVING_MODES:
+        raise ValueError(f"SERVING_MODE must be one of {', '.join(SERVING_MODES)}, got {serving_mode!r}")
+    cores = max(1, math.ceil(cpus))
+
+    if serving_mode == 'cpu':
+        worker_class, workers = 'sync', cores + 1
+    elif serving_mode == 'streaming' and gevent_available and not preload:
+        worker_class, workers = 'gevent', max(2, cores)
+    else:
+        worker_class, workers = 'gthread', max(2, cores)
+    threads = THREADS[serving_mode] if worker_class == 'gthread' else 1
+
+    if memory_limit:
+        per_worker = worker_memory_mb * 1024 * 1024 / (2 if preload else 1)
+        workers = min(workers, int(memory_limit * MEMORY_HEADROOM // per_worker))
+    workers = max(1, min(workers, max_workers))
+    return WorkerModel(worker_class, workers, threads, cpus, memory_limit, serving_mode)
+
+
+def request_threads(worker_class: Optional[str], threads: int = 1) -> Optional[int]:
+    """
+    Requests a gunicorn worker serves at once, which per-worker limits are sized from.
+
+    Args:
+        worker_class (str): The gunicorn worker class, or None outside gunicorn
+        threads (int): Threads per worker
+
+    Returns:
+        int: The worker's threads, or None when no thread count bounds it
+        (async workers, or outside gunicorn)
+    """
+    # gunicorn runs sync workers with more than one thread as gthread
+    if worker_class == 'gthread' or (worker_class == 'sync' and threads > 1):
+        return threads
+    if worker_class == 'sync':
+        return 1
+    return None
+
+
+def worker_model(preload: bool = False, root: str = CGROUP_ROOT) -> WorkerModel:
+    """
+    The worker model for this container, with WEB_CONCURRENCY,
+    GUNICORN_WORKER_CLASS and GUNICORN_THREADS applied on top.
+    """
+    cpus, memory_limit = container_resources(root)
+    model = choose(cpus, memory_limit, SERVING_MODE, preload,
+                   gevent_available=importlib.util.find_spec('gevent') is not None)
+
+    worker_class = os.environ.get('GUNICORN_WORKER_CLASS', model.worker_class).lower()
+    if worker_class not in WORKER_CLASSES:
+        raise ValueError(f"GUNICORN_WORKER_CLASS must be one of {', '.join(WORKER_CLASSES)}, got {worker_class!r}")
+    threads = THREADS[model.serving_mode] if worker_class == 'gthread' else 1
+    return model._replace(
+        worker_class=worker_class,
+        workers=int(os.environ.get('WEB_CONCURRENCY', model.workers)),
+        threads=int(os.environ.get('GUNICORN_THREADS', threads)),
+    )